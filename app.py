@@ -6,26 +6,34 @@ if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
-from flask import Flask, render_template, request, jsonify, session, send_from_directory
+from flask import Flask, Response, has_request_context, render_template, request, jsonify, session, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from werkzeug.utils import secure_filename
+from werkzeug.utils import safe_join, secure_filename
 import sqlite3
-from datetime import datetime, timedelta
+import csv
+import gzip
+from datetime import date, datetime, timedelta, timezone
 import os
 import json
 import uuid
-
-try:
-    from pybit.unified_trading import HTTP as BybitHTTP
-    # Enforce unified trading usage
-    if 'unified_trading' not in BybitHTTP.__module__:
-        raise RuntimeError('Unified Trading client not available - please upgrade pybit')
-except Exception:
-    try:
-        from pybit import HTTP as BybitHTTP
-        raise RuntimeError('Old pybit version detected - please upgrade: pip install --upgrade pybit')
-    except Exception:
-        BybitHTTP = None
+import atexit
+import hashlib
+import html
+import mimetypes
+import multiprocessing
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import click
+import numpy as np
 
 app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'your-secret-key-here-change-in-production')
@@ -36,6 +44,7 @@ UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'screenshots')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['DATABASE_PATH'] = os.getenv('DATABASE_PATH', 'trading_journal.db')
 
 # Create screenshots folder if it doesn't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -43,10 +52,228 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# ================== JSON RESPONSES ==================
+# orjson when installed, gzip/brotli by Accept-Encoding above a size threshold, and an opt-in
+# columnar shape (?columnar=1) that sends lists of objects as one array per field.
+JSON_COMPRESS_MIN_BYTES = int(os.getenv('JSON_COMPRESS_MIN_BYTES', '1024'))
+JSON_GZIP_LEVEL = 6
+JSON_BROTLI_QUALITY = 5
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _brotli():
+    """The brotli module, or None when it is not installed"""
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def columnar(rows):
+    """{'columns': {field: [values]}, 'length': n} for a non-empty list of dicts, else rows unchanged"""
+    if not isinstance(rows, list) or not rows or not all(isinstance(row, dict) for row in rows):
+        return rows
+    fields = list(dict.fromkeys(field for row in rows for field in row))
+    return {
+        'columns': {field: [row.get(field) for row in rows] for field in fields},
+        'length': len(rows)
+    }
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider serialized with orjson when available, with the stdlib as fallback"""
+
+    ORJSON_OPTIONS = 0 if orjson is None else (
+        orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY |
+        # Keep Flask's own formatting of dates and dataclasses
+        orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+    )
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs.get('indent') is not None:
+            return super().dumps(obj, **kwargs)
+        option = self.ORJSON_OPTIONS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=self.default, option=option).decode()
+        except (orjson.JSONEncodeError, TypeError):
+            # e.g. integers beyond 64 bits
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if has_request_context() and request.args.get('columnar') in ('1', 'true'):
+            obj = {key: columnar(value) for key, value in obj.items()} if isinstance(obj, dict) else columnar(obj)
+        return super().response(obj)
+
+
+app.json = JSONProvider(app)
+
+
+@app.after_request
+def compress_json_response(response):
+    """Compress large JSON bodies with the best encoding the client accepts"""
+    if response.mimetype != 'application/json' or response.direct_passthrough or \
+            response.is_streamed or 'Content-Encoding' in response.headers:
+        return response
+    data = response.get_data()
+    if len(data) < JSON_COMPRESS_MIN_BYTES:
+        return response
+    response.vary.add('Accept-Encoding')
+    brotli = _brotli()
+    encoding = request.accept_encodings.best_match(['br', 'gzip'] if brotli else ['gzip'])
+    if encoding == 'br':
+        response.set_data(brotli.compress(data, quality=JSON_BROTLI_QUALITY))
+    elif encoding == 'gzip':
+        response.set_data(gzip.compress(data, compresslevel=JSON_GZIP_LEVEL))
+    else:
+        return response
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
 # ================== DATABASE INITIALIZATION ==================
+# Tag category -> (child table, text column used before tags were dictionary-encoded)
+TAG_CATEGORIES = {
+    'key_level': ('trade_key_levels', 'level'),
+    'confirmation': ('trade_confirmations', 'confirmation'),
+    'entry': ('trade_entries', 'entry'),
+    'model': ('trade_models', 'model')
+}
+
+
+def _create_tag_table(cursor, table):
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS {table} (
+        trade_id INTEGER NOT NULL,
+        tag_id INTEGER NOT NULL,
+        PRIMARY KEY (trade_id, tag_id),
+        FOREIGN KEY (trade_id) REFERENCES trades(id) ON DELETE CASCADE,
+        FOREIGN KEY (tag_id) REFERENCES tags(id)
+    )
+    ''')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_tag ON {table}(tag_id, trade_id)')
+
+
+def _table_exists(cursor, table):
+    return cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+
+def _migrate_tag_table(cursor, category, table, legacy_column):
+    """Move a free-text child table onto the tags dictionary, keeping row order
+
+    Runs as one transaction (sqlite3 would otherwise commit each DDL statement on its own).
+    A <table>_legacy left by an interrupted run is picked up and finished.
+    """
+    cursor.connection.commit()
+    cursor.execute('BEGIN')
+    try:
+        if not _table_exists(cursor, f'{table}_legacy'):
+            cursor.execute(f'ALTER TABLE {table} RENAME TO {table}_legacy')
+        _create_tag_table(cursor, table)
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO tags (user_id, category, name)
+            SELECT t.user_id, ?, TRIM(d.{legacy_column})
+            FROM {table}_legacy d JOIN trades t ON t.id = d.trade_id
+            WHERE TRIM(d.{legacy_column}) != ''
+            ORDER BY d.id
+        ''', (category,))
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO {table} (trade_id, tag_id)
+            SELECT d.trade_id, g.id
+            FROM {table}_legacy d
+            JOIN trades t ON t.id = d.trade_id
+            JOIN tags g ON g.user_id = t.user_id AND g.category = ? AND g.name = TRIM(d.{legacy_column})
+            ORDER BY d.id
+        ''', (category,))
+        cursor.execute(f'DROP TABLE {table}_legacy')
+        cursor.connection.commit()
+    except Exception:
+        cursor.connection.rollback()
+        raise
+
+
+# ':memory:' is opened as one named shared-cache database so every connection sees the same data
+MEMORY_DATABASE_URI = 'file:trading_journal?mode=memory&cache=shared'
+
+_schema_lock = threading.Lock()
+_schema_ready = set()
+_memory_keepalive = {}
+
+
+def connect_db(path=None, **kwargs):
+    """sqlite3 connection to path (default: the configured DATABASE_PATH); file: URIs are supported"""
+    path = path or app.config['DATABASE_PATH']
+    if path == ':memory:':
+        path = MEMORY_DATABASE_URI
+    return sqlite3.connect(path, uri=path.startswith('file:'), **kwargs)
+
+
+def _migrate_external_id_unique(conn):
+    """Rebuild a legacy trades table whose external_id is UNIQUE across users as UNIQUE(user_id, external_id)
+
+    Returns True when the table was rebuilt. Indexes and triggers on trades are recreated by the
+    CREATE ... IF NOT EXISTS statements that follow in _create_schema().
+    """
+    for index in conn.execute('PRAGMA index_list(trades)').fetchall():
+        columns = [row[2] for row in conn.execute(f'PRAGMA index_info("{index[1]}")').fetchall()]
+        if index[2] and index[3] == 'u' and columns == ['external_id']:
+            break
+    else:
+        return False
+
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'trades'").fetchone()[0]
+    sql = re.sub(r'\bexternal_id(\s+TEXT)?\s+UNIQUE\b', r'external_id\1', sql, count=1, flags=re.I)
+    sql = re.sub(r',\s*UNIQUE\s*\(\s*external_id\s*\)', '', sql, count=1, flags=re.I)
+    sql = re.sub(r'^CREATE TABLE (IF NOT EXISTS )?"?trades"?', 'CREATE TABLE trades_rebuild', sql, count=1, flags=re.I)
+    sql = sql[:sql.rfind(')')] + ', UNIQUE(user_id, external_id))'
+
+    conn.commit()
+    # Keep the rename from re-checking triggers on other tables that mention trades
+    conn.execute('PRAGMA legacy_alter_table = ON')
+    try:
+        conn.execute('BEGIN')
+        conn.execute(sql)
+        conn.execute('INSERT INTO trades_rebuild SELECT * FROM trades')
+        conn.execute('DROP TABLE trades')
+        conn.execute('ALTER TABLE trades_rebuild RENAME TO trades')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute('PRAGMA legacy_alter_table = OFF')
+    print("✅ Made trades.external_id unique per user")
+    return True
+
+
 def init_db():
-    """Initialize database with all required tables"""
-    conn = sqlite3.connect('trading_journal.db')
+    """Create or migrate the schema of the configured database (DATABASE_PATH)"""
+    path = app.config['DATABASE_PATH']
+    with _schema_lock:
+        if path == ':memory:' and path not in _memory_keepalive:
+            # A shared in-memory database lives only while a connection to it is open
+            _memory_keepalive[path] = connect_db(path, check_same_thread=False)
+        _create_schema(path)
+        _schema_ready.add(path)
+    # Cached trades may belong to a previously configured database
+    trade_cache.clear()
+
+
+def _create_schema(path):
+    """Create all tables, indexes and triggers and run the migrations (idempotent)"""
+    conn = connect_db(path)
     cursor = conn.cursor()
 
     # Users table for multi-user support
@@ -212,51 +439,58 @@ def init_db():
     except:
         pass
 
-    # Create child tables with UNIQUE constraints
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS trade_key_levels (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        trade_id INTEGER NOT NULL,
-        level TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (trade_id) REFERENCES trades(id) ON DELETE CASCADE,
-        UNIQUE(trade_id, level)
-    )
-    ''')
+    # Soft delete flag (queries filter on is_deleted = 0)
+    try:
+        cursor.execute("ALTER TABLE trades ADD COLUMN is_deleted INTEGER DEFAULT 0")
+    except:
+        pass
+
+    # Derived metrics computed on write (see compute_trade_metrics)
+    for column in ('realized_r REAL', 'holding_seconds REAL', 'notional REAL'):
+        try:
+            cursor.execute(f"ALTER TABLE trades ADD COLUMN {column}")
+        except:
+            pass
 
+    # Databases from before multi-user support have external_id UNIQUE across all users
+    _migrate_external_id_unique(conn)
+
+    # Time ranges already present in the local kline cache (end_ms exclusive)
     cursor.execute('''
-    CREATE TABLE IF NOT EXISTS trade_confirmations (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        trade_id INTEGER NOT NULL,
-        confirmation TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (trade_id) REFERENCES trades(id) ON DELETE CASCADE,
-        UNIQUE(trade_id, confirmation)
+    CREATE TABLE IF NOT EXISTS kline_ranges (
+        symbol TEXT NOT NULL,
+        interval TEXT NOT NULL,
+        start_ms INTEGER NOT NULL,
+        end_ms INTEGER NOT NULL,
+        PRIMARY KEY (symbol, interval, start_ms)
     )
     ''')
 
     cursor.execute('''
-    CREATE TABLE IF NOT EXISTS trade_entries (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        trade_id INTEGER NOT NULL,
-        entry TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (trade_id) REFERENCES trades(id) ON DELETE CASCADE,
-        UNIQUE(trade_id, entry)
-    )
+        CREATE INDEX IF NOT EXISTS idx_trades_user_status_time
+        ON trades(user_id, status, is_deleted, entry_time)
     ''')
 
+    # Per-user dictionary of key level / confirmation / entry / model names
     cursor.execute('''
-    CREATE TABLE IF NOT EXISTS trade_models (
+    CREATE TABLE IF NOT EXISTS tags (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        trade_id INTEGER NOT NULL,
-        model TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        name TEXT NOT NULL COLLATE NOCASE,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (trade_id) REFERENCES trades(id) ON DELETE CASCADE,
-        UNIQUE(trade_id, model)
+        UNIQUE(user_id, category, name)
     )
     ''')
 
+    # Child tables hold (trade_id, tag_id); databases from the free-text layout are migrated once
+    for category, (table, legacy_column) in TAG_CATEGORIES.items():
+        columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})').fetchall()]
+        if legacy_column in columns or _table_exists(cursor, f'{table}_legacy'):
+            _migrate_tag_table(cursor, category, table, legacy_column)
+        else:
+            _create_tag_table(cursor, table)
+
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS trade_screenshots (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -267,35 +501,167 @@ def init_db():
     )
     ''')
 
-    conn.commit()
-    conn.close()
+    # Content-addressed screenshot files; ref_count follows trade_screenshots rows via triggers
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS screenshot_blobs (
+        digest TEXT PRIMARY KEY,                  -- sha256 of the file contents
+        filename TEXT UNIQUE NOT NULL,            -- <digest>.<ext> in UPLOAD_FOLDER
+        size_bytes INTEGER NOT NULL,
+        ref_count INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        unreferenced_at TEXT DEFAULT CURRENT_TIMESTAMP  -- when ref_count last dropped to 0
+    )
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trade_screenshots_ref_insert AFTER INSERT ON trade_screenshots
+    WHEN NEW.screenshot_url LIKE '/screenshots/%'
+    BEGIN
+        UPDATE screenshot_blobs SET ref_count = ref_count + 1
+        WHERE filename = substr(NEW.screenshot_url, 14);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trade_screenshots_ref_delete AFTER DELETE ON trade_screenshots
+    WHEN OLD.screenshot_url LIKE '/screenshots/%'
+    BEGIN
+        UPDATE screenshot_blobs
+        SET ref_count = ref_count - 1,
+            unreferenced_at = CASE WHEN ref_count <= 1 THEN CURRENT_TIMESTAMP ELSE unreferenced_at END
+        WHERE filename = substr(OLD.screenshot_url, 14);
+    END
+    ''')
 
+    # Delta sync: trades.updated_at and a change log holding each trade's latest change
+    try:
+        cursor.execute("ALTER TABLE trades ADD COLUMN updated_at TEXT")
+        cursor.execute("UPDATE trades SET updated_at = created_at")
+    except:
+        pass
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS trade_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        trade_id INTEGER NOT NULL,
+        is_deleted INTEGER NOT NULL DEFAULT 0,    -- 1 = soft-delete tombstone
+        changed_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_trade_changes_user_seq ON trade_changes(user_id, seq)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_trade_changes_trade ON trade_changes(trade_id)')
+    # Inserts stamp updated_at through an UPDATE, so the update trigger logs every write once
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trade_changes_insert AFTER INSERT ON trades
+    BEGIN
+        UPDATE trades SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trade_changes_update AFTER UPDATE ON trades
+    BEGIN
+        INSERT INTO trade_changes (user_id, trade_id, is_deleted)
+        VALUES (NEW.user_id, NEW.id, COALESCE(NEW.is_deleted, 0));
+        DELETE FROM trade_changes WHERE trade_id = NEW.id AND seq < last_insert_rowid();
+        UPDATE trades SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id AND NEW.updated_at IS OLD.updated_at;
+    END
+    ''')
+    # Detail rows touch their trade, which logs it through the update trigger
+    for table in [table for table, _ in TAG_CATEGORIES.values()] + ['trade_screenshots']:
+        events = [('insert', 'NEW'), ('delete', 'OLD')] + ([('update', 'NEW')] if table == 'trade_screenshots' else [])
+        for event, row in events:
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trade_changes_{table}_{event} AFTER {event.upper()} ON {table}
+            BEGIN
+                UPDATE trades SET updated_at = CURRENT_TIMESTAMP WHERE id = {row}.trade_id;
+            END
+            ''')
+
+    # Quantile sketches (t-digest) per user, metric and dimension value
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS trade_sketches (
+        user_id INTEGER NOT NULL,
+        metric TEXT NOT NULL,                     -- pnl, pnl_percentage, risk_reward_ratio, ...
+        dimension TEXT NOT NULL,                  -- all, asset, model, confirmation
+        dimension_value TEXT NOT NULL DEFAULT '',
+        means BLOB,                               -- float64 centroid means
+        weights BLOB,                             -- float64 centroid weights
+        count REAL DEFAULT 0,
+        sum REAL DEFAULT 0,
+        min_value REAL,
+        max_value REAL,
+        updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, metric, dimension, dimension_value)
+    )
+    ''')
 
-init_db()
+    # Sketches are only updated incrementally while they are known to be complete
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS trade_sketch_status (
+        user_id INTEGER PRIMARY KEY,
+        is_stale INTEGER DEFAULT 0,
+        rebuilt_at TEXT
+    )
+    ''')
 
+    # Closed-trade aggregates per entry day, rolled up into weeks / months / quarters / years
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS daily_summaries (
+        user_id INTEGER NOT NULL,
+        trade_date TEXT NOT NULL,
+        trade_count INTEGER NOT NULL,
+        wins INTEGER NOT NULL,
+        losses INTEGER NOT NULL,
+        total_pnl REAL NOT NULL,
+        gross_profit REAL NOT NULL,
+        gross_loss REAL NOT NULL,
+        best_trade REAL,
+        worst_trade REAL,
+        PRIMARY KEY (user_id, trade_date)
+    )
+    ''')
 
-def get_db_connection():
-    """Get database connection with row factory"""
-    conn = sqlite3.connect('trading_journal.db')
-    conn.row_factory = sqlite3.Row
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS period_summaries (
+        user_id INTEGER NOT NULL,
+        period_type TEXT NOT NULL,
+        period_key TEXT NOT NULL,
+        start_date TEXT NOT NULL,
+        end_date TEXT NOT NULL,
+        trade_count INTEGER NOT NULL,
+        wins INTEGER NOT NULL,
+        losses INTEGER NOT NULL,
+        total_pnl REAL NOT NULL,
+        gross_profit REAL NOT NULL,
+        gross_loss REAL NOT NULL,
+        best_trade REAL,
+        worst_trade REAL,
+        trading_days INTEGER NOT NULL,
+        PRIMARY KEY (user_id, period_type, period_key)
+    )
+    ''')
 
-    # Ensure api_credentials table exists (migration for old databases)
-    cursor = conn.cursor()
+    # Summaries are maintained on write once they have been built for a user
     cursor.execute('''
-    CREATE TABLE IF NOT EXISTS api_credentials (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER DEFAULT 1,
-        exchange TEXT NOT NULL,
-        api_key TEXT,
-        api_secret TEXT,
-        network TEXT DEFAULT 'mainnet',
-        remember_me INTEGER DEFAULT 0,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users(id)
+    CREATE TABLE IF NOT EXISTS period_summary_status (
+        user_id INTEGER PRIMARY KEY,
+        rebuilt_at TEXT
     )
     ''')
+
+    conn.commit()
+
+    # Backfill derived metrics for rows written before the columns existed
+    recompute_trade_metrics(conn, only_missing=True)
     conn.commit()
+    conn.close()
 
+
+def get_db_connection():
+    """Get database connection with row factory"""
+    if app.config['DATABASE_PATH'] not in _schema_ready:
+        # Apps not built through create_app() set up the schema on first use
+        init_db()
+    conn = connect_db()
+    conn.row_factory = sqlite3.Row
     return conn
 
 
@@ -332,11 +698,109 @@ def calculate_risk_reward_ratio(entry_price, stop_loss, take_profit, side):
     return round(rr_ratio, 2)
 
 
+# ================== DERIVED TRADE METRICS ==================
+def _float_array(values):
+    """float64 array with NaN for missing or non-numeric values"""
+    out = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        try:
+            out[i] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return out
+
+
+def _epoch_ms(values, wall_clock=False):
+    """Milliseconds since the epoch for ISO timestamps (naive values are UTC), NaN when unparseable
+
+    With wall_clock, a UTC offset is ignored, so the result carries the date and time as written.
+    """
+    import pandas as pd
+
+    series = pd.Series(values, dtype=object)
+    if wall_clock:
+        series = series.str.replace(r'(?<=\d)(?:Z|[+-]\d{2}:?\d{2})$', '', regex=True)
+    parsed = pd.to_datetime(series, errors='coerce', utc=True, format='ISO8601')
+    seconds = (parsed - pd.Timestamp(0, tz='UTC')).dt.total_seconds()
+    return seconds.to_numpy(dtype=np.float64, na_value=np.nan) * 1000
+
+
+def compute_trade_metrics(entry_price, stop_loss, quantity, pnl, entry_time, exit_time):
+    """Realized R multiple, holding time (seconds) and notional for aligned sequences of trade fields
+
+    Returns a list of (realized_r, holding_seconds, notional) tuples with None where a value
+    cannot be computed (e.g. no stop loss for realized R, open trade for holding time).
+    """
+    entry_price = _float_array(entry_price)
+    stop_loss = _float_array(stop_loss)
+    quantity = _float_array(quantity)
+    pnl = _float_array(pnl)
+
+    notional = np.abs(entry_price * quantity)
+    risk = np.abs(entry_price - stop_loss) * quantity
+    with np.errstate(divide='ignore', invalid='ignore'):
+        realized_r = np.where((stop_loss > 0) & (risk > 0), pnl / risk, np.nan)
+
+    holding = (_epoch_ms(exit_time) - _epoch_ms(entry_time)) / 1000
+
+    columns = [np.round(realized_r, 4), holding, notional]
+    return [
+        tuple(None if np.isnan(v) else float(v) for v in row)
+        for row in zip(*columns)
+    ]
+
+
+def recompute_trade_metrics(conn, user_id=None, only_missing=False, chunk_size=5000):
+    """Batch (re)compute realized_r, holding_seconds and notional for stored trades; returns rows updated"""
+    where, params = [], []
+    if user_id is not None:
+        where.append('user_id = ?')
+        params.append(user_id)
+    if only_missing:
+        where.append('notional IS NULL')
+
+    cursor = conn.execute(f'''
+        SELECT id, entry_price, stop_loss, quantity, pnl, entry_time, exit_time
+        FROM trades {'WHERE ' + ' AND '.join(where) if where else ''}
+    ''', params)
+
+    updated = 0
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        ids, *fields = zip(*[tuple(row) for row in rows])
+        metrics = compute_trade_metrics(*fields)
+        conn.executemany(
+            'UPDATE trades SET realized_r = ?, holding_seconds = ?, notional = ? WHERE id = ?',
+            [(*m, trade_id) for m, trade_id in zip(metrics, ids)]
+        )
+        updated += len(rows)
+    return updated
+
+
+@app.cli.command('recompute-metrics')
+@click.option('--user-id', type=int, default=None, help='Only recompute this user\'s trades')
+@click.option('--missing-only', is_flag=True, help='Only fill rows that have never been computed')
+def recompute_metrics_command(user_id, missing_only):
+    """Recompute realized R, holding time and notional for stored trades"""
+    conn = get_db_connection()
+    updated = recompute_trade_metrics(conn, user_id=user_id, only_missing=missing_only)
+    conn.commit()
+    conn.close()
+    click.echo(f"Recomputed metrics for {updated} trade(s)")
+
+
 # ================== TRADE DETAILS HELPER FUNCTIONS ==================
-def get_trade_details(trade_id):
+# Trade details key -> tag category
+TAG_DETAIL_KEYS = {'key_levels': 'key_level', 'confirmations': 'confirmation', 'entries': 'entry', 'models': 'model'}
+
+
+def get_trade_details(trade_id, archived=False):
     """Get all related details for a trade (key levels, confirmations, entries, models, screenshots)"""
     conn = get_db_connection()
     cursor = conn.cursor()
+    tables = archive_tables(conn) if archived else {}
 
     details = {
         'key_levels': [],
@@ -346,75 +810,67 @@ def get_trade_details(trade_id):
         'screenshots': []
     }
 
-    # Get key levels
-    cursor.execute('SELECT level FROM trade_key_levels WHERE trade_id = ? ORDER BY created_at', (trade_id,))
-    details['key_levels'] = [row['level'] for row in cursor.fetchall()]
-
-    # Get confirmations
-    cursor.execute('SELECT confirmation FROM trade_confirmations WHERE trade_id = ? ORDER BY created_at', (trade_id,))
-    details['confirmations'] = [row['confirmation'] for row in cursor.fetchall()]
-
-    # Get entries
-    cursor.execute('SELECT entry FROM trade_entries WHERE trade_id = ? ORDER BY created_at', (trade_id,))
-    details['entries'] = [row['entry'] for row in cursor.fetchall()]
-
-    # Get models
-    cursor.execute('SELECT model FROM trade_models WHERE trade_id = ? ORDER BY created_at', (trade_id,))
-    details['models'] = [row['model'] for row in cursor.fetchall()]
+    for key, category in TAG_DETAIL_KEYS.items():
+        table, _ = TAG_CATEGORIES[category]
+        cursor.execute(f'''
+            SELECT g.name FROM {tables.get(table, table)} d JOIN tags g ON g.id = d.tag_id
+            WHERE d.trade_id = ? ORDER BY d.rowid
+        ''', (trade_id,))
+        details[key] = [row['name'] for row in cursor.fetchall()]
 
     # Get screenshots
-    cursor.execute('SELECT screenshot_url FROM trade_screenshots WHERE trade_id = ? ORDER BY created_at', (trade_id,))
+    cursor.execute(
+        f"SELECT screenshot_url FROM {tables.get('trade_screenshots', 'trade_screenshots')} "
+        "WHERE trade_id = ? ORDER BY created_at", (trade_id,)
+    )
     details['screenshots'] = [row['screenshot_url'] for row in cursor.fetchall()]
+    details['screenshot_variants'] = {url: screenshot_variants(url) for url in details['screenshots']}
 
     conn.close()
     return details
 
 
+def _tag_ids(cursor, user_id, category, names):
+    """Tag ids for names (created on first use), in order and without duplicates"""
+    tag_ids = []
+    for name in names:
+        if not name or not name.strip():
+            continue
+        cursor.execute(
+            'INSERT OR IGNORE INTO tags (user_id, category, name) VALUES (?, ?, ?)',
+            (user_id, category, name.strip())
+        )
+        cursor.execute(
+            'SELECT id FROM tags WHERE user_id = ? AND category = ? AND name = ?',
+            (user_id, category, name.strip())
+        )
+        tag_id = cursor.fetchone()[0]
+        if tag_id not in tag_ids:
+            tag_ids.append(tag_id)
+    return tag_ids
+
+
 def save_trade_details(trade_id, key_levels=None, confirmations=None, entries=None, models=None, screenshots=None):
     """Save trade details (replaces existing data)"""
     conn = get_db_connection()
     cursor = conn.cursor()
 
     try:
-        # Clear existing data
-        cursor.execute('DELETE FROM trade_key_levels WHERE trade_id = ?', (trade_id,))
-        cursor.execute('DELETE FROM trade_confirmations WHERE trade_id = ?', (trade_id,))
-        cursor.execute('DELETE FROM trade_entries WHERE trade_id = ?', (trade_id,))
-        cursor.execute('DELETE FROM trade_models WHERE trade_id = ?', (trade_id,))
-        cursor.execute('DELETE FROM trade_screenshots WHERE trade_id = ?', (trade_id,))
-
-        # Insert new data
-        if key_levels:
-            for level in key_levels:
-                if level and level.strip():
-                    cursor.execute(
-                        'INSERT INTO trade_key_levels (trade_id, level) VALUES (?, ?)',
-                        (trade_id, level.strip())
-                    )
-
-        if confirmations:
-            for confirmation in confirmations:
-                if confirmation and confirmation.strip():
-                    cursor.execute(
-                        'INSERT INTO trade_confirmations (trade_id, confirmation) VALUES (?, ?)',
-                        (trade_id, confirmation.strip())
-                    )
+        cursor.execute('SELECT user_id FROM trades WHERE id = ?', (trade_id,))
+        trade = cursor.fetchone()
+        if not trade:
+            raise ValueError(f'Trade {trade_id} not found')
 
-        if entries:
-            for entry in entries:
-                if entry and entry.strip():
-                    cursor.execute(
-                        'INSERT INTO trade_entries (trade_id, entry) VALUES (?, ?)',
-                        (trade_id, entry.strip())
-                    )
+        # Replace tag links; new names are added to the user's tag dictionary
+        for category, names in (
+            ('key_level', key_levels), ('confirmation', confirmations), ('entry', entries), ('model', models)
+        ):
+            table, _ = TAG_CATEGORIES[category]
+            cursor.execute(f'DELETE FROM {table} WHERE trade_id = ?', (trade_id,))
+            for tag_id in _tag_ids(cursor, trade['user_id'], category, names or []):
+                cursor.execute(f'INSERT OR IGNORE INTO {table} (trade_id, tag_id) VALUES (?, ?)', (trade_id, tag_id))
 
-        if models:
-            for model in models:
-                if model and model.strip():
-                    cursor.execute(
-                        'INSERT INTO trade_models (trade_id, model) VALUES (?, ?)',
-                        (trade_id, model.strip())
-                    )
+        cursor.execute('DELETE FROM trade_screenshots WHERE trade_id = ?', (trade_id,))
 
         if screenshots:
             for screenshot in screenshots:
@@ -433,6 +889,53 @@ def save_trade_details(trade_id, key_levels=None, confirmations=None, entries=No
         raise e
 
 
+# ================== TAGS ==================
+TAG_LIST_DEFAULT_LIMIT = 50
+
+
+@app.route('/api/tags', methods=['GET'])
+def get_tags():
+    """List the current user's tags with the number of (non-deleted) trades using each
+
+    Query params: category (key_level, confirmation, entry or model; default all),
+    prefix (case-insensitive name prefix for autocomplete), limit (default 50).
+    """
+    user_id = get_current_user_id()
+    category = request.args.get('category')
+    if category and category not in TAG_CATEGORIES:
+        return jsonify({'success': False, 'error': f"category must be one of: {', '.join(TAG_CATEGORIES)}"}), 400
+    prefix = request.args.get('prefix', '').strip()
+    limit = max(1, min(request.args.get('limit', TAG_LIST_DEFAULT_LIMIT, type=int), 1000))
+
+    categories = [category] if category else list(TAG_CATEGORIES)
+
+    where = ['g.user_id = ?', f"g.category IN ({', '.join('?' * len(categories))})"]
+    params = [user_id] + categories
+    if prefix:
+        # Range scan on the NOCASE (user_id, category, name) index
+        where.append('g.name >= ? AND g.name < ?')
+        params += [prefix, prefix + '\U0010ffff']
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    tables = archive_tables(conn)
+    usage = ' UNION ALL '.join(f'SELECT tag_id, trade_id FROM {tables[TAG_CATEGORIES[c][0]]}' for c in categories)
+    cursor.execute(f'''
+        SELECT g.id, g.category, g.name, COUNT(t.id) AS trade_count
+        FROM tags g
+        LEFT JOIN ({usage}) u ON u.tag_id = g.id
+        LEFT JOIN {tables['trades']} t ON t.id = u.trade_id AND t.is_deleted = 0
+        WHERE {' AND '.join(where)}
+        GROUP BY g.id
+        ORDER BY trade_count DESC, g.name
+        LIMIT ?
+    ''', params + [limit])
+    tags = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+
+    return jsonify({'tags': tags})
+
+
 # ================== USER MANAGEMENT ==================
 @app.route('/api/users', methods=['GET'])
 def get_users():
@@ -502,6 +1005,104 @@ def index():
     return render_template('single_page.html')
 
 
+# ================== EVENTS ==================
+# In-process pub/sub behind /api/events (Server-Sent Events). Each open stream gets a bounded
+# queue; a client that falls behind loses its backlog and is sent 'resync' instead.
+# Every stream pins a worker thread, so at most EVENT_MAX_STREAMS are open at once.
+EVENT_MAX_STREAMS = int(os.getenv('EVENT_MAX_STREAMS', '8'))
+EVENT_QUEUE_SIZE = 256
+EVENT_HEARTBEAT_SECONDS = 15
+EVENT_RETRY_MS = 3000
+
+
+class EventBus:
+    """Per-user publish/subscribe over bounded queues (one process; not shared between workers)"""
+
+    def __init__(self, queue_size=EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, user_id, max_streams=None):
+        """A new queue for user_id, or None when max_streams streams are already open"""
+        subscription = queue.Queue(self.queue_size)
+        with self._lock:
+            if max_streams is not None and sum(map(len, self._subscribers.values())) >= max_streams:
+                return None
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(user_id, None)
+
+    def publish(self, user_id, event, data=None):
+        """Queue an event for the user's open streams (user_id None: every stream)"""
+        with self._lock:
+            if user_id is None:
+                targets = [s for subscribers in self._subscribers.values() for s in subscribers]
+            else:
+                targets = list(self._subscribers.get(user_id, ()))
+        for subscription in targets:
+            try:
+                subscription.put_nowait((event, data))
+            except queue.Full:
+                with subscription.mutex:
+                    subscription.queue.clear()
+                subscription.put_nowait(('resync', {'reason': 'overflow'}))
+
+
+event_bus = EventBus()
+
+
+def after_trade_commit(conn, user_id, trade_ids):
+    """Refresh the trade cache and tell open streams about trades written in the last commit"""
+    trade_cache.refresh(conn, user_id, trade_ids)
+    event_bus.publish(user_id, 'data_version', {'change_seq': trade_change_seq(conn), 'trade_ids': list(trade_ids)})
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route('/api/events', methods=['GET'])
+def event_stream():
+    """Server-Sent Events: sync progress, imported trades, snapshots and data-version bumps"""
+    user_id = get_current_user_id()
+    conn = get_db_connection()
+    change_seq = trade_change_seq(conn)
+    conn.close()
+    subscription = event_bus.subscribe(user_id, EVENT_MAX_STREAMS)
+    if subscription is None:
+        response = jsonify({'success': False, 'error': 'Too many open event streams'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+
+    def generate():
+        try:
+            yield f"retry: {EVENT_RETRY_MS}\n\n"
+            yield _sse('ready', {'change_seq': change_seq})
+            while True:
+                try:
+                    event, data = subscription.get(timeout=EVENT_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    # Comment line: keeps proxies from closing the idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse(event, data)
+        finally:
+            event_bus.unsubscribe(user_id, subscription)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
 # ================== BYBIT INTEGRATION ==================
 def _get_saved_bybit_credentials():
     """Retrieve saved Bybit credentials for current user"""
@@ -514,8 +1115,24 @@ def _get_saved_bybit_credentials():
     return dict(creds) if creds else None
 
 
+_bybit_http = None
+
+
+def bybit_http_class():
+    """pybit's unified trading HTTP client, imported on first use (None when pybit is missing or too old)"""
+    global _bybit_http
+    if _bybit_http is None:
+        try:
+            from pybit.unified_trading import HTTP
+            _bybit_http = HTTP if 'unified_trading' in HTTP.__module__ else False
+        except Exception:
+            _bybit_http = False
+    return _bybit_http or None
+
+
 def _create_bybit_client(api_key, api_secret, network):
     """Create Bybit API client"""
+    BybitHTTP = bybit_http_class()
     if BybitHTTP is None:
         raise RuntimeError('pybit is not installed')
 
@@ -678,6 +1295,13 @@ def sync_extended_data():
             print(f"  [ERROR] Orders fetch error: {e}")
 
         conn.commit()
+        event_bus.publish(get_current_user_id(), 'snapshot', {
+            'timestamp': now_iso,
+            'sync_id': sync_id,
+            'balances_saved': balances_saved,
+            'positions_saved': positions_saved,
+            'orders_saved': orders_saved
+        })
 
         print(f"\n{'=' * 60}")
         print(f"FULL SNAPSHOT COMPLETE")
@@ -811,8 +1435,12 @@ def sync_bybit_trades():
         log_file.write(msg + '\n')
         log_file.flush()
 
+    def progress(stage, **data):
+        event_bus.publish(user_id, 'sync', {'stage': stage, **data})
+
     log("\n" + "=" * 60)
     log(f"BYBIT SYNC STARTED (User ID: {user_id})")
+    progress('started')
     log("=" * 60)
     sys.stdout.flush()
 
@@ -820,6 +1448,7 @@ def sync_bybit_trades():
     try:
         creds = _get_saved_bybit_credentials()
         if not creds or not creds.get('api_key'):
+            progress('error', message='No Bybit API credentials saved')
             return jsonify({
                 'success': False,
                 'message': 'Please save your Bybit API credentials first.',
@@ -893,6 +1522,7 @@ def sync_bybit_trades():
 
                         log(f"    Page {pages}: {len(items)} items found")
                         all_items.extend(items)
+                        progress('fetching', category=category, items=len(all_items))
 
                         next_cursor = result.get('nextPageCursor') or result.get('cursor')
                         if not next_cursor or next_cursor == cursor_val:
@@ -910,18 +1540,24 @@ def sync_bybit_trades():
             log(json.dumps(all_items[0], indent=2))
 
         if not all_items:
+            progress('done', inserted=0, skipped=0)
             return jsonify({
                 'success': True,
                 'message': 'No closed positions found on Bybit.',
                 'trades_synced': 0
             })
 
+        progress('processing', items=len(all_items))
+
         # Process trades
         conn = get_db_connection()
         cursor = conn.cursor()
+        # Archived (including purged deleted) trades must not be re-imported either
+        trades_table = archive_tables(conn)['trades']
 
         inserted = 0
         skipped = 0
+        inserted_ids = []
 
         for item in all_items:
             try:
@@ -934,7 +1570,9 @@ def sync_bybit_trades():
 
                 # Check if already exists for this user (including deleted trades to prevent re-import)
                 # IMPORTANT: Do NOT check is_deleted = 0 here - we want to prevent re-importing deleted trades
-                cursor.execute('SELECT 1 FROM trades WHERE user_id = ? AND external_id = ? LIMIT 1', (user_id, external_id))
+                cursor.execute(
+                    f'SELECT 1 FROM {trades_table} WHERE user_id = ? AND external_id = ? LIMIT 1', (user_id, external_id)
+                )
                 if cursor.fetchone():
                     log(f"  Skipping duplicate: {external_id}")
                     skipped += 1
@@ -984,20 +1622,26 @@ def sync_bybit_trades():
                 # Get current timestamp
                 created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
+                # Bybit closed P&L carries no stop loss, so realized R stays empty
+                _, holding_seconds, notional = compute_trade_metrics(
+                    [entry_price], [None], [qty], [pnl], [entry_time], [exit_time]
+                )[0]
+
                 # Insert trade - include ALL required NOT NULL columns
                 cursor.execute('''
                     INSERT INTO trades (
                         user_id, asset, side, entry_price, exit_price, quantity,
                         entry_time, exit_time, pnl, pnl_percentage, weekly_bias, daily_bias,
-                        notes, status, external_id, created_at
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        notes, status, external_id, created_at, holding_seconds, notional
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 ''', (
                     user_id, asset, side, entry_price, exit_price, qty,
                     entry_time, exit_time, pnl, pnl_percentage, 'neutral', 'neutral',
-                    '', 'closed', external_id, created_at
+                    '', 'closed', external_id, created_at, holding_seconds, notional
                 ))
 
                 inserted += 1
+                inserted_ids.append(cursor.lastrowid)
                 log(f"  Successfully inserted trade!")
                 log(f"  ✓ Successfully inserted trade!")
 
@@ -1006,7 +1650,13 @@ def sync_bybit_trades():
                 skipped += 1
                 continue
 
+        add_trades_to_sketches(conn, user_id, inserted_ids)
+        refresh_period_summaries(conn, user_id, _trade_dates(conn, inserted_ids))
         conn.commit()
+        after_trade_commit(conn, user_id, inserted_ids)
+        if inserted_ids:
+            event_bus.publish(user_id, 'trades', {'source': 'bybit', 'ids': inserted_ids})
+        progress('done', inserted=inserted, skipped=skipped)
 
         print(f"\n{'=' * 60}")
         print(f"EXTENDED SYNC COMPLETE")
@@ -1025,6 +1675,7 @@ def sync_bybit_trades():
         print(f"\nFATAL ERROR: {error_msg}")
         if conn:
             conn.rollback()
+        progress('error', message=error_msg)
 
         return jsonify({
             'success': False,
@@ -1106,7 +1757,7 @@ def get_bybit_balance():
         
         # Debug logging to identify credential issues
         print(f"DEBUG: Using Bybit key: {creds['api_key'][:6]}... network: {network}")
-        print(f"DEBUG: pybit module: {BybitHTTP.__module__}")
+        print(f"DEBUG: pybit module: {getattr(bybit_http_class(), '__module__', None)}")
         
         client = _create_bybit_client(creds['api_key'], creds['api_secret'], network)
 
@@ -1253,13 +1904,13 @@ def get_calendar_data():
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    cursor.execute('''
+    cursor.execute(f'''
         SELECT
             DATE(entry_time) as trade_date,
             SUM(pnl) as daily_pnl,
             COUNT(*) as trade_count,
             SUM(CASE WHEN pnl > 0 THEN 1 ELSE 0 END) as winning_trades
-        FROM trades
+        FROM {archive_tables(conn)['trades']}
         WHERE user_id = ? AND status = 'closed' AND pnl IS NOT NULL AND is_deleted = 0
         GROUP BY DATE(entry_time)
         ORDER BY trade_date
@@ -1268,28 +1919,34 @@ def get_calendar_data():
     rows = cursor.fetchall()
     conn.close()
 
-    events = []
-    for row in rows:
-        win_rate = (row['winning_trades'] / row['trade_count'] * 100) if row['trade_count'] > 0 else 0
-        color = '#4CAF50' if row['daily_pnl'] > 0 else '#f44336' if row['daily_pnl'] < 0 else '#9E9E9E'
-
-        events.append({
-            'title': f"${row['daily_pnl']:.0f} | {row['trade_count']} trades | {round(win_rate, 1)}% WR",
-            'start': row['trade_date'],
-            'allDay': True,
-            'backgroundColor': color,
-            'borderColor': color,
-            'textColor': '#ffffff',
-            'extendedProps': {
-                'pnl': row['daily_pnl'],
-                'trade_count': row['trade_count'],
-                'win_rate': round(win_rate, 1)
-            }
-        })
+    events = [
+        _calendar_event(row['trade_date'], row['daily_pnl'], row['trade_count'], row['winning_trades'])
+        for row in rows
+    ]
 
     return jsonify(events)
 
 
+def _calendar_event(trade_date, daily_pnl, trade_count, winning_trades):
+    """FullCalendar event for one trading day"""
+    win_rate = (winning_trades / trade_count * 100) if trade_count > 0 else 0
+    color = '#4CAF50' if daily_pnl > 0 else '#f44336' if daily_pnl < 0 else '#9E9E9E'
+
+    return {
+        'title': f"${daily_pnl:.0f} | {trade_count} trades | {round(win_rate, 1)}% WR",
+        'start': trade_date,
+        'allDay': True,
+        'backgroundColor': color,
+        'borderColor': color,
+        'textColor': '#ffffff',
+        'extendedProps': {
+            'pnl': daily_pnl,
+            'trade_count': trade_count,
+            'win_rate': round(win_rate, 1)
+        }
+    }
+
+
 @app.route('/api/trades_by_date', methods=['GET'])
 def get_trades_by_date():
     """Get trades for a specific date"""
@@ -1298,8 +1955,9 @@ def get_trades_by_date():
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    cursor.execute('''
-        SELECT * FROM trades
+    trades_table = archive_tables(conn, start_date=date_str, end_date=date_str)['trades']
+    cursor.execute(f'''
+        SELECT * FROM {trades_table}
         WHERE user_id = ? AND DATE(entry_time) = ? AND status = 'closed' AND is_deleted = 0
         ORDER BY entry_time DESC
     ''', (user_id, date_str))
@@ -1325,6 +1983,48 @@ def get_trades_by_date():
 
 
 # ================== TRADE MANAGEMENT ==================
+def _period_condition(period, start_date=None, end_date=None, column='entry_time'):
+    """SQL condition and params for the period / custom date range filter ('' when unfiltered)"""
+    if start_date and end_date:
+        return f"DATE({column}) BETWEEN ? AND ?", [start_date, end_date]
+    if period == 'today':
+        return f"DATE({column}) = DATE('now')", []
+    if period == 'week':
+        return f"{column} >= DATE('now', '-7 days')", []
+    if period == 'month':
+        return f"strftime('%Y-%m', {column}) = strftime('%Y-%m', 'now')", []
+    return '', []
+
+
+def _trade_statistics(trades):
+    """Summary statistics for a list of closed trades"""
+    total_trades = len(trades)
+    winning_trades = sum(1 for t in trades if (t.get('pnl') or 0) > 0)
+    losing_trades = sum(1 for t in trades if (t.get('pnl') or 0) < 0)
+    total_pnl = sum(t.get('pnl') or 0 for t in trades)
+    win_rate = (winning_trades / total_trades * 100) if total_trades > 0 else 0
+
+    wins = [t['pnl'] for t in trades if (t.get('pnl') or 0) > 0]
+    losses = [t['pnl'] for t in trades if (t.get('pnl') or 0) < 0]
+    avg_win = sum(wins) / len(wins) if wins else 0
+    avg_loss = sum(losses) / len(losses) if losses else 0
+
+    total_wins = sum(wins) if wins else 0
+    total_losses = abs(sum(losses)) if losses else 0
+    profit_factor = total_wins / total_losses if total_losses > 0 else 0
+
+    return {
+        'total_trades': total_trades,
+        'winning_trades': winning_trades,
+        'losing_trades': losing_trades,
+        'total_pnl': total_pnl,
+        'win_rate': round(win_rate, 1),
+        'avg_win': round(avg_win, 2),
+        'avg_loss': round(avg_loss, 2),
+        'profit_factor': round(profit_factor, 2)
+    }
+
+
 @app.route('/api/trades', methods=['GET'])
 def get_trades():
     """Get trades with statistics"""
@@ -1334,80 +2034,186 @@ def get_trades():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     status = request.args.get('status', 'closed')
+    if 'limit' in request.args:
+        return _trade_page(user_id, request.args)
 
     conn = get_db_connection()
     cursor = conn.cursor()
+    # Read before the trades, so changes racing this request are sent again by /api/trades/changes
+    change_seq = trade_change_seq(conn)
 
-    query = "SELECT * FROM trades WHERE user_id = ? AND status = ? AND is_deleted = 0"
+    trades_table = archive_tables(conn, period, start_date, end_date)['trades']
+    query = f"SELECT * FROM {trades_table} WHERE user_id = ? AND status = ? AND is_deleted = 0"
     params = [user_id, status]
 
-    if start_date and end_date:
-        query += " AND DATE(entry_time) BETWEEN ? AND ?"
-        params.extend([start_date, end_date])
-    elif period == 'today':
-        query += " AND DATE(entry_time) = DATE('now')"
-    elif period == 'week':
-        query += " AND entry_time >= DATE('now', '-7 days')"
-    elif period == 'month':
-        query += " AND strftime('%Y-%m', entry_time) = strftime('%Y-%m', 'now')"
+    period_sql, period_params = _period_condition(period, start_date, end_date)
+    if period_sql:
+        query += " AND " + period_sql
+        params.extend(period_params)
 
     query += " ORDER BY entry_time DESC"
     cursor.execute(query, params)
 
-    trades = [dict(row) for row in cursor.fetchall()]
-
-    # Ensure bias fields
-    for t in trades:
-        t['weekly_bias'] = t.get('weekly_bias') or 'neutral'
-        t['daily_bias'] = t.get('daily_bias') or 'neutral'
+    trades = _with_bias_defaults([dict(row) for row in cursor.fetchall()])
 
     # Calculate statistics only for closed trades
+    statistics = {}
     if status == 'closed':
-        total_trades = len(trades)
-        winning_trades = sum(1 for t in trades if (t.get('pnl') or 0) > 0)
-        losing_trades = sum(1 for t in trades if (t.get('pnl') or 0) < 0)
-        total_pnl = sum(t.get('pnl') or 0 for t in trades)
-        win_rate = (winning_trades / total_trades * 100) if total_trades > 0 else 0
-
-        wins = [t['pnl'] for t in trades if (t.get('pnl') or 0) > 0]
-        losses = [t['pnl'] for t in trades if (t.get('pnl') or 0) < 0]
-        avg_win = sum(wins) / len(wins) if wins else 0
-        avg_loss = sum(losses) / len(losses) if losses else 0
-
-        total_wins = sum(wins) if wins else 0
-        total_losses = abs(sum(losses)) if losses else 0
-        profit_factor = total_wins / total_losses if total_losses > 0 else 0
-
-        statistics = {
-            'total_trades': total_trades,
-            'winning_trades': winning_trades,
-            'losing_trades': losing_trades,
-            'total_pnl': total_pnl,
-            'win_rate': round(win_rate, 1),
-            'avg_win': round(avg_win, 2),
-            'avg_loss': round(avg_loss, 2),
-            'profit_factor': round(profit_factor, 2)
-        }
-    else:
-        statistics = {}
+        columns = trade_cache.get(user_id)
+        if columns is not None:
+            statistics = columns.statistics(columns.period_mask(period, start_date, end_date))
+        else:
+            statistics = _trade_statistics(trades)
 
     conn.close()
 
     return jsonify({
         'trades': trades,
-        'statistics': statistics
+        'statistics': statistics,
+        'change_seq': change_seq
     })
 
 
-@app.route('/api/trades/<int:trade_id>', methods=['GET', 'PUT', 'DELETE'])
-def manage_trade(trade_id):
-    """Get, update, or delete a specific trade"""
+# ================== DELTA SYNC ==================
+# Triggers keep one trade_changes row per trade (its latest write), so clients holding a copy of
+# the trade list ask for everything after the last sequence number they saw.
+TRADE_CHANGES_LIMIT = 1000
+TRADE_CHANGES_MAX_LIMIT = 5000
+
+
+def _with_bias_defaults(trades):
+    for t in trades:
+        t['weekly_bias'] = t.get('weekly_bias') or 'neutral'
+        t['daily_bias'] = t.get('daily_bias') or 'neutral'
+    return trades
+
+
+def trade_change_seq(conn):
+    """Latest change-log sequence number (0 before any change)"""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'trade_changes'").fetchone()
+    return row[0] if row else 0
+
+
+@app.route('/api/trades/changes', methods=['GET'])
+def get_trade_changes():
+    """Trades inserted, updated or soft-deleted after the ?since= sequence number"""
+    user_id = get_current_user_id()
+    try:
+        since = int(request.args.get('since', 0))
+        limit = int(request.args.get('limit', TRADE_CHANGES_LIMIT))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'since and limit must be integers'}), 400
+    if limit < 1:
+        return jsonify({'success': False, 'error': 'limit must be positive'}), 400
+    limit = min(limit, TRADE_CHANGES_MAX_LIMIT)
+
+    conn = get_db_connection()
+    latest = trade_change_seq(conn)
+    changes = conn.execute('''
+        SELECT seq, trade_id, is_deleted FROM trade_changes
+        WHERE user_id = ? AND seq > ? ORDER BY seq LIMIT ?
+    ''', (user_id, since, limit + 1)).fetchall()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    upserted = [c['trade_id'] for c in changes if not c['is_deleted']]
+    trades = []
+    if upserted:
+        # Archived trades keep their log row and are read from the archive
+        trades_table = archive_tables(conn)['trades']
+        rows = {row['id']: dict(row) for row in conn.execute(f'''
+            SELECT * FROM {trades_table}
+            WHERE user_id = ? AND id IN (SELECT value FROM json_each(?))
+        ''', (user_id, json.dumps(upserted))).fetchall()}
+        trades = _with_bias_defaults([rows[trade_id] for trade_id in upserted if trade_id in rows])
+    conn.close()
+
+    last_seq = changes[-1]['seq'] if changes else since
+    return jsonify({
+        'trades': trades,
+        'deleted': [c['trade_id'] for c in changes if c['is_deleted']],
+        'change_seq': last_seq if has_more else max(latest, last_seq),
+        'has_more': has_more
+    })
+
+
+# ================== TRADE TABLE ==================
+# Paged reads behind the virtualized trade table: filter, sort and window in SQL, slim rows only
+# (a row's tags, notes and screenshots come from GET /api/trades/<id> when it is expanded).
+TRADE_PAGE_MAX = 500
+TRADE_SORT_COLUMNS = ('entry_time', 'exit_time', 'asset', 'side', 'quantity', 'pnl', 'pnl_percentage',
+                      'realized_r', 'holding_seconds')
+TRADE_ROW_FIELDS = ('id', 'asset', 'side', 'status', 'entry_price', 'exit_price', 'quantity', 'pnl',
+                    'pnl_percentage', 'realized_r', 'holding_seconds', 'entry_time', 'exit_time',
+                    'weekly_bias', 'daily_bias', 'updated_at')
+
+
+def _trade_page(user_id, args):
+    """GET /api/trades with limit: one sorted, filtered page of slim rows plus the total count"""
+    try:
+        limit = int(args.get('limit'))
+        offset = int(args.get('offset', 0))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'limit and offset must be integers'}), 400
+    if limit < 0 or offset < 0:
+        return jsonify({'success': False, 'error': 'limit and offset must not be negative'}), 400
+    limit = min(limit, TRADE_PAGE_MAX)
+
+    sort = args.get('sort', '-entry_time')
+    column = sort.lstrip('-')
+    if column not in TRADE_SORT_COLUMNS:
+        return jsonify({'success': False, 'error': f"sort must be one of: {', '.join(TRADE_SORT_COLUMNS)}"}), 400
+    direction = 'DESC' if sort.startswith('-') else 'ASC'
+
+    conn = get_db_connection()
+    change_seq = trade_change_seq(conn)
+    trades_table = archive_tables(conn, args.get('period', 'all'), args.get('start_date'), args.get('end_date'))['trades']
+    where, params = _trade_filter(user_id, args)
+    where_sql = ' AND '.join(where)
+    total = conn.execute(f'SELECT COUNT(*) FROM {trades_table} t WHERE {where_sql}', params).fetchone()[0]
+    rows = conn.execute(f'''
+        SELECT {', '.join(f't.{field}' for field in TRADE_ROW_FIELDS)}
+        FROM {trades_table} t
+        WHERE {where_sql}
+        ORDER BY t.{column} {direction}, t.id {direction}
+        LIMIT ? OFFSET ?
+    ''', params + [limit, offset]).fetchall()
+    conn.close()
+
+    return jsonify({
+        'trades': _with_bias_defaults([dict(row) for row in rows]),
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'change_seq': change_seq
+    })
+
+
+def _trade_write_error(conn, trade_id):
+    """Error response when trade_id is not a hot trade: 409 for archived trades (read-only), else 404"""
+    if conn.execute('SELECT 1 FROM main.trades WHERE id = ?', (trade_id,)).fetchone():
+        return None
+    if archive_years() and conn.execute(
+            f"SELECT 1 FROM {archive_tables(conn)['trades']} WHERE id = ?", (trade_id,)).fetchone():
+        return jsonify({'success': False, 'error': 'Trade is archived and can no longer be edited'}), 409
+    return jsonify({'success': False, 'error': 'Trade not found'}), 404
+
+
+@app.route('/api/trades/<int:trade_id>', methods=['GET', 'PUT', 'DELETE'])
+def manage_trade(trade_id):
+    """Get, update, or delete a specific trade"""
     conn = get_db_connection()
     cursor = conn.cursor()
 
     if request.method == 'GET':
         cursor.execute('SELECT * FROM trades WHERE id = ?', (trade_id,))
         trade = cursor.fetchone()
+        archived = False
+        if not trade and archive_years():
+            # Archived trades stay readable (but not editable)
+            cursor.execute(f"SELECT * FROM {archive_tables(conn)['trades']} WHERE id = ?", (trade_id,))
+            trade = cursor.fetchone()
+            archived = trade is not None
         conn.close()
 
         if not trade:
@@ -1415,14 +2221,26 @@ def manage_trade(trade_id):
 
         # Convert to dict and add related details
         trade_dict = dict(trade)
-        trade_dict.update(get_trade_details(trade_id))
+        trade_dict.update(get_trade_details(trade_id, archived=archived))
+        trade_dict['archived'] = archived
 
         return jsonify(trade_dict)
 
-    elif request.method == 'PUT':
+    error = _trade_write_error(conn, trade_id)
+    if error:
+        conn.close()
+        return error
+
+    if request.method == 'PUT':
         data = request.json
         print(f"DEBUG: PUT data received: {data}")  # Debug output
 
+        realized_r, holding_seconds, notional = compute_trade_metrics(
+            [data['entry_price']], [data.get('stop_loss')], [data['quantity']],
+            [data.get('pnl')], [data['entry_time']], [data.get('exit_time')]
+        )[0]
+        previous_dates = _trade_dates(conn, [trade_id])
+
         # Update only core trade fields
         cursor.execute('''
             UPDATE trades SET
@@ -1430,7 +2248,8 @@ def manage_trade(trade_id):
                 entry_time = ?, exit_time = ?, pnl = ?,
                 weekly_bias = ?, daily_bias = ?,
                 notes = ?, status = ?,
-                stop_loss = ?, take_profit = ?, risk_reward_ratio = ?, position_size_pct = ?
+                stop_loss = ?, take_profit = ?, risk_reward_ratio = ?, position_size_pct = ?,
+                realized_r = ?, holding_seconds = ?, notional = ?
             WHERE id = ?
         ''', (
             data['asset'], data['side'], data['entry_price'], data.get('exit_price'),
@@ -1440,17 +2259,24 @@ def manage_trade(trade_id):
             data.get('status', 'closed'),
             data.get('stop_loss'), data.get('take_profit'),
             data.get('risk_reward_ratio'), data.get('position_size_pct'),
+            realized_r, holding_seconds, notional,
             trade_id
         ))
 
+        invalidate_trade_sketches(conn, get_current_user_id())
+        refresh_period_summaries(conn, get_current_user_id(), previous_dates | _trade_dates(conn, [trade_id]))
         conn.commit()
+        after_trade_commit(conn, get_current_user_id(), [trade_id])
         conn.close()
         return jsonify({'success': True})
 
     elif request.method == 'DELETE':
         # Soft delete - set is_deleted = 1 instead of actual deletion
         cursor.execute('UPDATE trades SET is_deleted = 1 WHERE id = ?', (trade_id,))
+        invalidate_trade_sketches(conn, get_current_user_id())
+        refresh_period_summaries(conn, get_current_user_id(), _trade_dates(conn, [trade_id]))
         conn.commit()
+        after_trade_commit(conn, get_current_user_id(), [trade_id])
         conn.close()
         return jsonify({'success': True})
 
@@ -1467,9 +2293,15 @@ def set_entry_type(trade_id):
     conn = get_db_connection()
     cursor = conn.cursor()
 
+    error = _trade_write_error(conn, trade_id)
+    if error:
+        conn.close()
+        return error
+
     try:
         cursor.execute('UPDATE trades SET entry_type = ? WHERE id = ?', (entry_type, trade_id))
         conn.commit()
+        after_trade_commit(conn, get_current_user_id(), [trade_id])
         conn.close()
         return jsonify({'success': True})
     except Exception as e:
@@ -1489,6 +2321,10 @@ def manage_trade_details(trade_id):
 
         # Validate that trade is closed before allowing stats to be saved
         conn = get_db_connection()
+        error = _trade_write_error(conn, trade_id)
+        if error:
+            conn.close()
+            return error
         cursor = conn.cursor()
         cursor.execute('SELECT status FROM trades WHERE id = ?', (trade_id,))
         trade = cursor.fetchone()
@@ -1506,6 +2342,13 @@ def manage_trade_details(trade_id):
                 models=data.get('models', []),
                 screenshots=data.get('screenshots', [])
             )
+
+            # Model / confirmation membership may have changed
+            conn = get_db_connection()
+            invalidate_trade_sketches(conn, get_current_user_id())
+            conn.commit()
+            after_trade_commit(conn, get_current_user_id(), [trade_id])
+            conn.close()
             return jsonify({'success': True})
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 500
@@ -1541,6 +2384,11 @@ def create_trade():
         data['side']
     )
 
+    realized_r, holding_seconds, notional = compute_trade_metrics(
+        [data['entry_price']], [data.get('stop_loss')], [data['quantity']],
+        [pnl], [data['entry_time']], [data.get('exit_time')]
+    )[0]
+
     conn = get_db_connection()
     cursor = conn.cursor()
 
@@ -1548,15 +2396,17 @@ def create_trade():
     cursor.execute('''
         INSERT INTO trades (user_id, asset, side, entry_price, exit_price, stop_loss, take_profit,
                           quantity, entry_time, exit_time, pnl, pnl_percentage, risk_reward_ratio,
-                          position_size_pct, weekly_bias, daily_bias, notes, status)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                          position_size_pct, weekly_bias, daily_bias, notes, status,
+                          realized_r, holding_seconds, notional)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     ''', (
         user_id, data['asset'], data['side'], data['entry_price'], data.get('exit_price'),
         data.get('stop_loss'), data.get('take_profit'),
         data['quantity'], data['entry_time'], data.get('exit_time'), pnl, pnl_percentage,
         rr_ratio, data.get('position_size_pct'),
         data.get('weekly_bias', 'neutral'), data.get('daily_bias', 'neutral'),
-        data.get('notes', ''), status
+        data.get('notes', ''), status,
+        realized_r, holding_seconds, notional
     ))
 
     trade_id = cursor.lastrowid
@@ -1573,6 +2423,14 @@ def create_trade():
         screenshots=data.get('screenshots', [])
     )
 
+    conn = get_db_connection()
+    if status == 'closed':
+        add_trades_to_sketches(conn, user_id, [trade_id])
+        refresh_period_summaries(conn, user_id, _trade_dates(conn, [trade_id]))
+        conn.commit()
+    after_trade_commit(conn, user_id, [trade_id])
+    conn.close()
+
     return jsonify({'success': True, 'id': trade_id})
 
 
@@ -1580,30 +2438,45 @@ def create_trade():
 def get_risk_metrics():
     """Calculate advanced risk metrics"""
     user_id = get_current_user_id()
+    columns = trade_cache.get(user_id)
+    if columns is not None:
+        return jsonify(columns.risk_metrics())
+
+    trades = _closed_trade_series(user_id)
+    return jsonify(_risk_metrics(trades))
+
+
+def _closed_trade_series(user_id):
+    """Closed trades with P&L in entry order (the series risk metrics and simulations run on)"""
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    cursor.execute('''
-        SELECT pnl, entry_time, risk_reward_ratio
-        FROM trades
+    cursor.execute(f'''
+        SELECT pnl, entry_time, risk_reward_ratio, realized_r
+        FROM {archive_tables(conn)['trades']}
         WHERE user_id = ? AND status = 'closed' AND pnl IS NOT NULL AND is_deleted = 0
         ORDER BY entry_time ASC
     ''', (user_id,))
 
     trades = cursor.fetchall()
     conn.close()
+    return trades
 
+
+def _risk_metrics(trades):
+    """Drawdown, expectancy, R:R and streak metrics for closed trades ordered by entry_time"""
     if not trades:
-        return jsonify({
+        return {
             'max_drawdown': 0,
             'max_drawdown_pct': 0,
             'expectancy': 0,
             'avg_rr_ratio': 0,
+            'avg_realized_r': 0,
             'consecutive_wins': 0,
             'consecutive_losses': 0,
             'largest_win': 0,
             'largest_loss': 0
-        })
+        }
 
     # Calculate cumulative P&L and max drawdown
     cumulative_pnl = 0
@@ -1634,6 +2507,8 @@ def get_risk_metrics():
     # Calculate avg R:R ratio
     rr_ratios = [t['risk_reward_ratio'] for t in trades if t['risk_reward_ratio']]
     avg_rr_ratio = sum(rr_ratios) / len(rr_ratios) if rr_ratios else 0
+    realized_rs = [t['realized_r'] for t in trades if t['realized_r'] is not None]
+    avg_realized_r = sum(realized_rs) / len(realized_rs) if realized_rs else 0
 
     # Calculate consecutive wins/losses
     current_streak = 0
@@ -1658,211 +2533,1217 @@ def get_risk_metrics():
     largest_win = max(wins) if wins else 0
     largest_loss = min(losses) if losses else 0
 
-    return jsonify({
+    return {
         'max_drawdown': round(max_drawdown, 2),
         'max_drawdown_pct': round(max_drawdown_pct, 2),
         'expectancy': round(expectancy, 2),
         'avg_rr_ratio': round(avg_rr_ratio, 2),
+        'avg_realized_r': round(avg_realized_r, 2),
         'consecutive_wins': max_win_streak,
         'consecutive_losses': max_loss_streak,
         'largest_win': round(largest_win, 2),
         'largest_loss': round(largest_loss, 2)
-    })
+    }
 
 
-@app.route('/api/analytics/by_model', methods=['GET'])
-def get_analytics_by_model():
-    """Get performance analytics aggregated by trading model"""
-    user_id = get_current_user_id()
+# ================== EXPORT ==================
+EXPORT_FORMATS = ('csv', 'ndjson', 'parquet')
+EXPORT_BATCH_SIZE = 5000
+# (column, parquet type) for trade fields, in export order
+EXPORT_TRADE_COLUMNS = (
+    ('id', 'int64'), ('asset', 'string'), ('side', 'string'), ('status', 'string'),
+    ('entry_time', 'string'), ('exit_time', 'string'), ('entry_price', 'float64'), ('exit_price', 'float64'),
+    ('stop_loss', 'float64'), ('take_profit', 'float64'), ('quantity', 'float64'), ('pnl', 'float64'),
+    ('pnl_percentage', 'float64'), ('risk_reward_ratio', 'float64'), ('realized_r', 'float64'),
+    ('holding_seconds', 'float64'), ('notional', 'float64'), ('position_size_pct', 'float64'),
+    ('weekly_bias', 'string'), ('daily_bias', 'string'), ('notes', 'string'), ('external_id', 'string'),
+    ('created_at', 'string')
+)
+EXPORT_DETAIL_COLUMNS = ('key_levels', 'confirmations', 'entries', 'models', 'screenshots')
+EXPORT_LIST_SEPARATOR = '|'
+
+
+def _trade_filter(user_id, args, default_status='closed'):
+    """WHERE conditions and params on trades t for the status, period and analytics filters"""
+    where = ['t.user_id = ?', 't.is_deleted = 0']
+    params = [user_id]
+    status = args.get('status', default_status)
+    if status != 'all':
+        where.append('t.status = ?')
+        params.append(status)
+    period_sql, period_params = _period_condition(
+        args.get('period', 'all'), args.get('start_date'), args.get('end_date'), column='t.entry_time'
+    )
+    if period_sql:
+        where.append(period_sql)
+        params += period_params
+    for key in ANALYTICS_FILTERS:
+        value = args.get(key, 'all')
+        if value != 'all':
+            where.append(f't.{key} = ?')
+            params.append(value)
+    return where, params
+
+
+def _export_query(conn, user_id, args):
+    """SQL and params for the export, honouring the get_trades and analytics filters"""
+    tables = archive_tables(conn, args.get('period', 'all'), args.get('start_date'), args.get('end_date'))
+    details = [
+        f'''(SELECT json_group_array(name) FROM (
+                SELECT g.name FROM {tables[TAG_CATEGORIES[category][0]]} d JOIN tags g ON g.id = d.tag_id
+                WHERE d.trade_id = t.id ORDER BY d.rowid)) AS {key}'''
+        for key, category in TAG_DETAIL_KEYS.items()
+    ]
+    details.append(f'''(SELECT json_group_array(screenshot_url) FROM (
+                SELECT screenshot_url FROM {tables['trade_screenshots']}
+                WHERE trade_id = t.id ORDER BY created_at)) AS screenshots''')
+
+    where, params = _trade_filter(user_id, args)
+    columns = ', '.join(f't.{name}' for name, _ in EXPORT_TRADE_COLUMNS)
+    query = f'''
+        SELECT {columns}, {', '.join(details)}
+        FROM {tables['trades']} t
+        WHERE {' AND '.join(where)}
+        ORDER BY t.entry_time ASC, t.id ASC
+    '''
+    return query, params
+
+
+def _export_batches(user_id, args):
+    """Yield lists of export row dicts, EXPORT_BATCH_SIZE at a time, straight from the cursor"""
+    conn = get_db_connection()
+    try:
+        query, params = _export_query(conn, user_id, args)
+        cursor = conn.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            batch = []
+            for row in rows:
+                record = dict(row)
+                for key in EXPORT_DETAIL_COLUMNS:
+                    record[key] = json.loads(record[key]) if record[key] else []
+                batch.append(record)
+            yield batch
+    finally:
+        conn.close()
 
-    # Get filter parameters
-    asset = request.args.get('asset', 'all')
-    weekly_bias = request.args.get('weekly_bias', 'all')
-    daily_bias = request.args.get('daily_bias', 'all')
-    side = request.args.get('side', 'all')
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def _export_csv(batches):
+    header = [name for name, _ in EXPORT_TRADE_COLUMNS] + list(EXPORT_DETAIL_COLUMNS)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for batch in batches:
+        for record in batch:
+            for key in EXPORT_DETAIL_COLUMNS:
+                record[key] = EXPORT_LIST_SEPARATOR.join(record[key])
+            writer.writerow([record[name] for name in header])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
 
-    # Build dynamic WHERE clause
-    where_conditions = ['t.user_id = ?', 't.status = ?', 't.pnl IS NOT NULL', 't.is_deleted = 0']
-    params = [user_id, 'closed']
 
-    if asset != 'all':
-        where_conditions.append('t.asset = ?')
-        params.append(asset)
-    if weekly_bias != 'all':
-        where_conditions.append('t.weekly_bias = ?')
-        params.append(weekly_bias)
-    if daily_bias != 'all':
-        where_conditions.append('t.daily_bias = ?')
-        params.append(daily_bias)
-    if side != 'all':
-        where_conditions.append('t.side = ?')
-        params.append(side)
+def _export_ndjson(batches):
+    for batch in batches:
+        yield ''.join(json.dumps(record) + '\n' for record in batch)
 
-    where_clause = ' AND '.join(where_conditions)
 
-    cursor.execute(f'''
-        SELECT
-            tm.model,
-            COUNT(DISTINCT t.id) as trade_count,
-            SUM(t.pnl) as total_pnl,
-            AVG(t.pnl) as avg_pnl,
-            COUNT(DISTINCT CASE WHEN t.pnl > 0 THEN t.id END) as wins,
-            COUNT(DISTINCT CASE WHEN t.pnl < 0 THEN t.id END) as losses
-        FROM trades t
-        JOIN trade_models tm ON t.id = tm.trade_id
-        WHERE {where_clause}
-        GROUP BY tm.model
-        ORDER BY total_pnl DESC
-    ''', params)
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object whose written bytes can be drained between row groups"""
 
-    models = cursor.fetchall()
-    conn.close()
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
 
-    results = []
-    for row in models:
-        trade_count = row['trade_count']
-        win_rate = (row['wins'] / trade_count * 100) if trade_count > 0 else 0
-        results.append({
-            'model': row['model'],
-            'trade_count': trade_count,
-            'total_pnl': round(row['total_pnl'], 2),
-            'avg_pnl': round(row['avg_pnl'], 2),
-            'wins': row['wins'],
-            'losses': row['losses'],
-            'win_rate': round(win_rate, 1)
-        })
+    def writable(self):
+        return True
 
-    return jsonify({'models': results})
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
 
+    def tell(self):
+        return self.position
 
-@app.route('/api/analytics/by_confirmation', methods=['GET'])
-def get_analytics_by_confirmation():
-    """Get performance analytics aggregated by confirmation type"""
-    user_id = get_current_user_id()
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
 
-    # Get filter parameters
-    asset = request.args.get('asset', 'all')
-    weekly_bias = request.args.get('weekly_bias', 'all')
-    daily_bias = request.args.get('daily_bias', 'all')
-    side = request.args.get('side', 'all')
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def _export_parquet(batches, pa, pq):
+    schema = pa.schema(
+        [(name, getattr(pa, kind)()) for name, kind in EXPORT_TRADE_COLUMNS]
+        + [(key, pa.list_(pa.string())) for key in EXPORT_DETAIL_COLUMNS]
+    )
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for batch in batches:
+            # One row group per batch, flushed to the client before the next is read
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
 
-    # Build dynamic WHERE clause
-    where_conditions = ['t.user_id = ?', 't.status = ?', 't.pnl IS NOT NULL', 't.is_deleted = 0']
-    params = [user_id, 'closed']
 
-    if asset != 'all':
-        where_conditions.append('t.asset = ?')
-        params.append(asset)
-    if weekly_bias != 'all':
-        where_conditions.append('t.weekly_bias = ?')
-        params.append(weekly_bias)
-    if daily_bias != 'all':
-        where_conditions.append('t.daily_bias = ?')
-        params.append(daily_bias)
-    if side != 'all':
-        where_conditions.append('t.side = ?')
-        params.append(side)
+@app.route('/api/export/trades', methods=['GET'])
+def export_trades():
+    """Stream the current user's trades with their details as CSV, NDJSON or Parquet
 
-    where_clause = ' AND '.join(where_conditions)
+    Query params: format (csv, ndjson or parquet; default csv), status (closed, open or all;
+    default closed), period/start_date/end_date, asset/weekly_bias/daily_bias/side.
+    List details are '|' separated in CSV and arrays in NDJSON and Parquet.
+    """
+    user_id = get_current_user_id()
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'error': f"format must be one of: {', '.join(EXPORT_FORMATS)}"}), 400
 
-    cursor.execute(f'''
-        SELECT
-            tc.confirmation,
-            COUNT(DISTINCT t.id) as trade_count,
-            SUM(t.pnl) as total_pnl,
-            AVG(t.pnl) as avg_pnl,
-            COUNT(DISTINCT CASE WHEN t.pnl > 0 THEN t.id END) as wins,
-            COUNT(DISTINCT CASE WHEN t.pnl < 0 THEN t.id END) as losses
-        FROM trades t
-        JOIN trade_confirmations tc ON t.id = tc.trade_id
-        WHERE {where_clause}
-        GROUP BY tc.confirmation
-        ORDER BY total_pnl DESC
-    ''', params)
+    batches = _export_batches(user_id, request.args.to_dict())
+    filename = f"trades_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    headers = {'Content-Disposition': f'attachment; filename={filename}'}
 
-    confirmations = cursor.fetchall()
-    conn.close()
+    if export_format == 'csv':
+        return Response(_export_csv(batches), mimetype='text/csv', headers=headers)
+    if export_format == 'ndjson':
+        return Response(_export_ndjson(batches), mimetype='application/x-ndjson', headers=headers)
 
-    results = []
-    for row in confirmations:
-        trade_count = row['trade_count']
-        win_rate = (row['wins'] / trade_count * 100) if trade_count > 0 else 0
-        results.append({
-            'confirmation': row['confirmation'],
-            'trade_count': trade_count,
-            'total_pnl': round(row['total_pnl'], 2),
-            'avg_pnl': round(row['avg_pnl'], 2),
-            'wins': row['wins'],
-            'losses': row['losses'],
-            'win_rate': round(win_rate, 1)
-        })
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        return jsonify({'success': False, 'error': 'Parquet export requires pyarrow (pip install pyarrow)'}), 400
+    return Response(_export_parquet(batches, pa, pq), mimetype='application/vnd.apache.parquet', headers=headers)
+
+
+# ================== IMPORT ==================
+IMPORT_FORMATS = ('csv', 'ndjson', 'json')
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_MAX_REPORTED_ERRORS = 200
+IMPORT_NUMERIC_FIELDS = ('entry_price', 'exit_price', 'stop_loss', 'take_profit', 'quantity', 'position_size_pct')
+IMPORT_REQUIRED_FIELDS = ('asset', 'side', 'entry_price', 'quantity', 'entry_time')
+IMPORT_FIELDS = (
+    'asset', 'side', 'status', 'entry_time', 'exit_time', *IMPORT_NUMERIC_FIELDS,
+    'weekly_bias', 'daily_bias', 'notes', 'external_id', *EXPORT_DETAIL_COLUMNS
+)
+# Common broker / spreadsheet column names -> trade field
+IMPORT_ALIASES = {
+    'symbol': 'asset', 'ticker': 'asset', 'pair': 'asset', 'instrument': 'asset',
+    'direction': 'side', 'type': 'side',
+    'entry': 'entry_price', 'open_price': 'entry_price', 'avg_entry_price': 'entry_price',
+    'exit': 'exit_price', 'close_price': 'exit_price', 'avg_exit_price': 'exit_price',
+    'sl': 'stop_loss', 'stop': 'stop_loss', 'tp': 'take_profit', 'target': 'take_profit',
+    'qty': 'quantity', 'size': 'quantity', 'amount': 'quantity',
+    'open_time': 'entry_time', 'opened_at': 'entry_time', 'close_time': 'exit_time', 'closed_at': 'exit_time',
+    'id': 'external_id', 'trade_id': 'external_id', 'order_id': 'external_id',
+    'note': 'notes', 'comment': 'notes',
+}
+IMPORT_SIDES = {'long': 'long', 'buy': 'long', 'short': 'short', 'sell': 'short'}
+IMPORT_BIASES = ('bullish', 'bearish', 'neutral')
+
+
+def _import_format(filename, requested=None):
+    """Import format from an explicit choice or the file extension"""
+    if requested:
+        return requested.lower()
+    extension = (filename or '').rsplit('.', 1)[-1].lower()
+    return {'jsonl': 'ndjson'}.get(extension, extension) if extension in (*IMPORT_FORMATS, 'jsonl') else 'csv'
+
+
+def _read_import_records(stream, import_format, errors):
+    """Yield (row number, raw record dict) from a text stream; parse errors go to errors"""
+    if import_format == 'csv':
+        for number, record in enumerate(csv.DictReader(stream), start=1):
+            yield number, record
+    elif import_format == 'ndjson':
+        number = 0
+        for line in stream:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                errors.append({'row': number, 'field': None, 'error': f'Invalid JSON: {e}'})
+                continue
+            if not isinstance(record, dict):
+                errors.append({'row': number, 'field': None, 'error': 'Each line must be a JSON object'})
+                continue
+            yield number, record
+    else:
+        try:
+            records = json.load(stream)
+        except ValueError as e:
+            errors.append({'row': None, 'field': None, 'error': f'Invalid JSON: {e}'})
+            return
+        if not isinstance(records, list):
+            errors.append({'row': None, 'field': None, 'error': 'JSON import must be an array of trade objects'})
+            return
+        for number, record in enumerate(records, start=1):
+            if not isinstance(record, dict):
+                errors.append({'row': number, 'field': None, 'error': 'Each element must be a JSON object'})
+                continue
+            yield number, record
 
-    return jsonify({'confirmations': results})
 
+def _import_time(value):
+    """ISO 8601 or epoch (seconds or milliseconds) -> 'YYYY-MM-DD HH:MM:SS' UTC"""
+    text = str(value).strip()
+    try:
+        epoch = float(text)
+    except ValueError:
+        parsed = datetime.fromisoformat(text.replace('Z', '+00:00'))
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    else:
+        parsed = datetime.fromtimestamp(epoch / 1000 if epoch > 1e11 else epoch, tz=timezone.utc).replace(tzinfo=None)
+    return parsed.isoformat(sep=' ', timespec='seconds')
+
+
+def _import_list(value):
+    """List detail from a JSON array or a '|' separated string (the CSV export format)"""
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [str(item).strip() for item in value if str(item).strip()]
+    text = str(value).strip()
+    if text.startswith('['):
+        try:
+            return _import_list(json.loads(text))
+        except ValueError:
+            pass
+    return [item.strip() for item in text.split(EXPORT_LIST_SEPARATOR) if item.strip()]
 
-@app.route('/api/analytics/by_entry', methods=['GET'])
-def get_analytics_by_entry():
-    """Get performance analytics aggregated by entry type"""
-    user_id = get_current_user_id()
 
-    # Get filter parameters
-    asset = request.args.get('asset', 'all')
-    weekly_bias = request.args.get('weekly_bias', 'all')
-    daily_bias = request.args.get('daily_bias', 'all')
-    side = request.args.get('side', 'all')
+def _validate_import_record(record, mapping):
+    """Map and validate one raw record; returns (trade dict, [(field, error), ...])"""
+    trade = {}
+    for column, value in record.items():
+        if column is None:
+            continue
+        key = column.strip()
+        field = mapping.get(key) or mapping.get(key.lower())
+        if field is None:
+            normalized = key.lower().replace(' ', '_')
+            field = normalized if normalized in IMPORT_FIELDS else IMPORT_ALIASES.get(normalized)
+        if field in IMPORT_FIELDS and field not in trade:
+            trade[field] = value.strip() if isinstance(value, str) else value
+
+    for field, value in list(trade.items()):
+        if value in ('', None):
+            trade[field] = None
+
+    errors = [(field, 'is required') for field in IMPORT_REQUIRED_FIELDS if trade.get(field) is None]
+
+    if trade.get('side') is not None:
+        side = IMPORT_SIDES.get(str(trade['side']).lower())
+        if side is None:
+            errors.append(('side', f"must be long or short, got {trade['side']!r}"))
+        trade['side'] = side
+
+    for field in IMPORT_NUMERIC_FIELDS:
+        if trade.get(field) is None:
+            continue
+        try:
+            number = float(str(trade[field]).replace(',', ''))
+        except ValueError:
+            errors.append((field, f'must be a number, got {trade[field]!r}'))
+            continue
+        if not np.isfinite(number) or (number <= 0 and field != 'position_size_pct'):
+            errors.append((field, 'must be a positive number'))
+        trade[field] = number
+
+    for field in ('entry_time', 'exit_time'):
+        if trade.get(field) is None:
+            continue
+        try:
+            trade[field] = _import_time(trade[field])
+        except (ValueError, OverflowError, OSError):
+            errors.append((field, f'must be an ISO 8601 time or epoch timestamp, got {trade[field]!r}'))
+
+    for field in ('weekly_bias', 'daily_bias'):
+        bias = str(trade.get(field) or 'neutral').lower()
+        if bias not in IMPORT_BIASES:
+            errors.append((field, f"must be one of: {', '.join(IMPORT_BIASES)}"))
+        trade[field] = bias
+
+    status = str(trade.get('status') or ('closed' if trade.get('exit_price') is not None else 'open')).lower()
+    if status not in ('open', 'closed'):
+        errors.append(('status', 'must be open or closed'))
+    elif status == 'closed' and trade.get('exit_price') is None:
+        errors.append(('exit_price', 'is required for closed trades'))
+    trade['status'] = status
+
+    for key in EXPORT_DETAIL_COLUMNS:
+        trade[key] = _import_list(trade.get(key))
+    if trade.get('external_id') is not None:
+        trade['external_id'] = str(trade['external_id'])
+    trade['notes'] = trade.get('notes') or ''
+    return trade, errors
+
+
+def _import_pnl(trade):
+    """P&L and P&L % exactly as create_trade computes them"""
+    if trade['status'] != 'closed' or trade.get('exit_price') is None:
+        return None, None
+    direction = 1 if trade['side'] == 'long' else -1
+    pnl = (trade['exit_price'] - trade['entry_price']) * trade['quantity'] * direction
+    entry_value = trade['entry_price'] * trade['quantity']
+    return pnl, (pnl / entry_value) * 100 if entry_value > 0 else None
+
+
+def _insert_import_chunk(conn, user_id, trades, tag_cache):
+    """Insert one chunk of validated trades and their details; returns the new trade ids"""
+    pnls = [_import_pnl(trade) for trade in trades]
+    metrics = compute_trade_metrics(
+        [t['entry_price'] for t in trades], [t.get('stop_loss') for t in trades], [t['quantity'] for t in trades],
+        [pnl for pnl, _ in pnls], [t['entry_time'] for t in trades], [t.get('exit_time') for t in trades]
+    )
 
-    conn = get_db_connection()
     cursor = conn.cursor()
+    cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'trades'")
+    first_id = cursor.fetchone()[0] + 1
+    cursor.executemany('''
+        INSERT INTO trades (user_id, asset, side, entry_price, exit_price, stop_loss, take_profit,
+                          quantity, entry_time, exit_time, pnl, pnl_percentage, risk_reward_ratio,
+                          position_size_pct, weekly_bias, daily_bias, notes, status, external_id,
+                          realized_r, holding_seconds, notional)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (
+            user_id, t['asset'], t['side'], t['entry_price'], t.get('exit_price'), t.get('stop_loss'),
+            t.get('take_profit'), t['quantity'], t['entry_time'], t.get('exit_time'), pnl, pnl_percentage,
+            calculate_risk_reward_ratio(t['entry_price'], t.get('stop_loss'), t.get('take_profit'), t['side']),
+            t.get('position_size_pct'), t['weekly_bias'], t['daily_bias'], t['notes'], t['status'],
+            t.get('external_id'), *m
+        )
+        for t, (pnl, pnl_percentage), m in zip(trades, pnls, metrics)
+    ])
+    # The chunk runs under BEGIN IMMEDIATE, so its rows took consecutive ids
+    trade_ids = list(range(first_id, first_id + len(trades)))
+
+    for key, category in TAG_DETAIL_KEYS.items():
+        links = []
+        for trade_id, trade in zip(trade_ids, trades):
+            seen = set()
+            for name in trade[key]:
+                cache_key = (category, name.lower())
+                if cache_key not in tag_cache:
+                    tag_cache[cache_key] = _tag_ids(cursor, user_id, category, [name])[0]
+                if tag_cache[cache_key] not in seen:
+                    seen.add(tag_cache[cache_key])
+                    links.append((trade_id, tag_cache[cache_key]))
+        if links:
+            cursor.executemany(
+                f'INSERT OR IGNORE INTO {TAG_CATEGORIES[category][0]} (trade_id, tag_id) VALUES (?, ?)', links
+            )
+    cursor.executemany(
+        'INSERT INTO trade_screenshots (trade_id, screenshot_url) VALUES (?, ?)',
+        [(trade_id, url) for trade_id, trade in zip(trade_ids, trades) for url in trade['screenshots']]
+    )
+    return trade_ids
 
-    # Build dynamic WHERE clause
-    where_conditions = ['t.user_id = ?', 't.status = ?', 't.pnl IS NOT NULL', 't.is_deleted = 0']
-    params = [user_id, 'closed']
 
-    if asset != 'all':
-        where_conditions.append('t.asset = ?')
-        params.append(asset)
-    if weekly_bias != 'all':
-        where_conditions.append('t.weekly_bias = ?')
-        params.append(weekly_bias)
-    if daily_bias != 'all':
-        where_conditions.append('t.daily_bias = ?')
-        params.append(daily_bias)
-    if side != 'all':
-        where_conditions.append('t.side = ?')
-        params.append(side)
+def import_trades(conn, user_id, records, mapping=None, skip_invalid=False, dry_run=False,
+                  chunk_size=IMPORT_CHUNK_SIZE, errors=None, progress=None):
+    """Validate and insert (row number, record) pairs in chunked transactions
 
-    where_clause = ' AND '.join(where_conditions)
+    Every row is validated before anything is written. Unless skip_invalid is set, any
+    error aborts the import; otherwise invalid rows are reported and the rest imported.
+    Rows whose external_id already exists (for the user or earlier in the file) are skipped.
+    progress, if given, is called with the report after each committed chunk.
+    """
+    mapping = {str(k).strip(): v for k, v in (mapping or {}).items()}
+    errors = errors if errors is not None else []
+    cursor = conn.cursor()
+    cursor.execute(
+        f"SELECT external_id FROM {archive_tables(conn)['trades']} WHERE user_id = ? AND external_id IS NOT NULL",
+        (user_id,)
+    )
+    seen_ids = {row[0] for row in cursor.fetchall()}
+
+    valid, duplicates, total_rows = [], 0, 0
+    for number, record in records:
+        total_rows += 1
+        trade, record_errors = _validate_import_record(record, mapping)
+        if record_errors:
+            errors.extend({'row': number, 'field': field, 'error': message} for field, message in record_errors)
+            continue
+        if trade.get('external_id') is not None:
+            if trade['external_id'] in seen_ids:
+                duplicates += 1
+                continue
+            seen_ids.add(trade['external_id'])
+        valid.append(trade)
+
+    report = {
+        'total_rows': total_rows,
+        'valid_rows': len(valid),
+        'imported': 0,
+        'duplicates': duplicates,
+        'error_count': len(errors),
+        'errors': errors[:IMPORT_MAX_REPORTED_ERRORS],
+        'dry_run': dry_run,
+        'chunks': 0,
+    }
+    if dry_run or (errors and not skip_invalid):
+        return report
 
-    cursor.execute(f'''
-        SELECT
-            te.entry,
-            COUNT(DISTINCT t.id) as trade_count,
-            SUM(t.pnl) as total_pnl,
-            AVG(t.pnl) as avg_pnl,
-            COUNT(DISTINCT CASE WHEN t.pnl > 0 THEN t.id END) as wins,
-            COUNT(DISTINCT CASE WHEN t.pnl < 0 THEN t.id END) as losses
-        FROM trades t
-        JOIN trade_entries te ON t.id = te.trade_id
-        WHERE {where_clause}
-        GROUP BY te.entry
-        ORDER BY total_pnl DESC
-    ''', params)
+    tag_cache = {}
+    for start in range(0, len(valid), chunk_size):
+        chunk = valid[start:start + chunk_size]
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            trade_ids = _insert_import_chunk(conn, user_id, chunk, tag_cache)
+            closed_ids = [i for i, t in zip(trade_ids, chunk) if t['status'] == 'closed']
+            add_trades_to_sketches(conn, user_id, closed_ids)
+            refresh_period_summaries(conn, user_id, _trade_dates(conn, closed_ids))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            tag_cache.clear()
+            raise
+        after_trade_commit(conn, user_id, trade_ids)
+        event_bus.publish(user_id, 'trades', {'source': 'import', 'ids': trade_ids})
+        report['imported'] += len(chunk)
+        report['chunks'] += 1
+        if progress:
+            progress(report)
+    return report
+
+
+@app.route('/api/import/trades', methods=['POST'])
+def import_trades_endpoint():
+    """Bulk import trades from CSV, NDJSON or a JSON array
+
+    Send the file as multipart 'file' or as the raw request body. Query/form params:
+    format (csv, ndjson or json; default from the file extension, else csv), mapping
+    (JSON object of source column -> trade field), skip_invalid and dry_run (true/false).
+    """
+    user_id = get_current_user_id()
+    params = request.values
+    upload = request.files.get('file')
+    import_format = _import_format(upload.filename if upload else None, params.get('format'))
+    if import_format not in IMPORT_FORMATS:
+        return jsonify({'success': False, 'error': f"format must be one of: {', '.join(IMPORT_FORMATS)}"}), 400
+    try:
+        mapping = json.loads(params.get('mapping') or '{}')
+    except ValueError:
+        return jsonify({'success': False, 'error': 'mapping must be a JSON object'}), 400
+    if not isinstance(mapping, dict) or any(field not in IMPORT_FIELDS for field in mapping.values()):
+        return jsonify({'success': False, 'error': f"mapping values must be one of: {', '.join(IMPORT_FIELDS)}"}), 400
+
+    errors = []
+    stream = None
+    conn = get_db_connection()
+    try:
+        if upload:
+            # Werkzeug spools uploads into a SpooledTemporaryFile, which has no readable()
+            # before Python 3.11; copy it into a real file so TextIOWrapper can wrap it
+            spooled = tempfile.TemporaryFile()
+            shutil.copyfileobj(upload.stream, spooled)
+            spooled.seek(0)
+            stream = io.TextIOWrapper(spooled, encoding='utf-8-sig', newline='')
+        else:
+            stream = io.StringIO(request.get_data(as_text=True).lstrip('\ufeff'), newline='')
+        report = import_trades(
+            conn, user_id, _read_import_records(stream, import_format, errors), mapping=mapping,
+            skip_invalid=params.get('skip_invalid', 'false').lower() == 'true',
+            dry_run=params.get('dry_run', 'false').lower() == 'true',
+            errors=errors
+        )
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if stream is not None:
+            stream.close()
+        conn.close()
 
-    entries = cursor.fetchall()
+    if report['error_count'] and not report['imported'] and not report['dry_run']:
+        return jsonify({'success': False, 'error': 'Import has invalid rows; nothing was imported', **report}), 400
+    return jsonify({'success': True, **report})
+
+
+@app.cli.command('import-trades')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user-id', type=int, required=True, help='Owner of the imported trades')
+@click.option('--format', 'import_format', type=click.Choice(IMPORT_FORMATS), default=None,
+              help='Defaults to the file extension')
+@click.option('--mapping', default='{}', help='JSON object of source column -> trade field')
+@click.option('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, show_default=True)
+@click.option('--skip-invalid', is_flag=True, help='Import the valid rows even if some rows fail validation')
+@click.option('--dry-run', is_flag=True, help='Validate only')
+def import_trades_command(path, user_id, import_format, mapping, chunk_size, skip_invalid, dry_run):
+    """Bulk import trades from a CSV, NDJSON or JSON file (no upload size limit)"""
+    def progress(report):
+        click.echo(f"Chunk {report['chunks']}: {report['imported']}/{report['valid_rows']} trade(s) imported")
+
+    errors = []
+    conn = get_db_connection()
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        records = _read_import_records(stream, _import_format(path, import_format), errors)
+        report = import_trades(conn, user_id, records, mapping=json.loads(mapping), skip_invalid=skip_invalid,
+                               dry_run=dry_run, chunk_size=chunk_size, errors=errors, progress=progress)
+    conn.close()
+
+    for error in report['errors']:
+        click.echo(f"Row {error['row']}: {error['field'] or 'record'} {error['error']}", err=True)
+    click.echo(
+        f"{report['total_rows']} row(s): {report['imported']} imported, {report['duplicates']} duplicate(s), "
+        f"{report['error_count']} error(s){' (dry run)' if dry_run else ''}"
+    )
+
+
+# ================== BATCH TRADE MUTATIONS ==================
+# Fields PATCH /api/trades:batch may set; price, quantity and time edits stay per-trade
+BATCH_UPDATE_FIELDS = ('weekly_bias', 'daily_bias', 'notes', 'entry_type', 'stop_loss', 'take_profit',
+                       'position_size_pct')
+# Plus ANALYTICS_FILTERS (defined with the dashboard)
+BATCH_FILTER_KEYS = ('status', 'period', 'start_date', 'end_date')
+
+
+def _batch_trade_ids(conn, user_id, data):
+    """Ids of the user's live trades selected by data['ids'] or data['filter'] (ValueError if invalid)"""
+    ids, filters = data.get('ids'), data.get('filter')
+    if (ids is None) == (filters is None):
+        raise ValueError('Provide either ids or filter')
+
+    if ids is not None:
+        if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            raise ValueError('ids must be a list of trade ids')
+        rows = conn.execute('''
+            SELECT id FROM trades
+            WHERE user_id = ? AND is_deleted = 0 AND id IN (SELECT value FROM json_each(?))
+        ''', (user_id, json.dumps(ids))).fetchall()
+        return [row['id'] for row in rows]
+
+    if not isinstance(filters, dict) or not filters:
+        raise ValueError('filter must be a non-empty object')
+    unknown = set(filters) - set(BATCH_FILTER_KEYS) - set(ANALYTICS_FILTERS)
+    if unknown:
+        raise ValueError(f"Unknown filter keys: {', '.join(sorted(unknown))}")
+    where, params = _trade_filter(user_id, filters, default_status='all')
+    rows = conn.execute(f"SELECT t.id FROM trades t WHERE {' AND '.join(where)}", params).fetchall()
+    return [row['id'] for row in rows]
+
+
+def _batch_updates(data):
+    """Validated (set fields, tags to add, tags to remove) from a PATCH body (ValueError if invalid)"""
+    updates = data.get('set') or {}
+    unknown = set(updates) - set(BATCH_UPDATE_FIELDS)
+    if unknown:
+        raise ValueError(f"Fields cannot be batch updated: {', '.join(sorted(unknown))}")
+    for field in ('weekly_bias', 'daily_bias'):
+        if field in updates and updates[field] not in IMPORT_BIASES:
+            raise ValueError(f"{field} must be one of: {', '.join(IMPORT_BIASES)}")
+    for field in ('stop_loss', 'take_profit', 'position_size_pct'):
+        if updates.get(field) is not None:
+            try:
+                updates[field] = float(updates[field])
+            except (TypeError, ValueError):
+                raise ValueError(f'{field} must be a number or null')
+
+    tag_changes = []
+    for action in ('add_tags', 'remove_tags'):
+        tags = data.get(action) or {}
+        unknown = set(tags) - set(TAG_DETAIL_KEYS)
+        if unknown:
+            raise ValueError(f"{action} keys must be among: {', '.join(TAG_DETAIL_KEYS)}")
+        if not all(isinstance(names, list) for names in tags.values()):
+            raise ValueError(f'{action} values must be lists of names')
+        tag_changes.append({key: [str(n).strip() for n in names if str(n).strip()] for key, names in tags.items()})
+
+    if not updates and not any(tag_changes):
+        raise ValueError('Nothing to change: provide set, add_tags or remove_tags')
+    return updates, tag_changes[0], tag_changes[1]
+
+
+def _recompute_risk_fields(conn, trade_ids):
+    """Refresh risk_reward_ratio and realized_r after stop / target changes"""
+    rows = conn.execute('''
+        SELECT id, side, entry_price, stop_loss, take_profit, quantity, pnl, entry_time, exit_time
+        FROM trades WHERE id IN (SELECT value FROM json_each(?))
+    ''', (json.dumps(trade_ids),)).fetchall()
+    metrics = compute_trade_metrics(
+        [r['entry_price'] for r in rows], [r['stop_loss'] for r in rows], [r['quantity'] for r in rows],
+        [r['pnl'] for r in rows], [r['entry_time'] for r in rows], [r['exit_time'] for r in rows]
+    )
+    conn.executemany(
+        'UPDATE trades SET risk_reward_ratio = ?, realized_r = ?, holding_seconds = ?, notional = ? WHERE id = ?',
+        [
+            (calculate_risk_reward_ratio(r['entry_price'], r['stop_loss'], r['take_profit'], r['side']), *m, r['id'])
+            for r, m in zip(rows, metrics)
+        ]
+    )
+
+
+def _apply_batch(user_id, data, mutate):
+    """Resolve the selected trades and run mutate(conn, ids) in one transaction, then refresh derived data"""
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        trade_ids = _batch_trade_ids(conn, user_id, data)
+        if trade_ids:
+            dates = _trade_dates(conn, trade_ids)
+            mutate(conn, trade_ids)
+            invalidate_trade_sketches(conn, user_id)
+            refresh_period_summaries(conn, user_id, dates)
+        conn.commit()
+    except ValueError as e:
+        conn.rollback()
+        conn.close()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    if trade_ids:
+        after_trade_commit(conn, user_id, trade_ids)
+    conn.close()
+    return jsonify({'success': True, 'matched': len(trade_ids), 'ids': trade_ids})
+
+
+@app.route('/api/trades:batch', methods=['PATCH'])
+def batch_update_trades():
+    """Partially update many trades in one transaction
+
+    Body: ids (list) or filter (status, period/start_date/end_date, asset/side/weekly_bias/daily_bias),
+    plus any of set ({field: value} for BATCH_UPDATE_FIELDS), add_tags and remove_tags
+    ({key_levels|confirmations|entries|models: [names]}).
+    """
+    user_id = get_current_user_id()
+    data = request.get_json(silent=True) or {}
+    try:
+        updates, add_tags, remove_tags = _batch_updates(data)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    def mutate(conn, trade_ids):
+        id_list = json.dumps(trade_ids)
+        if updates:
+            assignments = ', '.join(f'{field} = ?' for field in updates)
+            conn.execute(
+                f'UPDATE trades SET {assignments} WHERE id IN (SELECT value FROM json_each(?))',
+                [*updates.values(), id_list]
+            )
+            if 'stop_loss' in updates or 'take_profit' in updates:
+                _recompute_risk_fields(conn, trade_ids)
+
+        cursor = conn.cursor()
+        for key, names in add_tags.items():
+            table, _ = TAG_CATEGORIES[TAG_DETAIL_KEYS[key]]
+            tag_ids = _tag_ids(cursor, user_id, TAG_DETAIL_KEYS[key], names)
+            cursor.executemany(
+                f'INSERT OR IGNORE INTO {table} (trade_id, tag_id) VALUES (?, ?)',
+                [(trade_id, tag_id) for trade_id in trade_ids for tag_id in tag_ids]
+            )
+        for key, names in remove_tags.items():
+            table, _ = TAG_CATEGORIES[TAG_DETAIL_KEYS[key]]
+            cursor.execute(f'''
+                DELETE FROM {table}
+                WHERE trade_id IN (SELECT value FROM json_each(?))
+                  AND tag_id IN (SELECT id FROM tags WHERE user_id = ? AND category = ?
+                                 AND name IN (SELECT value FROM json_each(?)))
+            ''', (id_list, user_id, TAG_DETAIL_KEYS[key], json.dumps(names)))
+
+    return _apply_batch(user_id, data, mutate)
+
+
+@app.route('/api/trades:batch', methods=['DELETE'])
+def batch_delete_trades():
+    """Soft delete many trades (body: ids or filter, as for PATCH) in one transaction"""
+    user_id = get_current_user_id()
+    data = request.get_json(silent=True) or {}
+
+    def mutate(conn, trade_ids):
+        conn.execute(
+            'UPDATE trades SET is_deleted = 1 WHERE id IN (SELECT value FROM json_each(?))',
+            (json.dumps(trade_ids),)
+        )
+
+    return _apply_batch(user_id, data, mutate)
+
+
+# ================== MONTE CARLO SIMULATION ==================
+MONTE_CARLO_DEFAULT_PATHS = 5000
+MONTE_CARLO_MAX_PATHS = 200000
+MONTE_CARLO_MAX_HORIZON = 5000
+MONTE_CARLO_CHUNK_CELLS = 2_000_000      # paths * horizon simulated per worker task
+MONTE_CARLO_POOL_MIN_CELLS = 4_000_000   # below this a single process is faster than the pool
+MONTE_CARLO_PERCENTILES = (5, 25, 50, 75, 95)
+
+_simulation_pool = None
+
+
+def _get_simulation_pool():
+    """Lazily created process pool shared by all simulation requests
+
+    Workers are spawned, not forked: forking copies a threaded server's held locks into the child.
+    """
+    global _simulation_pool
+    if _simulation_pool is None:
+        _simulation_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1,
+                                               mp_context=multiprocessing.get_context('spawn'))
+        atexit.register(_shutdown_simulation_pool)
+    return _simulation_pool
+
+
+def _shutdown_simulation_pool():
+    global _simulation_pool
+    if _simulation_pool is not None:
+        # cancel_futures is Python 3.9+; on 3.8 queued runs finish before the pool exits
+        kwargs = {'cancel_futures': True} if sys.version_info >= (3, 9) else {}
+        _simulation_pool.shutdown(wait=True, **kwargs)
+        _simulation_pool = None
+
+
+def _simulate_equity_paths(samples, n_paths, horizon, mode, starting_equity, risk_fraction, ruin_level, seed):
+    """Bootstrap n_paths equity paths; returns per-path final equity, max drawdown %, longest underwater run, ruin flag"""
+    rng = np.random.default_rng(seed)
+    draws = rng.choice(samples, size=(n_paths, horizon), replace=True)
+
+    if mode == 'r':
+        equity = starting_equity * np.cumprod(1 + draws * risk_fraction, axis=1)
+    else:
+        equity = starting_equity + np.cumsum(draws, axis=1)
+    del draws
+
+    peak = np.maximum(np.maximum.accumulate(equity, axis=1), starting_equity)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown_pct = np.where(peak > 0, (peak - equity) / peak * 100, 0)
+
+    # Longest run of consecutive trades spent below a prior peak
+    underwater = equity < peak
+    steps = np.arange(horizon)
+    last_high = np.maximum.accumulate(np.where(underwater, -1, steps), axis=1)
+    underwater_run = np.where(underwater, steps - last_high, 0)
+
+    return {
+        'final_equity': equity[:, -1],
+        'max_drawdown_pct': drawdown_pct.max(axis=1),
+        'max_underwater': underwater_run.max(axis=1),
+        'ended_underwater': underwater[:, -1],
+        'ruined': (equity <= ruin_level).any(axis=1),
+    }
+
+
+def _run_monte_carlo(samples, n_paths, horizon, mode, starting_equity, risk_fraction, ruin_level, seed):
+    """Split the simulation into chunks (one child seed each) and fan out to the process pool when large"""
+    chunk_paths = max(1, MONTE_CARLO_CHUNK_CELLS // horizon)
+    chunks = [min(chunk_paths, n_paths - start) for start in range(0, n_paths, chunk_paths)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    args = [(samples, size, horizon, mode, starting_equity, risk_fraction, ruin_level, child)
+            for size, child in zip(chunks, seeds)]
+
+    if len(chunks) > 1 and n_paths * horizon >= MONTE_CARLO_POOL_MIN_CELLS:
+        results = list(_get_simulation_pool().map(_simulate_equity_paths, *zip(*args)))
+    else:
+        results = [_simulate_equity_paths(*a) for a in args]
+
+    return {key: np.concatenate([r[key] for r in results]) for key in results[0]}
+
+
+def _percentiles(values, decimals=2):
+    """Mean plus the standard percentile set of an array"""
+    summary = {'mean': round(float(values.mean()), decimals)}
+    for p, v in zip(MONTE_CARLO_PERCENTILES, np.percentile(values, MONTE_CARLO_PERCENTILES)):
+        summary[f'p{p}'] = round(float(v), decimals)
+    return summary
+
+
+@app.route('/api/monte_carlo', methods=['GET'])
+def get_monte_carlo():
+    """Bootstrap resampled equity paths from closed-trade P&L (mode=pnl) or R-multiples (mode=r)"""
+    user_id = get_current_user_id()
+
+    mode = request.args.get('mode', 'pnl')
+    n_paths = request.args.get('paths', MONTE_CARLO_DEFAULT_PATHS, type=int)
+    horizon = request.args.get('horizon', type=int)
+    seed = request.args.get('seed', type=int)
+    starting_equity = request.args.get('starting_equity', 10000, type=float)
+    risk_pct = request.args.get('risk_pct', 1.0, type=float)
+    ruin_pct = request.args.get('ruin_pct', 50.0, type=float)
+
+    if mode not in ('pnl', 'r'):
+        return jsonify({'success': False, 'error': "mode must be 'pnl' or 'r'"}), 400
+    if not 1 <= n_paths <= MONTE_CARLO_MAX_PATHS:
+        return jsonify({'success': False, 'error': f'paths must be between 1 and {MONTE_CARLO_MAX_PATHS}'}), 400
+    if starting_equity <= 0:
+        return jsonify({'success': False, 'error': 'starting_equity must be positive'}), 400
+    # Risking more than the whole account per trade would turn compounded equity negative
+    if not 0 < risk_pct <= 100 or not 0 < ruin_pct <= 100:
+        return jsonify({'success': False, 'error': 'risk_pct and ruin_pct must be in (0, 100]'}), 400
+    if seed is not None and seed < 0:
+        return jsonify({'success': False, 'error': 'seed must be a non-negative integer'}), 400
+
+    trades = _closed_trade_series(user_id)
+    if mode == 'r':
+        samples = [t['realized_r'] for t in trades if t['realized_r'] is not None]
+    else:
+        samples = [t['pnl'] for t in trades]
+
+    if len(samples) < 2:
+        return jsonify({
+            'success': False,
+            'error': 'At least 2 closed trades' + (' with a stop loss' if mode == 'r' else '') + ' are required'
+        }), 400
+
+    horizon = horizon or len(samples)
+    if not 1 <= horizon <= MONTE_CARLO_MAX_HORIZON:
+        return jsonify({'success': False, 'error': f'horizon must be between 1 and {MONTE_CARLO_MAX_HORIZON}'}), 400
+
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % (2 ** 32))
+
+    ruin_level = starting_equity * (1 - ruin_pct / 100)
+    result = _run_monte_carlo(
+        np.asarray(samples, dtype=np.float64), n_paths, horizon, mode,
+        starting_equity, risk_pct / 100, ruin_level, seed
+    )
+
+    return jsonify({
+        'success': True,
+        'mode': mode,
+        'paths': n_paths,
+        'horizon': horizon,
+        'sample_size': len(samples),
+        'seed': seed,
+        'starting_equity': starting_equity,
+        'final_equity': _percentiles(result['final_equity']),
+        'max_drawdown_pct': _percentiles(result['max_drawdown_pct']),
+        'risk_of_ruin': round(float(result['ruined'].mean() * 100), 2),
+        'probability_of_profit': round(float((result['final_equity'] > starting_equity).mean() * 100), 2),
+        'time_to_recovery': {
+            'longest_underwater_trades': _percentiles(result['max_underwater'], 1),
+            'unrecovered_pct': round(float(result['ended_underwater'].mean() * 100), 2)
+        }
+    })
+
+
+# ================== EQUITY CURVE ==================
+EQUITY_CURVE_DEFAULT_POINTS = 500
+EQUITY_CURVE_MAX_POINTS = 5000
+
+
+def _lttb_indices(x, y, threshold):
+    """Largest-Triangle-Three-Buckets: indices of the points to keep (first and last always kept)"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    # Interior points are split into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = 0
+
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+
+        # Average of the next bucket (or the last point for the final bucket)
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        ax, ay = x[selected], y[selected]
+        bx, by = x[start:end], y[start:end]
+        areas = np.abs((ax - avg_x) * (by - ay) - (ax - bx) * (avg_y - ay))
+
+        selected = start + int(np.argmax(areas))
+        indices[i + 1] = selected
+
+    return indices
+
+
+def _equity_curve(pnls):
+    """Cumulative P&L and drawdown (distance below running peak) arrays"""
+    equity = np.cumsum(np.asarray(pnls, dtype=np.float64))
+    peak = np.maximum.accumulate(np.maximum(equity, 0))
+    drawdown = peak - equity
+    return equity, drawdown
+
+
+def _downsample_equity_curve(equity, drawdown, points):
+    """Pick at most `points` indices via LTTB while always keeping the drawdown extremes"""
+    n = len(equity)
+    if n <= points:
+        return np.arange(n)
+
+    # Max drawdown trough, the peak it fell from, and the overall high / low of the curve
+    trough = int(np.argmax(drawdown))
+    peak = int(np.argmax(equity[:trough + 1]))
+    # Ordered by priority: a tiny budget keeps only the leading ones
+    forced = list(dict.fromkeys([0, n - 1, trough, peak, int(np.argmax(equity)), int(np.argmin(equity))]))
+
+    # LTTB already keeps the endpoints, so only the interior extremes cost extra budget
+    budget = points - (len(forced) - 2)
+    if budget < 3:
+        return np.unique(np.asarray(forced[:points], dtype=np.int64))
+
+    x = np.arange(n, dtype=np.float64)
+    kept = _lttb_indices(x, equity, budget)
+    return np.unique(np.concatenate([kept, np.asarray(forced, dtype=np.int64)]))
+
+
+def _equity_curve_payload(trades, points):
+    """Downsampled equity curve response for trades ordered by entry_time ascending"""
+    if not trades:
+        return {
+            'time': [],
+            'equity': [],
+            'drawdown': [],
+            'source_points': 0,
+            'max_drawdown': 0,
+            'max_drawdown_time': None
+        }
+
+    equity, drawdown = _equity_curve([t['pnl'] for t in trades])
+    keep = _downsample_equity_curve(equity, drawdown, points)
+    trough = int(np.argmax(drawdown))
+
+    return {
+        'time': [trades[i]['entry_time'] for i in keep],
+        'equity': np.round(equity[keep], 2).tolist(),
+        'drawdown': np.round(drawdown[keep], 2).tolist(),
+        'source_points': len(trades),
+        'max_drawdown': round(float(drawdown[trough]), 2),
+        'max_drawdown_time': trades[trough]['entry_time'] if drawdown[trough] > 0 else None
+    }
+
+
+@app.route('/api/equity_curve', methods=['GET'])
+def get_equity_curve():
+    """Cumulative P&L and drawdown series, downsampled to a point budget"""
+    user_id = get_current_user_id()
+
+    period = request.args.get('period', 'all')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    points = request.args.get('points', EQUITY_CURVE_DEFAULT_POINTS, type=int)
+    points = max(3, min(points, EQUITY_CURVE_MAX_POINTS))
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    query = f'''
+        SELECT entry_time, pnl
+        FROM {archive_tables(conn, period, start_date, end_date)['trades']}
+        WHERE user_id = ? AND status = 'closed' AND pnl IS NOT NULL AND is_deleted = 0
+    '''
+    params = [user_id]
+
+    period_sql, period_params = _period_condition(period, start_date, end_date)
+    if period_sql:
+        query += " AND " + period_sql
+        params.extend(period_params)
+    query += " ORDER BY entry_time ASC, id ASC"
+
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    conn.close()
+
+    return jsonify(_equity_curve_payload(rows, points))
+
+
+# ================== ROLLING METRICS ==================
+ROLLING_DEFAULT_WINDOW = 20
+ROLLING_DEFAULT_DAYS = 30
+ROLLING_MAX_POINTS = 5000
+
+
+def _window_sums(values, window):
+    """Sum of every trailing window of `window` elements via a cumulative sum (length n - window + 1)"""
+    totals = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    return totals[window:] - totals[:-window]
+
+
+def _rolling_components(pnl, r_multiples):
+    """Per-trade additive terms whose window sums give every rolling metric (r_multiples is NaN where unknown)"""
+    has_r = ~np.isnan(r_multiples)
+    return {
+        'count': np.ones_like(pnl),
+        'wins': (pnl > 0).astype(np.float64),
+        'pnl': pnl,
+        'gross_win': np.where(pnl > 0, pnl, 0),
+        'gross_loss': np.where(pnl < 0, -pnl, 0),
+        'squares': pnl * pnl,
+        'r_total': np.where(has_r, r_multiples, 0),
+        'r_count': has_r.astype(np.float64),
+    }
+
+
+def _rolling_stats(sums):
+    """Win rate, expectancy, profit factor, average R and P&L volatility from window sums (NaN for empty windows)"""
+    count = sums['count']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = (sums['squares'] - sums['pnl'] ** 2 / count) / (count - 1)
+        return {
+            'win_rate': np.where(count > 0, sums['wins'] / count * 100, np.nan),
+            'expectancy': np.where(count > 0, sums['pnl'] / count, np.nan),
+            'profit_factor': np.where(sums['gross_loss'] > 0, sums['gross_win'] / sums['gross_loss'],
+                                      np.where(count > 0, 0, np.nan)),
+            'avg_r': np.where(sums['r_count'] > 0, sums['r_total'] / sums['r_count'], np.nan),
+            'volatility': np.where(count > 1, np.sqrt(np.clip(variance, 0, None)), np.nan),
+        }
+
+
+def _series_to_list(values, decimals=2):
+    """Rounded JSON-ready list with NaN mapped to null"""
+    rounded = np.round(np.asarray(values, dtype=np.float64), decimals)
+    return [None if np.isnan(v) else float(v) for v in rounded]
+
+
+def _even_indices(n, points):
+    """At most `points` evenly spaced indices over range(n), always including the last"""
+    if n <= points:
+        return np.arange(n)
+    return np.unique(np.linspace(0, n - 1, points).round().astype(np.int64))
+
+
+@app.route('/api/rolling_metrics', methods=['GET'])
+def get_rolling_metrics():
+    """Rolling N-trade and N-day win rate, expectancy, profit factor, average R and volatility"""
+    user_id = get_current_user_id()
+
+    window = request.args.get('window', ROLLING_DEFAULT_WINDOW, type=int)
+    days = request.args.get('days', ROLLING_DEFAULT_DAYS, type=int)
+    points = request.args.get('points', EQUITY_CURVE_DEFAULT_POINTS, type=int)
+    points = max(2, min(points, ROLLING_MAX_POINTS))
+
+    if window < 1 or days < 1:
+        return jsonify({'success': False, 'error': 'window and days must be at least 1'}), 400
+
+    trades = _closed_trade_series(user_id)
+    # entry_time is stored as typed; trades whose time does not parse are left out
+    entry_ms = _epoch_ms([t['entry_time'] for t in trades], wall_clock=True)
+    parsed = ~np.isnan(entry_ms)
+    trades = [t for t, ok in zip(trades, parsed) if ok]
+    entry_ms = entry_ms[parsed]
+    metrics = ('win_rate', 'expectancy', 'profit_factor', 'avg_r', 'volatility')
+
+    result = {
+        'window': window,
+        'days': days,
+        'source_points': len(trades),
+        'by_trades': {'time': [], **{m: [] for m in metrics}},
+        'by_days': {'date': [], 'trade_count': [], **{m: [] for m in metrics}}
+    }
+    if not trades:
+        return jsonify(result)
+
+    pnl = np.array([t['pnl'] for t in trades], dtype=np.float64)
+    r_multiples = np.array([t['realized_r'] for t in trades], dtype=np.float64)
+    components = _rolling_components(pnl, r_multiples)
+
+    # N-trade windows: one value per trade once the first full window is available
+    if len(trades) >= window:
+        stats = _rolling_stats({name: _window_sums(v, window) for name, v in components.items()})
+        keep = _even_indices(len(trades) - window + 1, points)
+        result['by_trades'] = {
+            'time': [trades[i + window - 1]['entry_time'] for i in keep],
+            **{m: _series_to_list(stats[m][keep]) for m in metrics}
+        }
+
+    # N-day windows: accumulate trades onto a dense daily grid (front-padded so the first
+    # calendar day already has a full window), then roll over calendar days
+    trade_days = (entry_ms // (24 * 3600 * 1000)).astype(np.int64).astype('datetime64[D]')
+    first_day = trade_days.min()
+    day_index = (trade_days - first_day).astype(np.int64)
+    n_days = int(day_index.max()) + 1
+
+    sums = {}
+    for name, values in components.items():
+        grid = np.zeros(n_days + days - 1)
+        np.add.at(grid, day_index + days - 1, values)
+        sums[name] = _window_sums(grid, days)
+    stats = _rolling_stats(sums)
+
+    keep = _even_indices(n_days, points)
+    result['by_days'] = {
+        'date': [str(first_day + int(i)) for i in keep],
+        'trade_count': sums['count'][keep].round().astype(np.int64).tolist(),
+        **{m: _series_to_list(stats[m][keep]) for m in metrics}
+    }
+
+    return jsonify(result)
+
+
+@app.route('/api/analytics/by_model', methods=['GET'])
+def get_analytics_by_model():
+    """Get performance analytics aggregated by trading model"""
+    user_id = get_current_user_id()
+
+    # Get filter parameters
+    asset = request.args.get('asset', 'all')
+    weekly_bias = request.args.get('weekly_bias', 'all')
+    daily_bias = request.args.get('daily_bias', 'all')
+    side = request.args.get('side', 'all')
+
+    columns = trade_cache.get(user_id)
+    if columns is not None:
+        filters = {'asset': asset, 'weekly_bias': weekly_bias, 'daily_bias': daily_bias, 'side': side}
+        return jsonify({'models': columns.group_analytics('by_model', filters)})
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    # Build dynamic WHERE clause
+    where_conditions = ['t.user_id = ?', 't.status = ?', 't.pnl IS NOT NULL', 't.is_deleted = 0']
+    params = [user_id, 'closed']
+
+    if asset != 'all':
+        where_conditions.append('t.asset = ?')
+        params.append(asset)
+    if weekly_bias != 'all':
+        where_conditions.append('t.weekly_bias = ?')
+        params.append(weekly_bias)
+    if daily_bias != 'all':
+        where_conditions.append('t.daily_bias = ?')
+        params.append(daily_bias)
+    if side != 'all':
+        where_conditions.append('t.side = ?')
+        params.append(side)
+
+    where_clause = ' AND '.join(where_conditions)
+    tables = archive_tables(conn)
+
+    cursor.execute(f'''
+        SELECT
+            g.name as model,
+            COUNT(DISTINCT t.id) as trade_count,
+            SUM(t.pnl) as total_pnl,
+            AVG(t.pnl) as avg_pnl,
+            COUNT(DISTINCT CASE WHEN t.pnl > 0 THEN t.id END) as wins,
+            COUNT(DISTINCT CASE WHEN t.pnl < 0 THEN t.id END) as losses
+        FROM {tables['trades']} t
+        JOIN {tables['trade_models']} tm ON t.id = tm.trade_id
+        JOIN tags g ON g.id = tm.tag_id
+        WHERE {where_clause}
+        GROUP BY tm.tag_id
+        ORDER BY total_pnl DESC
+    ''', params)
+
+    models = cursor.fetchall()
     conn.close()
 
     results = []
-    for row in entries:
+    for row in models:
         trade_count = row['trade_count']
         win_rate = (row['wins'] / trade_count * 100) if trade_count > 0 else 0
         results.append({
-            'entry': row['entry'],
+            'model': row['model'],
             'trade_count': trade_count,
             'total_pnl': round(row['total_pnl'], 2),
             'avg_pnl': round(row['avg_pnl'], 2),
@@ -1871,12 +3752,12 @@ def get_analytics_by_entry():
             'win_rate': round(win_rate, 1)
         })
 
-    return jsonify({'entries': results})
+    return jsonify({'models': results})
 
 
-@app.route('/api/analytics/by_key_level', methods=['GET'])
-def get_analytics_by_key_level():
-    """Get performance analytics aggregated by key level"""
+@app.route('/api/analytics/by_confirmation', methods=['GET'])
+def get_analytics_by_confirmation():
+    """Get performance analytics aggregated by confirmation type"""
     user_id = get_current_user_id()
 
     # Get filter parameters
@@ -1885,6 +3766,11 @@ def get_analytics_by_key_level():
     daily_bias = request.args.get('daily_bias', 'all')
     side = request.args.get('side', 'all')
 
+    columns = trade_cache.get(user_id)
+    if columns is not None:
+        filters = {'asset': asset, 'weekly_bias': weekly_bias, 'daily_bias': daily_bias, 'side': side}
+        return jsonify({'confirmations': columns.group_analytics('by_confirmation', filters)})
+
     conn = get_db_connection()
     cursor = conn.cursor()
 
@@ -1906,31 +3792,33 @@ def get_analytics_by_key_level():
         params.append(side)
 
     where_clause = ' AND '.join(where_conditions)
+    tables = archive_tables(conn)
 
     cursor.execute(f'''
         SELECT
-            tkl.level,
+            g.name as confirmation,
             COUNT(DISTINCT t.id) as trade_count,
             SUM(t.pnl) as total_pnl,
             AVG(t.pnl) as avg_pnl,
             COUNT(DISTINCT CASE WHEN t.pnl > 0 THEN t.id END) as wins,
             COUNT(DISTINCT CASE WHEN t.pnl < 0 THEN t.id END) as losses
-        FROM trades t
-        JOIN trade_key_levels tkl ON t.id = tkl.trade_id
+        FROM {tables['trades']} t
+        JOIN {tables['trade_confirmations']} tc ON t.id = tc.trade_id
+        JOIN tags g ON g.id = tc.tag_id
         WHERE {where_clause}
-        GROUP BY tkl.level
+        GROUP BY tc.tag_id
         ORDER BY total_pnl DESC
     ''', params)
 
-    key_levels = cursor.fetchall()
+    confirmations = cursor.fetchall()
     conn.close()
 
     results = []
-    for row in key_levels:
+    for row in confirmations:
         trade_count = row['trade_count']
         win_rate = (row['wins'] / trade_count * 100) if trade_count > 0 else 0
         results.append({
-            'level': row['level'],
+            'confirmation': row['confirmation'],
             'trade_count': trade_count,
             'total_pnl': round(row['total_pnl'], 2),
             'avg_pnl': round(row['avg_pnl'], 2),
@@ -1939,33 +3827,332 @@ def get_analytics_by_key_level():
             'win_rate': round(win_rate, 1)
         })
 
-    return jsonify({'key_levels': results})
+    return jsonify({'confirmations': results})
 
 
-@app.route('/api/time_analytics', methods=['GET'])
-def get_time_analytics():
-    """Get performance by hour and day of week"""
+@app.route('/api/analytics/by_entry', methods=['GET'])
+def get_analytics_by_entry():
+    """Get performance analytics aggregated by entry type"""
     user_id = get_current_user_id()
+
+    # Get filter parameters
+    asset = request.args.get('asset', 'all')
+    weekly_bias = request.args.get('weekly_bias', 'all')
+    daily_bias = request.args.get('daily_bias', 'all')
+    side = request.args.get('side', 'all')
+
+    columns = trade_cache.get(user_id)
+    if columns is not None:
+        filters = {'asset': asset, 'weekly_bias': weekly_bias, 'daily_bias': daily_bias, 'side': side}
+        return jsonify({'entries': columns.group_analytics('by_entry', filters)})
+
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    cursor.execute('''
-        SELECT entry_time, pnl
-        FROM trades
-        WHERE user_id = ? AND status = 'closed' AND pnl IS NOT NULL AND is_deleted = 0
-    ''', (user_id,))
+    # Build dynamic WHERE clause
+    where_conditions = ['t.user_id = ?', 't.status = ?', 't.pnl IS NOT NULL', 't.is_deleted = 0']
+    params = [user_id, 'closed']
 
-    trades = cursor.fetchall()
-    conn.close()
+    if asset != 'all':
+        where_conditions.append('t.asset = ?')
+        params.append(asset)
+    if weekly_bias != 'all':
+        where_conditions.append('t.weekly_bias = ?')
+        params.append(weekly_bias)
+    if daily_bias != 'all':
+        where_conditions.append('t.daily_bias = ?')
+        params.append(daily_bias)
+    if side != 'all':
+        where_conditions.append('t.side = ?')
+        params.append(side)
 
-    # Initialize hour and day stats
-    hour_stats = {str(i): {'total_pnl': 0, 'count': 0, 'wins': 0} for i in range(24)}
-    day_stats = {str(i): {'total_pnl': 0, 'count': 0, 'wins': 0} for i in range(7)}  # 0=Monday, 6=Sunday
+    where_clause = ' AND '.join(where_conditions)
+    tables = archive_tables(conn)
 
-    for trade in trades:
-        try:
-            dt = datetime.fromisoformat(trade['entry_time'].replace('Z', '+00:00'))
-            hour = str(dt.hour)
+    cursor.execute(f'''
+        SELECT
+            g.name as entry,
+            COUNT(DISTINCT t.id) as trade_count,
+            SUM(t.pnl) as total_pnl,
+            AVG(t.pnl) as avg_pnl,
+            COUNT(DISTINCT CASE WHEN t.pnl > 0 THEN t.id END) as wins,
+            COUNT(DISTINCT CASE WHEN t.pnl < 0 THEN t.id END) as losses
+        FROM {tables['trades']} t
+        JOIN {tables['trade_entries']} te ON t.id = te.trade_id
+        JOIN tags g ON g.id = te.tag_id
+        WHERE {where_clause}
+        GROUP BY te.tag_id
+        ORDER BY total_pnl DESC
+    ''', params)
+
+    entries = cursor.fetchall()
+    conn.close()
+
+    results = []
+    for row in entries:
+        trade_count = row['trade_count']
+        win_rate = (row['wins'] / trade_count * 100) if trade_count > 0 else 0
+        results.append({
+            'entry': row['entry'],
+            'trade_count': trade_count,
+            'total_pnl': round(row['total_pnl'], 2),
+            'avg_pnl': round(row['avg_pnl'], 2),
+            'wins': row['wins'],
+            'losses': row['losses'],
+            'win_rate': round(win_rate, 1)
+        })
+
+    return jsonify({'entries': results})
+
+
+@app.route('/api/analytics/by_key_level', methods=['GET'])
+def get_analytics_by_key_level():
+    """Get performance analytics aggregated by key level"""
+    user_id = get_current_user_id()
+
+    # Get filter parameters
+    asset = request.args.get('asset', 'all')
+    weekly_bias = request.args.get('weekly_bias', 'all')
+    daily_bias = request.args.get('daily_bias', 'all')
+    side = request.args.get('side', 'all')
+
+    columns = trade_cache.get(user_id)
+    if columns is not None:
+        filters = {'asset': asset, 'weekly_bias': weekly_bias, 'daily_bias': daily_bias, 'side': side}
+        return jsonify({'key_levels': columns.group_analytics('by_key_level', filters)})
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    # Build dynamic WHERE clause
+    where_conditions = ['t.user_id = ?', 't.status = ?', 't.pnl IS NOT NULL', 't.is_deleted = 0']
+    params = [user_id, 'closed']
+
+    if asset != 'all':
+        where_conditions.append('t.asset = ?')
+        params.append(asset)
+    if weekly_bias != 'all':
+        where_conditions.append('t.weekly_bias = ?')
+        params.append(weekly_bias)
+    if daily_bias != 'all':
+        where_conditions.append('t.daily_bias = ?')
+        params.append(daily_bias)
+    if side != 'all':
+        where_conditions.append('t.side = ?')
+        params.append(side)
+
+    where_clause = ' AND '.join(where_conditions)
+    tables = archive_tables(conn)
+
+    cursor.execute(f'''
+        SELECT
+            g.name as level,
+            COUNT(DISTINCT t.id) as trade_count,
+            SUM(t.pnl) as total_pnl,
+            AVG(t.pnl) as avg_pnl,
+            COUNT(DISTINCT CASE WHEN t.pnl > 0 THEN t.id END) as wins,
+            COUNT(DISTINCT CASE WHEN t.pnl < 0 THEN t.id END) as losses
+        FROM {tables['trades']} t
+        JOIN {tables['trade_key_levels']} tkl ON t.id = tkl.trade_id
+        JOIN tags g ON g.id = tkl.tag_id
+        WHERE {where_clause}
+        GROUP BY tkl.tag_id
+        ORDER BY total_pnl DESC
+    ''', params)
+
+    key_levels = cursor.fetchall()
+    conn.close()
+
+    results = []
+    for row in key_levels:
+        trade_count = row['trade_count']
+        win_rate = (row['wins'] / trade_count * 100) if trade_count > 0 else 0
+        results.append({
+            'level': row['level'],
+            'trade_count': trade_count,
+            'total_pnl': round(row['total_pnl'], 2),
+            'avg_pnl': round(row['avg_pnl'], 2),
+            'wins': row['wins'],
+            'losses': row['losses'],
+            'win_rate': round(win_rate, 1)
+        })
+
+    return jsonify({'key_levels': results})
+
+
+ASSET_CORRELATION_MIN_DAYS = 5
+ASSET_CORRELATION_TOP_PAIRS = 10
+
+
+@app.route('/api/analytics/by_asset', methods=['GET'])
+def get_analytics_by_asset():
+    """Per-symbol performance plus the correlation of daily P&L between symbols
+
+    Query params: weekly_bias/daily_bias/side (as the other breakdowns), period/start_date/end_date,
+    min_days (active trading days a symbol needs to enter the correlation matrix, default 5).
+    """
+    user_id = get_current_user_id()
+    min_days = max(2, request.args.get('min_days', ASSET_CORRELATION_MIN_DAYS, type=int))
+
+    where_conditions = ['user_id = ?', "status = 'closed'", 'pnl IS NOT NULL', 'is_deleted = 0']
+    params = [user_id]
+    for key in ('weekly_bias', 'daily_bias', 'side'):
+        value = request.args.get(key, 'all')
+        if value != 'all':
+            where_conditions.append(f'{key} = ?')
+            params.append(value)
+    period_sql, period_params = _period_condition(
+        request.args.get('period', 'all'), request.args.get('start_date'), request.args.get('end_date')
+    )
+    if period_sql:
+        where_conditions.append(period_sql)
+        params += period_params
+    where_clause = ' AND '.join(where_conditions)
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    trades_table = archive_tables(
+        conn, request.args.get('period', 'all'), request.args.get('start_date'), request.args.get('end_date')
+    )['trades']
+
+    cursor.execute(f'''
+        SELECT
+            asset,
+            COUNT(*) as trade_count,
+            SUM(pnl) as total_pnl,
+            AVG(pnl) as avg_pnl,
+            SUM(CASE WHEN pnl > 0 THEN 1 ELSE 0 END) as wins,
+            SUM(CASE WHEN pnl < 0 THEN 1 ELSE 0 END) as losses,
+            SUM(CASE WHEN pnl > 0 THEN pnl ELSE 0 END) as gross_profit,
+            SUM(CASE WHEN pnl < 0 THEN -pnl ELSE 0 END) as gross_loss,
+            MAX(pnl) as largest_win,
+            MIN(pnl) as largest_loss,
+            AVG(realized_r) as avg_realized_r,
+            SUM(notional) as total_notional,
+            COUNT(DISTINCT DATE(entry_time)) as trading_days
+        FROM {trades_table}
+        WHERE {where_clause}
+        GROUP BY asset
+        ORDER BY total_pnl DESC
+    ''', params)
+    asset_rows = cursor.fetchall()
+
+    cursor.execute(f'''
+        SELECT DATE(entry_time) as trade_date, asset, SUM(pnl) as daily_pnl
+        FROM {trades_table}
+        WHERE {where_clause}
+        GROUP BY trade_date, asset
+    ''', params)
+    daily_rows = cursor.fetchall()
+    conn.close()
+
+    assets = []
+    for row in asset_rows:
+        trade_count = row['trade_count']
+        assets.append({
+            'asset': row['asset'],
+            'trade_count': trade_count,
+            'total_pnl': round(row['total_pnl'], 2),
+            'avg_pnl': round(row['avg_pnl'], 2),
+            'wins': row['wins'],
+            'losses': row['losses'],
+            'win_rate': round(row['wins'] / trade_count * 100, 1),
+            'profit_factor': round(row['gross_profit'] / row['gross_loss'], 2) if row['gross_loss'] else None,
+            'largest_win': round(max(row['largest_win'], 0), 2),
+            'largest_loss': round(min(row['largest_loss'], 0), 2),
+            'avg_realized_r': round(row['avg_realized_r'], 2) if row['avg_realized_r'] is not None else None,
+            'total_notional': round(row['total_notional'] or 0, 2),
+            'trading_days': row['trading_days']
+        })
+
+    return jsonify({
+        'assets': assets,
+        'correlation': _daily_pnl_correlation(daily_rows, min_days)
+    })
+
+
+def _daily_pnl_correlation(daily_rows, min_days):
+    """Pearson correlation of daily P&L between symbols over the days the book traded
+
+    Rows are (trade_date, asset, daily_pnl); a symbol that did not trade on a day contributes 0
+    that day. Symbols with fewer than min_days active days are left out.
+    """
+    dates, date_index = np.unique([row['trade_date'] for row in daily_rows], return_inverse=True)
+    symbols, asset_index = np.unique([row['asset'] for row in daily_rows], return_inverse=True)
+
+    active_days = np.bincount(asset_index, minlength=len(symbols))
+    keep = np.flatnonzero(active_days >= min_days)
+    if len(keep) < 2 or len(dates) < 2:
+        return {'assets': [str(symbols[i]) for i in keep], 'days': len(dates), 'matrix': [],
+                'average_correlation': None, 'top_pairs': []}
+
+    pivot = np.zeros((len(dates), len(symbols)))
+    pivot[date_index, asset_index] = [row['daily_pnl'] for row in daily_rows]
+    pivot = pivot[:, keep]
+
+    centered = pivot - pivot.mean(axis=0)
+    norms = np.sqrt((centered ** 2).sum(axis=0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scaled = centered / norms
+    matrix = np.clip(scaled.T @ scaled, -1, 1)
+    # Symbols with constant daily P&L have no defined correlation
+    matrix[norms == 0, :] = np.nan
+    matrix[:, norms == 0] = np.nan
+
+    upper_i, upper_j = np.triu_indices(len(keep), k=1)
+    pair_values = matrix[upper_i, upper_j]
+    defined = np.flatnonzero(~np.isnan(pair_values))
+    strongest = defined[np.argsort(-np.abs(pair_values[defined]), kind='stable')[:ASSET_CORRELATION_TOP_PAIRS]]
+
+    kept_symbols = [str(symbols[i]) for i in keep]
+    return {
+        'assets': kept_symbols,
+        'days': len(dates),
+        'matrix': [[None if np.isnan(v) else round(float(v), 3) for v in row] for row in matrix],
+        'average_correlation': round(float(pair_values[defined].mean()), 3) if len(defined) else None,
+        'top_pairs': [
+            {
+                'assets': [kept_symbols[upper_i[k]], kept_symbols[upper_j[k]]],
+                'correlation': round(float(pair_values[k]), 3)
+            }
+            for k in strongest
+        ]
+    }
+
+
+@app.route('/api/time_analytics', methods=['GET'])
+def get_time_analytics():
+    """Get performance by hour and day of week"""
+    user_id = get_current_user_id()
+    columns = trade_cache.get(user_id)
+    if columns is not None:
+        return jsonify(columns.time_analytics())
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(f'''
+        SELECT entry_time, pnl
+        FROM {archive_tables(conn)['trades']}
+        WHERE user_id = ? AND status = 'closed' AND pnl IS NOT NULL AND is_deleted = 0
+    ''', (user_id,))
+
+    trades = cursor.fetchall()
+    conn.close()
+
+    return jsonify(_time_analytics(trades))
+
+
+def _time_analytics(trades):
+    """P&L, count and win rate per entry hour and weekday"""
+    # Initialize hour and day stats
+    hour_stats = {str(i): {'total_pnl': 0, 'count': 0, 'wins': 0} for i in range(24)}
+    day_stats = {str(i): {'total_pnl': 0, 'count': 0, 'wins': 0} for i in range(7)}  # 0=Monday, 6=Sunday
+
+    for trade in trades:
+        try:
+            dt = datetime.fromisoformat(trade['entry_time'].replace('Z', '+00:00'))
+            hour = str(dt.hour)
             day = str(dt.weekday())
 
             pnl = trade['pnl']
@@ -2001,12 +4188,1703 @@ def get_time_analytics():
             day_stats[day]['avg_pnl'] = 0
             day_stats[day]['win_rate'] = 0
 
-    return jsonify({
+    return {
         'by_hour': hour_stats,
         'by_day': day_stats
+    }
+
+
+# ================== MARKET DATA (KLINE CACHE) ==================
+MARKET_DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'market_data')
+KLINE_CATEGORY = 'linear'
+KLINE_PAGE_LIMIT = 1000
+KLINE_DEFAULT_INTERVAL = '15'
+KLINE_INTERVAL_MS = {
+    **{minutes: int(minutes) * 60 * 1000 for minutes in ('1', '3', '5', '15', '30', '60', '120', '240', '360', '720')},
+    'D': 24 * 60 * 60 * 1000
+}
+# One little-endian binary file per column; each fetch is appended in open_time order
+KLINE_COLUMNS = (
+    ('open_time', np.dtype('<i8')),
+    ('open', np.dtype('<f8')),
+    ('high', np.dtype('<f8')),
+    ('low', np.dtype('<f8')),
+    ('close', np.dtype('<f8')),
+    ('volume', np.dtype('<f8'))
+)
+
+_kline_lock = threading.Lock()
+_kline_views = {}
+
+
+def _kline_dir(symbol, interval):
+    return os.path.join(MARKET_DATA_FOLDER, secure_filename(symbol.upper()), interval)
+
+
+def append_klines(symbol, interval, rows):
+    """Append (open_time, open, high, low, close, volume) candles to the symbol/interval column files"""
+    if not rows:
+        return 0
+    path = _kline_dir(symbol, interval)
+    os.makedirs(path, exist_ok=True)
+    files = {name: os.path.join(path, f'{name}.bin') for name, _ in KLINE_COLUMNS}
+    # Cut a ragged tail left by an interrupted write, so row i stays aligned across columns
+    length = min((os.path.getsize(f) if os.path.exists(f) else 0) // dtype.itemsize
+                 for f, (_, dtype) in zip(files.values(), KLINE_COLUMNS))
+    data = np.array(rows, dtype=np.float64)
+    for i, (name, dtype) in enumerate(KLINE_COLUMNS):
+        with open(files[name], 'ab') as f:
+            f.truncate(length * dtype.itemsize)
+            f.write(data[:, i].astype(dtype).tobytes())
+    return len(rows)
+
+
+def load_klines(symbol, interval):
+    """Cached candles as memory-mapped NumPy columns ordered by open_time"""
+    path = _kline_dir(symbol, interval)
+    files = {name: os.path.join(path, f'{name}.bin') for name, _ in KLINE_COLUMNS}
+    if not all(os.path.exists(f) for f in files.values()):
+        return {name: np.empty(0, dtype=dtype) for name, dtype in KLINE_COLUMNS}
+
+    # A write interrupted between column files leaves a ragged tail; ignore it
+    length = min(os.path.getsize(files[name]) // dtype.itemsize for name, dtype in KLINE_COLUMNS)
+    cached = _kline_views.get(path)
+    if cached and cached[0] == length:
+        return cached[1]
+
+    if length == 0:
+        return {name: np.empty(0, dtype=dtype) for name, dtype in KLINE_COLUMNS}
+    columns = {
+        name: np.memmap(files[name], dtype=dtype, mode='r', shape=(length,))
+        for name, dtype in KLINE_COLUMNS
+    }
+    # Backfilled gaps land after newer candles; sort (and dedupe) in memory only when needed
+    if np.any(np.diff(columns['open_time']) <= 0):
+        _, order = np.unique(columns['open_time'], return_index=True)
+        columns = {name: np.asarray(column[order]) for name, column in columns.items()}
+
+    _kline_views[path] = (length, columns)
+    return columns
+
+
+def _missing_kline_ranges(conn, symbol, interval, start_ms, end_ms):
+    """Sub-ranges of [start_ms, end_ms) not yet covered by kline_ranges"""
+    rows = conn.execute('''
+        SELECT start_ms, end_ms FROM kline_ranges
+        WHERE symbol = ? AND interval = ? AND end_ms > ? AND start_ms < ?
+        ORDER BY start_ms
+    ''', (symbol, interval, start_ms, end_ms)).fetchall()
+
+    gaps = []
+    position = start_ms
+    for covered_start, covered_end in rows:
+        if covered_start > position:
+            gaps.append((position, covered_start))
+        position = max(position, covered_end)
+    if position < end_ms:
+        gaps.append((position, end_ms))
+    return gaps
+
+
+def _record_kline_range(conn, symbol, interval, start_ms, end_ms):
+    """Mark [start_ms, end_ms) as cached, merging overlapping or adjacent ranges"""
+    overlap = (symbol, interval, start_ms, end_ms)
+    for covered_start, covered_end in conn.execute('''
+        SELECT start_ms, end_ms FROM kline_ranges
+        WHERE symbol = ? AND interval = ? AND end_ms >= ? AND start_ms <= ?
+    ''', overlap).fetchall():
+        start_ms = min(start_ms, covered_start)
+        end_ms = max(end_ms, covered_end)
+    conn.execute('''
+        DELETE FROM kline_ranges
+        WHERE symbol = ? AND interval = ? AND end_ms >= ? AND start_ms <= ?
+    ''', overlap)
+    conn.execute(
+        'INSERT INTO kline_ranges (symbol, interval, start_ms, end_ms) VALUES (?, ?, ?, ?)',
+        (symbol, interval, start_ms, end_ms)
+    )
+
+
+def _fetch_klines(symbol, interval, start_ms, end_ms):
+    """Download candles opening in [start_ms, end_ms) from Bybit's public kline endpoint"""
+    BybitHTTP = bybit_http_class()
+    if BybitHTTP is None:
+        raise RuntimeError('pybit is not installed')
+    client = BybitHTTP(testnet=False)
+    step = KLINE_INTERVAL_MS[interval]
+
+    rows = []
+    page_start = start_ms
+    while page_start < end_ms:
+        page_end = min(end_ms, page_start + step * KLINE_PAGE_LIMIT)
+        resp = client.get_kline(
+            category=KLINE_CATEGORY, symbol=symbol, interval=interval,
+            start=page_start, end=page_end - 1, limit=KLINE_PAGE_LIMIT
+        )
+        if not resp or resp.get('retCode') != 0:
+            raise RuntimeError(f"Kline request failed: {(resp or {}).get('retMsg', 'no response')}")
+        for candle in resp['result'].get('list') or []:
+            rows.append((int(candle[0]), *(float(v) for v in candle[1:6])))
+        page_start = page_end
+    return rows
+
+
+def ensure_klines(conn, symbol, interval, start_ms, end_ms):
+    """Fetch and cache candles covering [start_ms, end_ms) that are not cached yet; returns candles added"""
+    step = KLINE_INTERVAL_MS[interval]
+    now_ms = int(datetime.now().timestamp() * 1000)
+    start_ms = int(start_ms) - int(start_ms) % step
+    # Only closed candles are cached; the one still forming would change later
+    end_ms = min(int(end_ms) - int(end_ms) % step + step, now_ms - now_ms % step)
+
+    added = 0
+    for gap_start, gap_end in _missing_kline_ranges(conn, symbol, interval, start_ms, end_ms):
+        # Download outside the lock so one slow fetch does not hold up every other symbol.
+        # Bybit pages are newest-first; appending in open_time order keeps reads on the memmap.
+        rows = sorted((r for r in _fetch_klines(symbol, interval, gap_start, gap_end)
+                       if gap_start <= r[0] < gap_end), key=lambda r: r[0])
+        with _kline_lock:
+            # Another request may have cached part of the gap while this one downloaded
+            for still_start, still_end in _missing_kline_ranges(conn, symbol, interval, gap_start, gap_end):
+                added += append_klines(symbol, interval, [r for r in rows if still_start <= r[0] < still_end])
+                _record_kline_range(conn, symbol, interval, still_start, still_end)
+            conn.commit()
+    return added
+
+
+def _kline_spans(entry_ms, exit_ms, step):
+    """Merge trade [entry, exit] intervals whose gaps are cheaper to download than to skip"""
+    spans = []
+    for start, end in sorted(zip(entry_ms, exit_ms)):
+        if spans and start - spans[-1][1] <= step * KLINE_PAGE_LIMIT:
+            spans[-1][1] = max(spans[-1][1], end)
+        else:
+            spans.append([start, end])
+    return spans
+
+
+def _range_extremes(high, low, lo, hi):
+    """max(high[lo:hi]) and min(low[lo:hi]) for every (lo, hi) pair (hi > lo) in one reduceat pass each"""
+    base, top = lo.min(), hi.max()
+    order = np.argsort(lo, kind='stable')
+    bounds = np.column_stack([lo[order], hi[order]]).ravel() - base
+    # Trailing sentinel keeps an exclusive bound equal to the slice length a valid index
+    highs = np.maximum.reduceat(np.append(high[base:top], -np.inf), bounds)[::2]
+    lows = np.minimum.reduceat(np.append(low[base:top], np.inf), bounds)[::2]
+
+    max_high = np.empty(len(lo))
+    min_low = np.empty(len(lo))
+    max_high[order] = highs
+    min_low[order] = lows
+    return max_high, min_low
+
+
+def compute_excursions(trades, klines, interval):
+    """Vectorized MAE/MFE for trades on one symbol from cached candles
+
+    The candles containing entry and exit are included whole, so excursions within those
+    candles may be slightly overstated. Returns one dict per trade (None values without data).
+    """
+    step = KLINE_INTERVAL_MS[interval]
+    open_time = np.asarray(klines['open_time'])
+    entry_ms = _epoch_ms([t['entry_time'] for t in trades])
+    exit_ms = _epoch_ms([t['exit_time'] for t in trades])
+    entry_price = _float_array([t['entry_price'] for t in trades])
+    stop_loss = _float_array([t['stop_loss'] for t in trades])
+    quantity = _float_array([t['quantity'] for t in trades])
+    short = np.array([t['side'] == 'short' for t in trades], dtype=bool)
+
+    known = ~np.isnan(entry_ms) & ~np.isnan(exit_ms) & (exit_ms >= entry_ms)
+    lo = np.searchsorted(open_time, np.where(known, entry_ms, 0), side='right') - 1
+    hi = np.searchsorted(open_time, np.where(known, exit_ms, 0), side='right')
+    valid = known & (lo >= 0) & (hi > lo)
+    if len(open_time):
+        # Both the entry and exit candle must actually be cached, not just a neighbour
+        valid &= open_time[np.clip(lo, 0, None)] + step > entry_ms
+        valid &= open_time[np.clip(hi - 1, 0, None)] + step > exit_ms
+
+    max_high = np.full(len(trades), np.nan)
+    min_low = np.full(len(trades), np.nan)
+    if valid.any():
+        max_high[valid], min_low[valid] = _range_extremes(klines['high'], klines['low'], lo[valid], hi[valid])
+
+    favorable = np.where(short, entry_price - min_low, max_high - entry_price).clip(min=0)
+    adverse = np.where(short, max_high - entry_price, entry_price - min_low).clip(min=0)
+    stop_distance = np.abs(entry_price - stop_loss)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_unit_r = np.where(stop_loss > 0, 1 / stop_distance, np.nan)
+        columns = {
+            'mae': adverse * quantity,
+            'mfe': favorable * quantity,
+            'mae_pct': adverse / entry_price * 100,
+            'mfe_pct': favorable / entry_price * 100,
+            'mae_r': adverse * per_unit_r,
+            'mfe_r': favorable * per_unit_r
+        }
+
+    results = []
+    for i, trade in enumerate(trades):
+        row = {'trade_id': trade['id'], 'asset': trade['asset'], 'side': trade['side']}
+        for key, values in columns.items():
+            value = values[i]
+            row[key] = round(float(value), 4) if np.isfinite(value) else None
+        results.append(row)
+    return results
+
+
+@app.route('/api/excursions', methods=['GET'])
+def get_excursions():
+    """Maximum adverse/favorable excursion per closed trade from the local kline cache
+
+    Query params: interval (Bybit kline interval, default 15), asset, period/start_date/end_date,
+    fetch (default 1; 0 skips downloading candles that are not cached yet).
+    """
+    user_id = get_current_user_id()
+    interval = request.args.get('interval', KLINE_DEFAULT_INTERVAL)
+    if interval not in KLINE_INTERVAL_MS:
+        return jsonify({'success': False, 'error': f"interval must be one of: {', '.join(KLINE_INTERVAL_MS)}"}), 400
+    asset = request.args.get('asset', 'all')
+    fetch = request.args.get('fetch', '1') != '0'
+    period_args = (request.args.get('period', 'all'), request.args.get('start_date'), request.args.get('end_date'))
+    period_sql, params = _period_condition(*period_args)
+
+    conn = get_db_connection()
+    query = f'''
+        SELECT id, asset, side, entry_price, stop_loss, quantity, entry_time, exit_time
+        FROM {archive_tables(conn, *period_args)['trades']}
+        WHERE user_id = ? AND status = 'closed' AND is_deleted = 0 AND exit_time IS NOT NULL
+    '''
+    query_params = [user_id]
+    if asset != 'all':
+        query += ' AND asset = ?'
+        query_params.append(asset)
+    if period_sql:
+        query += f' AND {period_sql}'
+        query_params += params
+    query += ' ORDER BY entry_time ASC'
+
+    trades = conn.execute(query, query_params).fetchall()
+
+    by_symbol = {}
+    for trade in trades:
+        by_symbol.setdefault(trade['asset'].upper(), []).append(trade)
+
+    step = KLINE_INTERVAL_MS[interval]
+    results, errors = [], {}
+    for symbol, symbol_trades in by_symbol.items():
+        if fetch:
+            entry_ms = _epoch_ms([t['entry_time'] for t in symbol_trades])
+            exit_ms = _epoch_ms([t['exit_time'] for t in symbol_trades])
+            known = ~np.isnan(entry_ms) & ~np.isnan(exit_ms)
+            try:
+                for start, end in _kline_spans(entry_ms[known], exit_ms[known], step):
+                    ensure_klines(conn, symbol, interval, start, end)
+            except Exception as e:
+                errors[symbol] = str(e)
+        results += compute_excursions(symbol_trades, load_klines(symbol, interval), interval)
+    conn.close()
+
+    covered = [r for r in results if r['mae'] is not None]
+    summary = {'trades': len(results), 'covered': len(covered)}
+    for key in ('mae_pct', 'mfe_pct', 'mae_r', 'mfe_r'):
+        values = [r[key] for r in covered if r[key] is not None]
+        summary[f'avg_{key}'] = round(sum(values) / len(values), 4) if values else None
+
+    return jsonify({
+        'success': True,
+        'interval': interval,
+        'summary': summary,
+        'trades': results,
+        'errors': errors
     })
 
 
+# ================== DISTRIBUTION SKETCHES ==================
+SKETCH_COMPRESSION = 200
+SKETCH_DIMENSIONS = ('all', 'asset', 'model', 'confirmation')
+SKETCH_PERCENTILES = (1, 5, 10, 25, 50, 75, 90, 95, 99)
+
+
+# Metric name -> value extractor for a closed trade row (None values are skipped)
+SKETCH_METRICS = {
+    'pnl': lambda t: t['pnl'],
+    'pnl_percentage': lambda t: t['pnl_percentage'],
+    'risk_reward_ratio': lambda t: t['risk_reward_ratio'],
+    'holding_hours': lambda t: t['holding_seconds'] / 3600 if t['holding_seconds'] is not None else None,
+    'notional': lambda t: t['notional'],
+}
+
+
+class TDigest:
+    """Merging t-digest: a bounded-size, mergeable quantile sketch (k1 scale function)"""
+
+    def __init__(self, compression=SKETCH_COMPRESSION, means=None, weights=None,
+                 count=0.0, total=0.0, min_value=None, max_value=None):
+        self.compression = compression
+        self.means = np.asarray(means if means is not None else [], dtype=np.float64)
+        self.weights = np.asarray(weights if weights is not None else [], dtype=np.float64)
+        self.count = count
+        self.sum = total
+        self.min = min_value
+        self.max = max_value
+
+    def _q_limit(self, q):
+        """Largest cumulative quantile the next centroid may reach starting from q"""
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q - 1) + 1
+        return (np.sin(min(k, self.compression / 4) * 2 * np.pi / self.compression) + 1) / 2
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind='mergesort')
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+
+        merged_means, merged_weights = [], []
+        cur_mean, cur_weight = means[0], weights[0]
+        weight_so_far = 0.0
+        limit = total * self._q_limit(0.0)
+
+        for mean, weight in zip(means[1:], weights[1:]):
+            if weight_so_far + cur_weight + weight <= limit:
+                cur_weight += weight
+                cur_mean += (mean - cur_mean) * weight / cur_weight
+            else:
+                weight_so_far += cur_weight
+                merged_means.append(cur_mean)
+                merged_weights.append(cur_weight)
+                limit = total * self._q_limit(weight_so_far / total)
+                cur_mean, cur_weight = mean, weight
+
+        merged_means.append(cur_mean)
+        merged_weights.append(cur_weight)
+        self.means = np.array(merged_means)
+        self.weights = np.array(merged_weights)
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if not len(values):
+            return self
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = float(values.min()) if self.min is None else min(self.min, float(values.min()))
+        self.max = float(values.max()) if self.max is None else max(self.max, float(values.max()))
+        self._compress(np.concatenate([self.means, values]),
+                       np.concatenate([self.weights, np.ones(len(values))]))
+        return self
+
+    def merge(self, other):
+        if not other.count:
+            return self
+        self.count += other.count
+        self.sum += other.sum
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress(np.concatenate([self.means, other.means]),
+                       np.concatenate([self.weights, other.weights]))
+        return self
+
+    def _knots(self):
+        """Interpolation knots: (cumulative weight, value) through centroid centres and the extremes"""
+        centres = np.cumsum(self.weights) - self.weights / 2
+        return (np.concatenate(([0.0], centres, [self.count])),
+                np.concatenate(([self.min], self.means, [self.max])))
+
+    def quantile(self, q):
+        positions, values = self._knots()
+        return np.interp(np.asarray(q, dtype=np.float64) * self.count, positions, values)
+
+    def cdf(self, x):
+        positions, values = self._knots()
+        return np.interp(x, values, positions) / self.count
+
+    def tail_mean(self, q, upper=False):
+        """Approximate mean of the lowest (or highest) q fraction of values"""
+        grid = np.linspace(1 - q, 1, 64) if upper else np.linspace(0, q, 64)
+        return float(self.quantile(grid).mean())
+
+    def to_row(self):
+        return (self.means.tobytes(), self.weights.tobytes(), self.count, self.sum, self.min, self.max)
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(means=np.frombuffer(row['means'], dtype=np.float64),
+                   weights=np.frombuffer(row['weights'], dtype=np.float64),
+                   count=row['count'], total=row['sum'],
+                   min_value=row['min_value'], max_value=row['max_value'])
+
+
+def _sketch_values(cursor, user_id, trade_ids=None):
+    """Group metric values of closed trades by (metric, dimension, dimension_value)"""
+    where = "user_id = ? AND status = 'closed' AND pnl IS NOT NULL AND is_deleted = 0"
+    params = [user_id]
+    if trade_ids is not None:
+        where += ' AND id IN (SELECT value FROM json_each(?))'
+        params.append(json.dumps(trade_ids))
+    # New trades are always hot; full rebuilds include the archives
+    tables = archive_tables(cursor.connection) if trade_ids is None else {t: t for t in ARCHIVE_TABLES}
+
+    cursor.execute(f'''
+        SELECT id, asset, pnl, pnl_percentage, risk_reward_ratio, holding_seconds, notional
+        FROM {tables['trades']} WHERE {where}
+    ''', params)
+    trades = cursor.fetchall()
+
+    labels = {'model': {}, 'confirmation': {}}
+    cursor.execute(f'''
+        SELECT 'model' AS dimension, d.trade_id, g.name AS label
+        FROM {tables['trade_models']} d JOIN tags g ON g.id = d.tag_id
+        WHERE d.trade_id IN (SELECT id FROM {tables['trades']} WHERE {where})
+        UNION ALL
+        SELECT 'confirmation', d.trade_id, g.name
+        FROM {tables['trade_confirmations']} d JOIN tags g ON g.id = d.tag_id
+        WHERE d.trade_id IN (SELECT id FROM {tables['trades']} WHERE {where})
+    ''', params + params)
+    for row in cursor.fetchall():
+        labels[row['dimension']].setdefault(row['trade_id'], []).append(row['label'])
+
+    groups = {}
+    for t in trades:
+        keys = [('all', ''), ('asset', t['asset'])]
+        keys += [('model', m) for m in labels['model'].get(t['id'], ())]
+        keys += [('confirmation', c) for c in labels['confirmation'].get(t['id'], ())]
+        for metric, extract in SKETCH_METRICS.items():
+            value = extract(t)
+            if value is None:
+                continue
+            for dimension, dimension_value in keys:
+                groups.setdefault((metric, dimension, dimension_value), []).append(value)
+    return groups
+
+
+def _write_sketches(cursor, user_id, digests):
+    cursor.executemany('''
+        INSERT OR REPLACE INTO trade_sketches
+        (user_id, metric, dimension, dimension_value, means, weights, count, sum, min_value, max_value, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ''', [(user_id, *key, *digest.to_row()) for key, digest in digests.items()])
+
+
+def rebuild_trade_sketches(conn, user_id):
+    """Recompute every sketch for a user from the trades table (caller commits)"""
+    cursor = conn.cursor()
+    digests = {key: TDigest().add(values) for key, values in _sketch_values(cursor, user_id).items()}
+
+    cursor.execute('DELETE FROM trade_sketches WHERE user_id = ?', (user_id,))
+    _write_sketches(cursor, user_id, digests)
+    cursor.execute('''
+        INSERT OR REPLACE INTO trade_sketch_status (user_id, is_stale, rebuilt_at)
+        VALUES (?, 0, ?)
+    ''', (user_id, datetime.now().isoformat()))
+
+
+def add_trades_to_sketches(conn, user_id, trade_ids):
+    """Fold newly inserted closed trades into the user's sketches (caller commits)
+
+    Skipped while the sketches are stale; the next read rebuilds them anyway.
+    """
+    if not trade_ids:
+        return
+    cursor = conn.cursor()
+    cursor.execute('SELECT is_stale FROM trade_sketch_status WHERE user_id = ?', (user_id,))
+    status = cursor.fetchone()
+    if not status or status['is_stale']:
+        return
+
+    groups = _sketch_values(cursor, user_id, list(trade_ids))
+    digests = {}
+    for (metric, dimension, dimension_value), values in groups.items():
+        cursor.execute('''
+            SELECT * FROM trade_sketches
+            WHERE user_id = ? AND metric = ? AND dimension = ? AND dimension_value = ?
+        ''', (user_id, metric, dimension, dimension_value))
+        row = cursor.fetchone()
+        digest = TDigest.from_row(row) if row else TDigest()
+        digests[(metric, dimension, dimension_value)] = digest.add(values)
+    _write_sketches(cursor, user_id, digests)
+
+
+def invalidate_trade_sketches(conn, user_id):
+    """Mark a user's sketches stale after an edit or delete (digests cannot remove values)"""
+    conn.execute('''
+        INSERT INTO trade_sketch_status (user_id, is_stale) VALUES (?, 1)
+        ON CONFLICT(user_id) DO UPDATE SET is_stale = 1
+    ''', (user_id,))
+
+
+def _distribution_summary(digest, bins):
+    """Percentiles, tail statistics and an approximate histogram from one sketch"""
+    percentiles = digest.quantile(np.array(SKETCH_PERCENTILES) / 100)
+    edges = np.linspace(digest.min, digest.max, bins + 1) if digest.max > digest.min else np.array([digest.min] * 2)
+    counts = np.diff(digest.cdf(edges)) * digest.count if digest.max > digest.min else np.array([digest.count])
+
+    return {
+        'count': int(digest.count),
+        'mean': round(digest.sum / digest.count, 4),
+        'min': round(digest.min, 4),
+        'max': round(digest.max, 4),
+        'percentiles': {f'p{p}': round(float(v), 4) for p, v in zip(SKETCH_PERCENTILES, percentiles)},
+        'tails': {
+            'worst_5pct_mean': round(digest.tail_mean(0.05), 4),
+            'best_5pct_mean': round(digest.tail_mean(0.05, upper=True), 4),
+        },
+        'histogram': {
+            'edges': np.round(edges, 4).tolist(),
+            'counts': np.round(counts).astype(np.int64).tolist()
+        }
+    }
+
+
+@app.route('/api/distributions', methods=['GET'])
+def get_distributions():
+    """Percentiles, tail stats and histograms for a metric, overall or per asset / model / confirmation"""
+    user_id = get_current_user_id()
+
+    metric = request.args.get('metric', 'pnl')
+    dimension = request.args.get('dimension', 'all')
+    value = request.args.get('value')
+    bins = max(1, min(request.args.get('bins', 20, type=int), 200))
+
+    if metric not in SKETCH_METRICS:
+        return jsonify({'success': False, 'error': f"metric must be one of: {', '.join(SKETCH_METRICS)}"}), 400
+    if dimension not in SKETCH_DIMENSIONS:
+        return jsonify({'success': False, 'error': f"dimension must be one of: {', '.join(SKETCH_DIMENSIONS)}"}), 400
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('SELECT is_stale FROM trade_sketch_status WHERE user_id = ?', (user_id,))
+    status = cursor.fetchone()
+    if not status or status['is_stale']:
+        rebuild_trade_sketches(conn, user_id)
+        conn.commit()
+
+    query = 'SELECT * FROM trade_sketches WHERE user_id = ? AND metric = ? AND dimension = ?'
+    params = [user_id, metric, dimension]
+    if value is not None:
+        query += ' AND dimension_value = ?'
+        params.append(value)
+    cursor.execute(query + ' ORDER BY dimension_value', params)
+    rows = cursor.fetchall()
+    conn.close()
+
+    groups = {row['dimension_value']: _distribution_summary(TDigest.from_row(row), bins)
+              for row in rows if row['count']}
+
+    return jsonify({
+        'metric': metric,
+        'dimension': dimension,
+        'groups': groups
+    })
+
+
+@app.route('/api/distributions/rebuild', methods=['POST'])
+def rebuild_distributions():
+    """Rebuild the current user's sketches from scratch"""
+    user_id = get_current_user_id()
+    conn = get_db_connection()
+    rebuild_trade_sketches(conn, user_id)
+    conn.commit()
+    conn.close()
+    return jsonify({'success': True})
+
+
+# ================== PERIOD SUMMARIES ==================
+PERIOD_TYPES = ('week', 'month', 'quarter', 'year')
+PERIOD_SUMMARY_DEFAULT_LIMIT = 12
+PERIOD_SUMMARY_FIELDS = (
+    'trade_count', 'wins', 'losses', 'total_pnl', 'gross_profit', 'gross_loss', 'best_trade', 'worst_trade'
+)
+
+
+def _period_bounds(period_type, day):
+    """(key, first_day, last_day) of the ISO week / month / quarter / year containing day"""
+    if period_type == 'week':
+        year, week, _ = day.isocalendar()
+        start = day - timedelta(days=day.weekday())
+        return f'{year}-W{week:02d}', start, start + timedelta(days=6)
+    if period_type == 'month':
+        start = day.replace(day=1)
+        end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        return f'{day.year}-{day.month:02d}', start, end
+    if period_type == 'quarter':
+        quarter = (day.month - 1) // 3 + 1
+        start = date(day.year, quarter * 3 - 2, 1)
+        end = (start + timedelta(days=95)).replace(day=1) - timedelta(days=1)
+        return f'{day.year}-Q{quarter}', start, end
+    return str(day.year), date(day.year, 1, 1), date(day.year, 12, 31)
+
+
+def _period_start(period_type, key):
+    """First day of a period key such as 2025-W07, 2025-02, 2025-Q1 or 2025 (ValueError if malformed)"""
+    if period_type == 'week':
+        year, week = key.split('-W')
+        return date.fromisocalendar(int(year), int(week), 1)
+    if period_type == 'month':
+        year, month = key.split('-')
+        return date(int(year), int(month), 1)
+    if period_type == 'quarter':
+        year, quarter = key.split('-Q')
+        if not 1 <= int(quarter) <= 4:
+            raise ValueError(key)
+        return date(int(year), int(quarter) * 3 - 2, 1)
+    return date(int(key), 1, 1)
+
+
+def _trade_dates(conn, trade_ids):
+    """Distinct entry dates (YYYY-MM-DD) of trade_ids"""
+    if not trade_ids:
+        return set()
+    rows = conn.execute(
+        'SELECT DISTINCT DATE(entry_time) FROM trades WHERE id IN (SELECT value FROM json_each(?))',
+        (json.dumps(list(trade_ids)),)
+    ).fetchall()
+    return {row[0] for row in rows if row[0]}
+
+
+def _write_daily_summaries(conn, user_id, dates=None):
+    """Recompute daily_summaries for dates (all days when None)"""
+    where = "user_id = ? AND status = 'closed' AND is_deleted = 0 AND pnl IS NOT NULL AND DATE(entry_time) IS NOT NULL"
+    params = [user_id]
+    trades_table = archive_tables(
+        conn, start_date=min(dates or [], default=None), end_date=max(dates or [], default=None)
+    )['trades']
+    if dates is None:
+        conn.execute('DELETE FROM daily_summaries WHERE user_id = ?', (user_id,))
+    else:
+        placeholders = ', '.join('?' * len(dates))
+        conn.execute(
+            f'DELETE FROM daily_summaries WHERE user_id = ? AND trade_date IN ({placeholders})',
+            [user_id] + list(dates)
+        )
+        where += f' AND DATE(entry_time) IN ({placeholders})'
+        params += list(dates)
+
+    conn.execute(f'''
+        INSERT INTO daily_summaries (user_id, trade_date, {', '.join(PERIOD_SUMMARY_FIELDS)})
+        SELECT
+            user_id,
+            DATE(entry_time),
+            COUNT(*),
+            SUM(CASE WHEN pnl > 0 THEN 1 ELSE 0 END),
+            SUM(CASE WHEN pnl < 0 THEN 1 ELSE 0 END),
+            SUM(pnl),
+            SUM(CASE WHEN pnl > 0 THEN pnl ELSE 0 END),
+            SUM(CASE WHEN pnl < 0 THEN -pnl ELSE 0 END),
+            MAX(pnl),
+            MIN(pnl)
+        FROM {trades_table}
+        WHERE {where}
+        GROUP BY DATE(entry_time)
+    ''', params)
+
+
+def _write_period_rollups(conn, user_id, periods):
+    """Recompute the given {(period_type, key): (start, end)} rollups from daily_summaries"""
+    if not periods:
+        return
+    first = min(start for start, _ in periods.values())
+    last = max(end for _, end in periods.values())
+    daily = conn.execute('''
+        SELECT * FROM daily_summaries WHERE user_id = ? AND trade_date BETWEEN ? AND ?
+    ''', (user_id, first.isoformat(), last.isoformat())).fetchall()
+
+    totals = {}
+    for row in daily:
+        day = date.fromisoformat(row['trade_date'])
+        for period_type in PERIOD_TYPES:
+            key = _period_bounds(period_type, day)[0]
+            if (period_type, key) not in periods:
+                continue
+            total = totals.setdefault((period_type, key), {
+                'trade_count': 0, 'wins': 0, 'losses': 0, 'total_pnl': 0, 'gross_profit': 0,
+                'gross_loss': 0, 'best_trade': None, 'worst_trade': None, 'trading_days': 0
+            })
+            for field in ('trade_count', 'wins', 'losses', 'total_pnl', 'gross_profit', 'gross_loss'):
+                total[field] += row[field]
+            total['best_trade'] = row['best_trade'] if total['best_trade'] is None else max(total['best_trade'], row['best_trade'])
+            total['worst_trade'] = row['worst_trade'] if total['worst_trade'] is None else min(total['worst_trade'], row['worst_trade'])
+            total['trading_days'] += 1
+
+    conn.executemany(
+        'DELETE FROM period_summaries WHERE user_id = ? AND period_type = ? AND period_key = ?',
+        [(user_id, period_type, key) for period_type, key in periods]
+    )
+    conn.executemany(f'''
+        INSERT INTO period_summaries (user_id, period_type, period_key, start_date, end_date,
+                                      {', '.join(PERIOD_SUMMARY_FIELDS)}, trading_days)
+        VALUES ({', '.join('?' * (len(PERIOD_SUMMARY_FIELDS) + 6))})
+    ''', [
+        (user_id, period_type, key, periods[(period_type, key)][0].isoformat(),
+         periods[(period_type, key)][1].isoformat(), *(total[f] for f in PERIOD_SUMMARY_FIELDS), total['trading_days'])
+        for (period_type, key), total in totals.items()
+    ])
+
+
+def _periods_for_dates(dates):
+    periods = {}
+    for value in dates:
+        day = date.fromisoformat(value)
+        for period_type in PERIOD_TYPES:
+            key, start, end = _period_bounds(period_type, day)
+            periods[(period_type, key)] = (start, end)
+    return periods
+
+
+def rebuild_period_summaries(conn, user_id):
+    """Recompute all daily aggregates and rollups for a user"""
+    _write_daily_summaries(conn, user_id)
+    conn.execute('DELETE FROM period_summaries WHERE user_id = ?', (user_id,))
+    dates = [row[0] for row in conn.execute(
+        'SELECT trade_date FROM daily_summaries WHERE user_id = ?', (user_id,)
+    ).fetchall()]
+    _write_period_rollups(conn, user_id, _periods_for_dates(dates))
+    conn.execute('''
+        INSERT OR REPLACE INTO period_summary_status (user_id, rebuilt_at) VALUES (?, ?)
+    ''', (user_id, datetime.now().isoformat()))
+
+
+def refresh_period_summaries(conn, user_id, dates):
+    """Recompute the days in dates and every rollup containing them
+
+    No-op until the user's summaries have been built once (the first read rebuilds them).
+    """
+    dates = sorted({d for d in dates if d})
+    if not dates:
+        return
+    if not conn.execute('SELECT 1 FROM period_summary_status WHERE user_id = ?', (user_id,)).fetchone():
+        return
+    _write_daily_summaries(conn, user_id, dates)
+    _write_period_rollups(conn, user_id, _periods_for_dates(dates))
+
+
+def _ensure_period_summaries(conn, user_id):
+    if not conn.execute('SELECT 1 FROM period_summary_status WHERE user_id = ?', (user_id,)).fetchone():
+        rebuild_period_summaries(conn, user_id)
+        conn.commit()
+
+
+def _period_summary(period_type, key, row=None):
+    """API shape of one rollup row (zeros for a period without trades)"""
+    start = _period_start(period_type, key)
+    _, start, end = _period_bounds(period_type, start)
+    row = row or {}
+    trade_count = row.get('trade_count', 0)
+    wins = row.get('wins', 0)
+    gross_loss = row.get('gross_loss', 0)
+
+    return {
+        'period': key,
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'trade_count': trade_count,
+        'wins': wins,
+        'losses': row.get('losses', 0),
+        'total_pnl': round(row.get('total_pnl', 0), 2),
+        'win_rate': round(wins / trade_count * 100, 1) if trade_count else 0,
+        'profit_factor': round(row.get('gross_profit', 0) / gross_loss, 2) if gross_loss else None,
+        'best_trade': round(row['best_trade'], 2) if row.get('best_trade') is not None else None,
+        'worst_trade': round(row['worst_trade'], 2) if row.get('worst_trade') is not None else None,
+        'trading_days': row.get('trading_days', 0)
+    }
+
+
+@app.route('/api/period_summaries', methods=['GET'])
+def get_period_summaries():
+    """Week / month / quarter / year rollups, newest first
+
+    Query params: period (week, month, quarter or year; default month), limit (default 12).
+    """
+    user_id = get_current_user_id()
+    period_type = request.args.get('period', 'month')
+    if period_type not in PERIOD_TYPES:
+        return jsonify({'success': False, 'error': f"period must be one of: {', '.join(PERIOD_TYPES)}"}), 400
+    limit = max(1, request.args.get('limit', PERIOD_SUMMARY_DEFAULT_LIMIT, type=int))
+
+    conn = get_db_connection()
+    _ensure_period_summaries(conn, user_id)
+    rows = conn.execute('''
+        SELECT * FROM period_summaries
+        WHERE user_id = ? AND period_type = ?
+        ORDER BY start_date DESC
+        LIMIT ?
+    ''', (user_id, period_type, limit)).fetchall()
+    conn.close()
+
+    return jsonify({
+        'period': period_type,
+        'summaries': [_period_summary(period_type, row['period_key'], dict(row)) for row in rows]
+    })
+
+
+@app.route('/api/period_summaries/compare', methods=['GET'])
+def compare_period_summaries():
+    """Compare one period with another (default: the current period against the one before it)
+
+    Query params: period (week, month, quarter or year; default month), current and previous
+    period keys such as 2025-W07, 2025-02, 2025-Q1 or 2025.
+    """
+    user_id = get_current_user_id()
+    period_type = request.args.get('period', 'month')
+    if period_type not in PERIOD_TYPES:
+        return jsonify({'success': False, 'error': f"period must be one of: {', '.join(PERIOD_TYPES)}"}), 400
+
+    try:
+        current_start = _period_start(period_type, request.args['current']) if request.args.get('current') \
+            else _period_bounds(period_type, datetime.utcnow().date())[1]
+        previous_start = _period_start(period_type, request.args['previous']) if request.args.get('previous') \
+            else current_start - timedelta(days=1)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid period key'}), 400
+    current_key = _period_bounds(period_type, current_start)[0]
+    previous_key = _period_bounds(period_type, previous_start)[0]
+
+    conn = get_db_connection()
+    _ensure_period_summaries(conn, user_id)
+    rows = {
+        row['period_key']: dict(row)
+        for row in conn.execute('''
+            SELECT * FROM period_summaries
+            WHERE user_id = ? AND period_type = ? AND period_key IN (?, ?)
+        ''', (user_id, period_type, current_key, previous_key)).fetchall()
+    }
+    conn.close()
+
+    current = _period_summary(period_type, current_key, rows.get(current_key))
+    previous = _period_summary(period_type, previous_key, rows.get(previous_key))
+
+    change = {}
+    for field in ('total_pnl', 'trade_count', 'win_rate', 'profit_factor', 'best_trade', 'worst_trade'):
+        if current[field] is None or previous[field] is None:
+            change[field] = {'absolute': None, 'percent': None}
+            continue
+        absolute = current[field] - previous[field]
+        change[field] = {
+            'absolute': round(absolute, 2),
+            'percent': round(absolute / abs(previous[field]) * 100, 1) if previous[field] else None
+        }
+
+    return jsonify({
+        'period': period_type,
+        'current': current,
+        'previous': previous,
+        'change': change
+    })
+
+
+# ================== COLUMNAR TRADE CACHE ==================
+# Per-user NumPy columns for closed trades, kept in process so analytics reads skip SQLite.
+# Only writes made by this process are seen; set TRADE_CACHE_MB=0 when several workers share the DB.
+TRADE_CACHE_BUDGET_BYTES = int(float(os.getenv('TRADE_CACHE_MB', '64')) * 1024 * 1024)
+
+
+class TradeColumns:
+    """Immutable columnar snapshot of one user's closed trades, ordered by entry_time
+
+    Text fields are stored as integer codes into per-field vocabularies; detail tags are
+    (trade_id, code) pairs per ANALYTICS_TAG_TABLES section.
+    """
+
+    def __init__(self, columns, vocab, tags):
+        self.columns = columns
+        self.vocab = vocab
+        self.tags = tags
+        self._codes = {name: {label: i for i, label in enumerate(labels)} for name, labels in vocab.items()}
+        ids = columns['id']
+        self._id_order = np.argsort(ids, kind='stable')
+        self._sorted_ids = ids[self._id_order]
+
+    @property
+    def nbytes(self):
+        arrays = list(self.columns.values()) + [a for pair in self.tags.values() for a in pair]
+        return sum(a.nbytes for a in arrays) + sum(64 * len(labels) for labels in self.vocab.values())
+
+    @classmethod
+    def load(cls, conn, user_id, trade_ids=None, vocab=None):
+        """Read closed trades (all, or just trade_ids) for user_id, coding text against vocab"""
+        vocab = {name: list(labels) for name, labels in (vocab or {}).items()}
+        rows, tag_rows = [], {section: [] for section in ANALYTICS_TAG_TABLES}
+        id_chunks = [None] if trade_ids is None else [
+            list(trade_ids)[i:i + 500] for i in range(0, len(trade_ids), 500)
+        ]
+        # Refreshed ids are hot trades; full loads include the archives
+        tables = archive_tables(conn) if trade_ids is None else {t: t for t in ARCHIVE_TABLES}
+        for chunk in id_chunks:
+            where = "t.user_id = ? AND t.status = 'closed' AND t.is_deleted = 0"
+            params = [user_id]
+            if chunk is not None:
+                where += f" AND t.id IN ({', '.join('?' * len(chunk))})"
+                params += chunk
+            rows += conn.execute(f'''
+                SELECT t.id, t.pnl, t.entry_time, t.asset, t.side, t.weekly_bias, t.daily_bias,
+                       t.risk_reward_ratio, t.realized_r
+                FROM {tables['trades']} t WHERE {where}
+            ''', params).fetchall()
+            for section, (table, _, _) in ANALYTICS_TAG_TABLES.items():
+                tag_rows[section] += conn.execute(
+                    f'SELECT d.trade_id, g.name FROM {tables[table]} d JOIN tags g ON g.id = d.tag_id '
+                    f"JOIN {tables['trades']} t ON t.id = d.trade_id WHERE {where}",
+                    params
+                ).fetchall()
+
+        def encode(name, values):
+            labels = vocab.setdefault(name, [])
+            codes = {label: i for i, label in enumerate(labels)}
+            out = np.empty(len(values), dtype=np.int32)
+            for i, value in enumerate(values):
+                if value not in codes:
+                    codes[value] = len(labels)
+                    labels.append(value)
+                out[i] = codes[value]
+            return out
+
+        columns = {
+            'id': np.array([r[0] for r in rows], dtype=np.int64),
+            'pnl': _float_array([r[1] for r in rows]),
+            'entry_time': np.array([r[2] or '' for r in rows], dtype=str),
+            'entry_epoch': _epoch_ms([r[2] for r in rows]) / 1000 if rows else np.empty(0),
+            'entry_wall_epoch': _epoch_ms([r[2] for r in rows], wall_clock=True) / 1000 if rows else np.empty(0),
+            'asset': encode('asset', [r[3] for r in rows]),
+            'side': encode('side', [r[4] for r in rows]),
+            'weekly_bias': encode('weekly_bias', [r[5] or 'neutral' for r in rows]),
+            'daily_bias': encode('daily_bias', [r[6] or 'neutral' for r in rows]),
+            'risk_reward_ratio': _float_array([r[7] for r in rows]),
+            'realized_r': _float_array([r[8] for r in rows])
+        }
+        tags = {}
+        for section, pairs in tag_rows.items():
+            tags[section] = (
+                np.array([p[0] for p in pairs], dtype=np.int64),
+                encode(section, [p[1] for p in pairs])
+            )
+        return cls._sorted(columns, vocab, tags)
+
+    @classmethod
+    def _sorted(cls, columns, vocab, tags):
+        # Same order as ORDER BY entry_time ASC over rowid
+        order = np.lexsort((columns['id'], columns['entry_time']))
+        return cls({name: values[order] for name, values in columns.items()}, vocab, tags)
+
+    def with_trades(self, conn, user_id, trade_ids):
+        """New snapshot with trade_ids re-read from the database (dropped if no longer closed)"""
+        fresh = TradeColumns.load(conn, user_id, trade_ids, vocab=self.vocab)
+        stale_ids = np.array(list(trade_ids), dtype=np.int64)
+        keep = ~np.isin(self.columns['id'], stale_ids)
+        columns = {
+            name: np.concatenate([values[keep], fresh.columns[name]])
+            for name, values in self.columns.items()
+        }
+        tags = {}
+        for section, (tag_ids, codes) in self.tags.items():
+            keep_tags = ~np.isin(tag_ids, stale_ids)
+            fresh_ids, fresh_codes = fresh.tags[section]
+            tags[section] = (
+                np.concatenate([tag_ids[keep_tags], fresh_ids]),
+                np.concatenate([codes[keep_tags], fresh_codes])
+            )
+        return TradeColumns._sorted(columns, fresh.vocab, tags)
+
+    def _coded_mask(self, name, value):
+        code = self._codes.get(name, {}).get(value)
+        if code is None:
+            return np.zeros(len(self.columns['id']), dtype=bool)
+        return self.columns[name] == code
+
+    def period_mask(self, period, start_date=None, end_date=None):
+        """Row mask matching _period_condition() on entry_time"""
+        epoch = self.columns['entry_epoch']
+        with np.errstate(invalid='ignore'):
+            day = np.floor(epoch / 86400)
+        today = datetime.now().timestamp() // 86400
+
+        if start_date and end_date:
+            try:
+                first, last = (np.datetime64(d[:10], 'D').astype(np.int64) for d in (start_date, end_date))
+            except ValueError:
+                return np.zeros(len(epoch), dtype=bool)
+            return (day >= first) & (day <= last)
+        if period == 'today':
+            return day == today
+        if period == 'week':
+            return epoch >= (today - 7) * 86400
+        if period == 'month':
+            known = ~np.isnan(day)
+            months = np.full(len(day), -1, dtype=np.int64)
+            months[known] = day[known].astype(np.int64).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+            current = np.datetime64(int(today), 'D').astype('datetime64[M]').astype(np.int64)
+            return months == current
+        return np.ones(len(epoch), dtype=bool)
+
+    def statistics(self, mask):
+        """Same result as _trade_statistics() for the masked trades"""
+        pnl = np.nan_to_num(self.columns['pnl'][mask], nan=0.0)
+        wins = pnl[pnl > 0]
+        losses = pnl[pnl < 0]
+        total_trades = len(pnl)
+        total_losses = abs(float(losses.sum()))
+
+        return {
+            'total_trades': total_trades,
+            'winning_trades': len(wins),
+            'losing_trades': len(losses),
+            'total_pnl': float(pnl.sum()),
+            'win_rate': round(len(wins) / total_trades * 100, 1) if total_trades else 0,
+            'avg_win': round(float(wins.mean()), 2) if len(wins) else 0,
+            'avg_loss': round(float(losses.mean()), 2) if len(losses) else 0,
+            'profit_factor': round(float(wins.sum()) / total_losses, 2) if total_losses > 0 else 0
+        }
+
+    def risk_metrics(self):
+        """Same result as _risk_metrics() over the trades with P&L"""
+        known = ~np.isnan(self.columns['pnl'])
+        pnl = self.columns['pnl'][known]
+        if not len(pnl):
+            return _risk_metrics([])
+
+        cumulative = np.cumsum(pnl)
+        peak = np.maximum.accumulate(np.maximum(cumulative, 0))
+        drawdown = peak - cumulative
+        worst = int(np.argmax(drawdown))
+        max_drawdown = float(drawdown[worst])
+        max_drawdown_pct = max_drawdown / peak[worst] * 100 if max_drawdown > 0 and peak[worst] > 0 else 0
+
+        wins = pnl[pnl > 0]
+        losses = pnl[pnl < 0]
+        win_rate = len(wins) / len(pnl)
+        avg_win = float(wins.mean()) if len(wins) else 0
+        avg_loss = abs(float(losses.mean())) if len(losses) else 0
+        expectancy = (win_rate * avg_win) - ((1 - win_rate) * avg_loss)
+
+        rr = self.columns['risk_reward_ratio'][known]
+        rr = rr[~np.isnan(rr) & (rr != 0)]
+        realized = self.columns['realized_r'][known]
+        realized = realized[~np.isnan(realized)]
+
+        return {
+            'max_drawdown': round(max_drawdown, 2),
+            'max_drawdown_pct': round(float(max_drawdown_pct), 2),
+            'expectancy': round(expectancy, 2),
+            'avg_rr_ratio': round(float(rr.mean()), 2) if len(rr) else 0,
+            'avg_realized_r': round(float(realized.mean()), 2) if len(realized) else 0,
+            'consecutive_wins': _longest_run(pnl > 0),
+            'consecutive_losses': _longest_run(pnl <= 0),
+            'largest_win': round(float(wins.max()), 2) if len(wins) else 0,
+            'largest_loss': round(float(losses.min()), 2) if len(losses) else 0
+        }
+
+    def time_analytics(self):
+        """Same result as _time_analytics(): hours and weekdays of the entry time as written"""
+        epoch = self.columns['entry_wall_epoch']
+        pnl = self.columns['pnl']
+        known = ~np.isnan(pnl) & ~np.isnan(epoch)
+        seconds = epoch[known]
+        pnl = pnl[known]
+        hours = (seconds // 3600 % 24).astype(np.int64)
+        # 1970-01-01 was a Thursday (weekday 3)
+        weekdays = ((seconds // 86400 + 3) % 7).astype(np.int64)
+        return {
+            'by_hour': _bucket_stats(hours, pnl, 24),
+            'by_day': _bucket_stats(weekdays, pnl, 7)
+        }
+
+    def group_analytics(self, section, filters):
+        """Same result as the /api/analytics/by_* endpoints for one tag section"""
+        mask = ~np.isnan(self.columns['pnl'])
+        for key, value in filters.items():
+            if value != 'all':
+                mask &= self._coded_mask(key, value)
+
+        _, column, _ = ANALYTICS_TAG_TABLES[section]
+        tag_ids, codes = self.tags[section]
+        selected = np.isin(tag_ids, self.columns['id'][mask])
+        codes = codes[selected]
+        rows = self._id_order[np.searchsorted(self._sorted_ids, tag_ids[selected])]
+        pnl = self.columns['pnl'][rows]
+
+        size = len(self.vocab.get(section, []))
+        counts = np.bincount(codes, minlength=size)
+        totals = np.bincount(codes, weights=pnl, minlength=size)
+        wins = np.bincount(codes[pnl > 0], minlength=size)
+        losses = np.bincount(codes[pnl < 0], minlength=size)
+
+        results = []
+        for code in np.flatnonzero(counts)[np.argsort(-totals[counts > 0], kind='stable')]:
+            trade_count = int(counts[code])
+            total = float(totals[code])
+            results.append({
+                column: self.vocab[section][code],
+                'trade_count': trade_count,
+                'total_pnl': round(total, 2),
+                'avg_pnl': round(total / trade_count, 2),
+                'wins': int(wins[code]),
+                'losses': int(losses[code]),
+                'win_rate': round(int(wins[code]) / trade_count * 100, 1)
+            })
+        return results
+
+
+def _longest_run(flags):
+    """Length of the longest run of True values"""
+    if not flags.any():
+        return 0
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], flags.astype(np.int8), [0]))))
+    return int((edges[1::2] - edges[::2]).max())
+
+
+def _bucket_stats(buckets, pnl, size):
+    """_time_analytics() style stats keyed by str(bucket) for buckets 0..size-1"""
+    counts = np.bincount(buckets, minlength=size)
+    totals = np.bincount(buckets, weights=pnl, minlength=size)
+    wins = np.bincount(buckets[pnl > 0], minlength=size)
+    stats = {}
+    for i in range(size):
+        count = int(counts[i])
+        stats[str(i)] = {
+            'total_pnl': float(totals[i]) if count else 0,
+            'count': count,
+            'wins': int(wins[i]),
+            'avg_pnl': round(float(totals[i]) / count, 2) if count else 0,
+            'win_rate': round(int(wins[i]) / count * 100, 1) if count else 0
+        }
+    return stats
+
+
+class TradeCache:
+    """LRU of per-user TradeColumns bounded by a memory budget (disabled when the budget is 0)"""
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self._users = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.budget_bytes > 0
+
+    def get(self, user_id):
+        """Columns for user_id, loaded from SQLite on first use; None when the cache is disabled"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            columns = self._users.get(user_id)
+            if columns is not None:
+                self._users.move_to_end(user_id)
+                return columns
+            generation = self._generations.get(user_id, 0)
+
+        conn = get_db_connection()
+        try:
+            columns = TradeColumns.load(conn, user_id)
+        finally:
+            conn.close()
+
+        with self._lock:
+            # A write landed while loading; serve this snapshot but don't keep it
+            if self._generations.get(user_id, 0) == generation:
+                self._users[user_id] = columns
+                self._evict()
+        return columns
+
+    def refresh(self, conn, user_id, trade_ids):
+        """Apply inserted, edited or deleted trades to a loaded user (no-op when not loaded)"""
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            columns = self._users.get(user_id)
+            if columns is None:
+                return
+            # Re-read under the lock so concurrent writers cannot drop each other's changes
+            self._users[user_id] = columns.with_trades(conn, user_id, trade_ids)
+            self._evict()
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            for user_id in self._users:
+                self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            self._users.clear()
+
+    def _evict(self):
+        total = sum(columns.nbytes for columns in self._users.values())
+        while len(self._users) > 1 and total > self.budget_bytes:
+            _, columns = self._users.popitem(last=False)
+            total -= columns.nbytes
+
+
+trade_cache = TradeCache(TRADE_CACHE_BUDGET_BYTES)
+
+
+# ================== DASHBOARD ==================
+# Analytics breakdown section -> (detail table, label column, response key)
+ANALYTICS_TAG_TABLES = {
+    'by_model': ('trade_models', 'model', 'models'),
+    'by_confirmation': ('trade_confirmations', 'confirmation', 'confirmations'),
+    'by_entry': ('trade_entries', 'entry', 'entries'),
+    'by_key_level': ('trade_key_levels', 'level', 'key_levels'),
+}
+
+DASHBOARD_SECTIONS = (
+    'trades', 'open_trades', 'risk_metrics', 'time_analytics', 'calendar', 'equity_curve'
+) + tuple(ANALYTICS_TAG_TABLES)
+
+ANALYTICS_FILTERS = ('asset', 'weekly_bias', 'daily_bias', 'side')
+
+
+def _calendar_events(trades):
+    """Calendar events from closed trades, grouped by entry date"""
+    days = {}
+    for t in trades:
+        day = days.setdefault(t['entry_time'][:10], [0, 0, 0])
+        day[0] += t['pnl']
+        day[1] += 1
+        if t['pnl'] > 0:
+            day[2] += 1
+
+    return [
+        _calendar_event(trade_date, pnl, count, wins)
+        for trade_date, (pnl, count, wins) in sorted(days.items())
+    ]
+
+
+def _group_analytics(trades, labels_by_trade, label_key):
+    """Per-label trade count, P&L and win rate (same shape as the /api/analytics/by_* endpoints)"""
+    groups = {}
+    for t in trades:
+        for label in labels_by_trade.get(t['id'], ()):
+            group = groups.setdefault(label, {'trade_count': 0, 'total_pnl': 0, 'wins': 0, 'losses': 0})
+            group['trade_count'] += 1
+            group['total_pnl'] += t['pnl']
+            if t['pnl'] > 0:
+                group['wins'] += 1
+            elif t['pnl'] < 0:
+                group['losses'] += 1
+
+    results = []
+    for label, group in groups.items():
+        trade_count = group['trade_count']
+        results.append({
+            label_key: label,
+            'trade_count': trade_count,
+            'total_pnl': round(group['total_pnl'], 2),
+            'avg_pnl': round(group['total_pnl'] / trade_count, 2),
+            'wins': group['wins'],
+            'losses': group['losses'],
+            'win_rate': round(group['wins'] / trade_count * 100, 1)
+        })
+
+    results.sort(key=lambda r: r['total_pnl'], reverse=True)
+    return results
+
+
+@app.route('/api/dashboard', methods=['GET'])
+def get_dashboard():
+    """All first-paint dashboard sections computed from a single trades scan
+
+    Query params: sections (comma separated, default all), period/start_date/end_date
+    (trades and equity_curve), asset/weekly_bias/daily_bias/side (analytics breakdowns),
+    points (equity_curve), trade_limit (newest trades listed; the trade table pages the rest).
+    """
+    user_id = get_current_user_id()
+
+    requested = request.args.get('sections')
+    sections = [s.strip() for s in requested.split(',') if s.strip()] if requested else list(DASHBOARD_SECTIONS)
+    unknown = [s for s in sections if s not in DASHBOARD_SECTIONS]
+    if unknown:
+        return jsonify({'success': False, 'error': f"Unknown section(s): {', '.join(unknown)}"}), 400
+
+    period = request.args.get('period', 'all')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    points = request.args.get('points', EQUITY_CURVE_DEFAULT_POINTS, type=int)
+    points = max(3, min(points, EQUITY_CURVE_MAX_POINTS))
+    trade_limit = request.args.get('trade_limit', type=int)
+    filters = {key: request.args.get(key, 'all') for key in ANALYTICS_FILTERS}
+
+    period_sql, params = _period_condition(period, start_date, end_date)
+    statuses = ['closed', 'open'] if 'open_trades' in sections else ['closed']
+    columns = trade_cache.get(user_id)
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    tables = archive_tables(conn)
+
+    cursor.execute(f'''
+        SELECT *, ({period_sql or '1'}) AS in_period
+        FROM {tables['trades']}
+        WHERE user_id = ? AND status IN ({', '.join('?' * len(statuses))}) AND is_deleted = 0
+        ORDER BY entry_time DESC, id DESC
+    ''', params + [user_id] + statuses)
+    rows = [dict(row) for row in cursor.fetchall()]
+
+    # Detail labels for every requested breakdown, in one query
+    labels = {section: {} for section in sections if section in ANALYTICS_TAG_TABLES}
+    if labels and columns is None:
+        union = ' UNION ALL '.join(
+            f"SELECT '{section}' AS section, d.trade_id, g.name AS label "
+            f"FROM {tables[table]} d JOIN tags g ON g.id = d.tag_id JOIN {tables['trades']} t ON t.id = d.trade_id "
+            f"WHERE t.user_id = ? AND t.status = 'closed' AND t.is_deleted = 0"
+            for section, (table, _, _) in ANALYTICS_TAG_TABLES.items() if section in labels
+        )
+        cursor.execute(union, [user_id] * len(labels))
+        for row in cursor.fetchall():
+            labels[row['section']].setdefault(row['trade_id'], []).append(row['label'])
+
+    conn.close()
+
+    in_period = set()
+    for t in rows:
+        t['weekly_bias'] = t.get('weekly_bias') or 'neutral'
+        t['daily_bias'] = t.get('daily_bias') or 'neutral'
+        if t.pop('in_period'):
+            in_period.add(t['id'])
+
+    closed = [t for t in rows if t['status'] == 'closed']
+    closed_with_pnl = [t for t in closed if t['pnl'] is not None]
+    chronological = closed_with_pnl[::-1]
+
+    result = {}
+    if 'trades' in sections:
+        period_trades = [t for t in closed if t['id'] in in_period]
+        if columns is not None:
+            statistics = columns.statistics(columns.period_mask(period, start_date, end_date))
+        else:
+            statistics = _trade_statistics(period_trades)
+        holding = [t['holding_seconds'] for t in period_trades if (t['holding_seconds'] or 0) > 0]
+        result['trades'] = {
+            'trades': period_trades if trade_limit is None else period_trades[:max(trade_limit, 0)],
+            'statistics': statistics,
+            'total': len(period_trades),
+            'assets': sorted({t['asset'] for t in period_trades if t['asset']}),
+            'avg_holding_seconds': sum(holding) / len(holding) if holding else None
+        }
+    if 'open_trades' in sections:
+        result['open_trades'] = {'trades': [t for t in rows if t['status'] == 'open']}
+    if 'risk_metrics' in sections:
+        result['risk_metrics'] = columns.risk_metrics() if columns is not None else _risk_metrics(chronological)
+    if 'time_analytics' in sections:
+        result['time_analytics'] = columns.time_analytics() if columns is not None else _time_analytics(closed_with_pnl)
+    if 'calendar' in sections:
+        result['calendar'] = _calendar_events(closed_with_pnl)
+    if 'equity_curve' in sections:
+        result['equity_curve'] = _equity_curve_payload([t for t in chronological if t['id'] in in_period], points)
+
+    if labels:
+        filtered = [
+            t for t in closed_with_pnl
+            if all(value == 'all' or t[key] == value for key, value in filters.items())
+        ]
+        for section in labels:
+            _, column, key = ANALYTICS_TAG_TABLES[section]
+            if columns is not None:
+                result[section] = {key: columns.group_analytics(section, filters)}
+            else:
+                result[section] = {key: _group_analytics(filtered, labels[section], column)}
+
+    return jsonify(result)
+
+
+# ================== SCREENSHOTS ==================
+# WebP variants stored next to each upload as <stem>.<variant>.webp, bounded to the given size
+SCREENSHOT_VARIANTS = {'thumb': 160, 'small': 480, 'preview': 1280}
+SCREENSHOT_VARIANT_QUALITY = 80
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', '2'))
+
+_thumbnail_pool = None
+_thumbnail_pending = set()
+_thumbnail_lock = threading.Lock()
+
+
+def _get_thumbnail_pool():
+    """Lazily created thread pool for thumbnail generation (Pillow releases the GIL while encoding)"""
+    global _thumbnail_pool
+    if _thumbnail_pool is None:
+        _thumbnail_pool = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix='thumbnails')
+    return _thumbnail_pool
+
+
+def _variant_filename(filename, variant):
+    return f"{filename.rsplit('.', 1)[0]}.{variant}.webp"
+
+
+def _is_variant(filename):
+    parts = filename.rsplit('.', 2)
+    return len(parts) == 3 and parts[1] in SCREENSHOT_VARIANTS and parts[2] == 'webp'
+
+
+def _thumbnails_available():
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def screenshot_variants(url):
+    """{variant: URL} for an uploaded screenshot URL ({} for external links or without Pillow)"""
+    if not url or not url.startswith('/screenshots/') or not _thumbnails_available():
+        return {}
+    filename = url[len('/screenshots/'):]
+    return {variant: f'/screenshots/{_variant_filename(filename, variant)}' for variant in SCREENSHOT_VARIANTS}
+
+
+def generate_thumbnails(filename):
+    """Write the missing WebP variants of an uploaded screenshot; returns the variants written"""
+    from PIL import Image, ImageOps
+
+    path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    missing = {
+        variant: size for variant, size in SCREENSHOT_VARIANTS.items()
+        if not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], _variant_filename(filename, variant)))
+    }
+    if not missing:
+        return []
+
+    with Image.open(path) as source:
+        image = ImageOps.exif_transpose(source)
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+    written = []
+    for variant, size in sorted(missing.items(), key=lambda item: -item[1]):
+        image.thumbnail((size, size), Image.LANCZOS)
+        target = os.path.join(app.config['UPLOAD_FOLDER'], _variant_filename(filename, variant))
+        partial = f'{target}.{uuid.uuid4().hex}.partial'
+        image.save(partial, 'WEBP', quality=SCREENSHOT_VARIANT_QUALITY, method=4)
+        os.replace(partial, target)
+        written.append(variant)
+    return written
+
+
+def _thumbnail_task(filename):
+    try:
+        generate_thumbnails(filename)
+    except Exception as e:
+        print(f"⚠️ Thumbnail generation failed for {filename}: {e}")
+    finally:
+        with _thumbnail_lock:
+            _thumbnail_pending.discard(filename)
+
+
+def queue_thumbnails(filename):
+    """Generate an upload's variants on the worker pool (once at a time per file)"""
+    if not _thumbnails_available():
+        return None
+    with _thumbnail_lock:
+        if filename in _thumbnail_pending:
+            return None
+        _thumbnail_pending.add(filename)
+    return _get_thumbnail_pool().submit(_thumbnail_task, filename)
+
+
+def _uploaded_originals():
+    folder = app.config['UPLOAD_FOLDER']
+    return sorted(
+        name for name in os.listdir(folder)
+        if allowed_file(name) and not _is_variant(name) and os.path.isfile(os.path.join(folder, name))
+    )
+
+
+def backfill_thumbnails(wait=False):
+    """Queue variant generation for every upload that is missing one; returns the files queued"""
+    queued = []
+    futures = []
+    for filename in _uploaded_originals():
+        if all(os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], _variant_filename(filename, v)))
+               for v in SCREENSHOT_VARIANTS):
+            continue
+        future = queue_thumbnails(filename)
+        if future is not None:
+            queued.append(filename)
+            futures.append(future)
+    if wait:
+        for future in futures:
+            future.result()
+    return queued
+
+
+@app.cli.command('thumbnails')
+def thumbnails_command():
+    """Generate missing WebP screenshot variants for existing uploads"""
+    if not _thumbnails_available():
+        raise click.ClickException('Thumbnails require Pillow (pip install Pillow)')
+    queued = backfill_thumbnails(wait=True)
+    click.echo(f"Generated variants for {len(queued)} screenshot(s)")
+
+
+SCREENSHOT_HASH_CHUNK = 1 << 16
+SCREENSHOT_GC_GRACE_HOURS = 24       # uploads not yet attached to a trade are kept this long
+SCREENSHOT_EXTENSION_ALIASES = {'jpeg': 'jpg'}
+
+
+def store_screenshot(stream, ext):
+    """Stream an upload to a temp file while hashing it, then rename it to <sha256>.<ext>
+
+    Returns (filename, deduplicated). Identical content maps to the same file, which is
+    registered in screenshot_blobs with no references until a trade links to it.
+    """
+    folder = app.config['UPLOAD_FOLDER']
+    ext = SCREENSHOT_EXTENSION_ALIASES.get(ext, ext)
+    digest = hashlib.sha256()
+    size = 0
+    partial = os.path.join(folder, f'.upload-{uuid.uuid4().hex}.partial')
+    try:
+        with open(partial, 'wb') as out:
+            for chunk in iter(lambda: stream.read(SCREENSHOT_HASH_CHUNK), b''):
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        filename = f'{digest.hexdigest()}.{ext}'
+        target = os.path.join(folder, filename)
+        deduplicated = os.path.exists(target)
+        if deduplicated:
+            # Restart the GC grace period of content that was waiting to be collected
+            try:
+                os.utime(target)
+            except FileNotFoundError:
+                deduplicated = False
+        if not deduplicated:
+            os.replace(partial, target)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+    conn = get_db_connection()
+    conn.execute('''
+        INSERT INTO screenshot_blobs (digest, filename, size_bytes) VALUES (?, ?, ?)
+        ON CONFLICT(digest) DO UPDATE SET unreferenced_at = CURRENT_TIMESTAMP WHERE ref_count <= 0
+    ''', (digest.hexdigest(), filename, size))
+    conn.commit()
+    conn.close()
+    return filename, deduplicated
+
+
+def _screenshot_files(filename):
+    """The original plus its generated variants"""
+    return [filename] + [_variant_filename(filename, variant) for variant in SCREENSHOT_VARIANTS]
+
+
+def recount_screenshot_refs(conn):
+    """Recompute ref_count for every blob from hot and archived trade_screenshots rows"""
+    screenshots = archive_tables(conn)['trade_screenshots']
+    conn.execute(f'''
+        UPDATE screenshot_blobs SET ref_count = (
+            SELECT COUNT(*) FROM {screenshots} s WHERE s.screenshot_url = '/screenshots/' || screenshot_blobs.filename
+        )
+    ''')
+
+
+def collect_screenshot_garbage(conn, grace_hours=SCREENSHOT_GC_GRACE_HOURS, dry_run=False):
+    """Delete unreferenced screenshot files older than the grace period
+
+    Covers blobs whose last reference went away, uploads never attached to a trade, files
+    no trade row points to (e.g. from before content addressing) and abandoned temp files.
+    Returns {'files': [...], 'bytes': n}.
+    """
+    folder = app.config['UPLOAD_FOLDER']
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=grace_hours)
+    recount_screenshot_refs(conn)
+
+    screenshots = archive_tables(conn)['trade_screenshots']
+    referenced = {row[0][len('/screenshots/'):] for row in conn.execute(
+        f"SELECT DISTINCT screenshot_url FROM {screenshots} WHERE screenshot_url LIKE '/screenshots/%'"
+    ).fetchall()}
+    tracked = {row['filename']: row for row in conn.execute('SELECT * FROM screenshot_blobs').fetchall()}
+
+    def is_old(path, since=None):
+        if since:
+            return datetime.fromisoformat(since).replace(tzinfo=timezone.utc) < cutoff
+        return datetime.fromtimestamp(os.path.getmtime(path), timezone.utc) < cutoff
+
+    doomed = []
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if not os.path.isfile(path):
+            continue
+        if name.startswith('.upload-') and name.endswith('.partial'):
+            if is_old(path):
+                doomed.append(name)
+            continue
+        if not allowed_file(name) or _is_variant(name) or name in referenced:
+            continue
+        blob = tracked.get(name)
+        if blob is not None and blob['ref_count'] > 0:
+            continue
+        if is_old(path, blob['unreferenced_at'] if blob is not None else None):
+            doomed += [f for f in _screenshot_files(name) if os.path.exists(os.path.join(folder, f))]
+
+    # Variants whose original is gone
+    originals = {name.rsplit('.', 1)[0] for name in os.listdir(folder) if allowed_file(name) and not _is_variant(name)}
+    doomed += [name for name in os.listdir(folder) if _is_variant(name) and name.rsplit('.', 2)[0] not in originals]
+
+    freed = 0
+    for name in sorted(set(doomed)):
+        path = os.path.join(folder, name)
+        freed += os.path.getsize(path)
+        if not dry_run:
+            os.remove(path)
+    if not dry_run:
+        conn.executemany('DELETE FROM screenshot_blobs WHERE filename = ? AND ref_count <= 0',
+                         [(name,) for name in doomed])
+        conn.commit()
+    return {'files': sorted(set(doomed)), 'bytes': freed}
+
+
+def migrate_legacy_screenshots(conn):
+    """Rename uuid-named uploads to their content digest, merging duplicates and rewriting trade URLs
+
+    Returns (files migrated, duplicates removed).
+    """
+    folder = app.config['UPLOAD_FOLDER']
+    tracked = {row[0] for row in conn.execute('SELECT filename FROM screenshot_blobs').fetchall()}
+    migrated = duplicates = 0
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if name in tracked or not allowed_file(name) or _is_variant(name) or not os.path.isfile(path):
+            continue
+        with open(path, 'rb') as stream:
+            filename, deduplicated = store_screenshot(stream, name.rsplit('.', 1)[1].lower())
+        if filename == name:
+            continue
+        for schema in ['main'] + [_attach_archive(conn, year) for year in archive_years()]:
+            conn.execute(f'UPDATE {schema}.trade_screenshots SET screenshot_url = ? WHERE screenshot_url = ?',
+                         (f'/screenshots/{filename}', f'/screenshots/{name}'))
+        conn.commit()
+        for old in _screenshot_files(name):
+            if os.path.exists(os.path.join(folder, old)):
+                os.remove(os.path.join(folder, old))
+        queue_thumbnails(filename)
+        migrated += 1
+        duplicates += deduplicated
+    recount_screenshot_refs(conn)
+    conn.commit()
+    return migrated, duplicates
+
+
+@app.cli.command('screenshots-gc')
+@click.option('--grace-hours', type=float, default=SCREENSHOT_GC_GRACE_HOURS, show_default=True,
+              help='Keep unreferenced files younger than this')
+@click.option('--dry-run', is_flag=True, help='List what would be deleted')
+def screenshots_gc_command(grace_hours, dry_run):
+    """Delete screenshot files no trade references any more"""
+    conn = get_db_connection()
+    result = collect_screenshot_garbage(conn, grace_hours, dry_run)
+    conn.close()
+    for name in result['files']:
+        click.echo(name)
+    click.echo(f"{'Would free' if dry_run else 'Freed'} {result['bytes']} bytes in {len(result['files'])} file(s)")
+
+
+@app.cli.command('screenshots-migrate')
+def screenshots_migrate_command():
+    """Move existing uploads to content-addressed names, merging duplicate files"""
+    conn = get_db_connection()
+    migrated, duplicates = migrate_legacy_screenshots(conn)
+    conn.close()
+    click.echo(f"Migrated {migrated} screenshot(s), {duplicates} were duplicates")
+
+
 @app.route('/api/upload_screenshot', methods=['POST'])
 def upload_screenshot():
     """Upload a screenshot for a trade"""
@@ -2019,17 +5897,19 @@ def upload_screenshot():
         return jsonify({'success': False, 'error': 'No file selected'}), 400
 
     if file and allowed_file(file.filename):
-        # Generate unique filename
+        # Content-addressed: the same image uploaded twice is stored once
         ext = file.filename.rsplit('.', 1)[1].lower()
-        filename = f"{uuid.uuid4().hex}.{ext}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-
-        # Save file
-        file.save(filepath)
+        filename, deduplicated = store_screenshot(file.stream, ext)
+        queue_thumbnails(filename)
 
         # Return the URL path
         screenshot_url = f"/screenshots/{filename}"
-        return jsonify({'success': True, 'url': screenshot_url})
+        return jsonify({
+            'success': True,
+            'url': screenshot_url,
+            'variants': screenshot_variants(screenshot_url),
+            'deduplicated': deduplicated
+        })
 
     return jsonify({'success': False, 'error': 'Invalid file type'}), 400
 
@@ -2044,6 +5924,10 @@ def add_screenshot_url(trade_id):
         return jsonify({'success': False, 'error': 'URL required'}), 400
 
     conn = get_db_connection()
+    error = _trade_write_error(conn, trade_id)
+    if error:
+        conn.close()
+        return error
     cursor = conn.cursor()
 
     cursor.execute('''
@@ -2052,15 +5936,732 @@ def add_screenshot_url(trade_id):
     ''', (trade_id, url))
 
     conn.commit()
+    after_trade_commit(conn, get_current_user_id(), [trade_id])
     conn.close()
 
     return jsonify({'success': True})
 
 
+SCREENSHOT_CACHE_SECONDS = 365 * 24 * 3600
+# Hand the file body to a front proxy: '' (serve from Python), 'x-sendfile' or 'x-accel-redirect'
+SCREENSHOT_SENDFILE = os.getenv('SCREENSHOT_SENDFILE', '').strip().lower()
+SCREENSHOT_ACCEL_PREFIX = os.getenv('SCREENSHOT_ACCEL_PREFIX', '/protected-screenshots/')
+
+
+def _cache_forever(response, max_age):
+    """Mark a response whose URL never changes content as cacheable without revalidation"""
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.immutable = True
+    return response
+
+
+def _is_content_addressed(filename):
+    """True for <sha256>.<ext> originals and their <sha256>.<variant>.webp variants"""
+    digest = filename.split('.', 1)[0]
+    return len(digest) == 64 and set(digest) <= set('0123456789abcdef')
+
+
+def _send_screenshot(folder, filename, immutable):
+    """Send a screenshot with cache validators, or hand it to the front proxy when configured
+
+    Content-addressed files never change under their name, so they get a year-long immutable
+    Cache-Control and their filename as a strong ETag. Anything else is revalidated on each use.
+    """
+    etag = filename if immutable else True
+    if SCREENSHOT_SENDFILE not in ('x-sendfile', 'x-accel-redirect'):
+        response = send_from_directory(folder, filename, etag=etag, conditional=True)
+    else:
+        path = safe_join(folder, filename)
+        if path is None or not os.path.isfile(path):
+            return jsonify({'success': False, 'error': 'Screenshot not found'}), 404
+        stat = os.stat(path)
+        response = app.response_class(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.set_etag(filename if immutable else f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+        response.last_modified = stat.st_mtime
+        response.make_conditional(request)
+        if response.status_code == 200:
+            # The proxy streams the body and answers Range requests itself
+            if SCREENSHOT_SENDFILE == 'x-sendfile':
+                response.headers['X-Sendfile'] = os.path.abspath(path)
+            else:
+                response.headers['X-Accel-Redirect'] = SCREENSHOT_ACCEL_PREFIX.rstrip('/') + '/' + filename
+    if immutable:
+        return _cache_forever(response, SCREENSHOT_CACHE_SECONDS)
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response
+
+
 @app.route('/screenshots/<filename>')
 def serve_screenshot(filename):
     """Serve uploaded screenshots"""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    folder = app.config['UPLOAD_FOLDER']
+    if _is_variant(filename) and not os.path.exists(os.path.join(folder, filename)):
+        # Variant not generated yet: queue it and fall back to the original, uncached so the
+        # browser picks up the real variant once it exists
+        stem = filename.rsplit('.', 2)[0]
+        for ext in sorted(ALLOWED_EXTENSIONS):
+            if os.path.exists(os.path.join(folder, f'{stem}.{ext}')):
+                queue_thumbnails(f'{stem}.{ext}')
+                return _send_screenshot(folder, f'{stem}.{ext}', immutable=False)
+    return _send_screenshot(folder, filename, immutable=_is_content_addressed(filename))
+
+
+# ================== STATIC ASSETS ==================
+# Files under static/ are copied to static/dist as <name>.<hash>.<ext> with .gz/.br siblings.
+# Templates link them through asset_url(), and /assets serves them immutable and precompressed.
+ASSET_SOURCE_FOLDER = app.static_folder
+ASSET_BUILD_FOLDER = os.path.join(app.static_folder, 'dist')
+ASSET_HASH_LENGTH = 12
+ASSET_CACHE_SECONDS = 365 * 24 * 3600
+ASSET_COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.json', '.txt')
+ASSET_MIN_COMPRESS_BYTES = 512
+# Pinned third-party libraries, committed under static/vendor with their licenses. They are
+# always served locally; `flask vendor-assets --force` refreshes them from these URLs.
+VENDOR_ASSETS = {
+    'vendor/fullcalendar/index.global.min.js': 'https://cdn.jsdelivr.net/npm/fullcalendar@6.1.19/index.global.min.js',
+    'vendor/chart.js/chart.umd.js': 'https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.js',
+}
+
+_asset_manifest = None
+_asset_lock = threading.Lock()
+
+
+class MissingAssetError(RuntimeError):
+    """A pinned library is missing from static/vendor"""
+
+
+def _write_atomic(path, data):
+    """Write through a hidden temp file so concurrent workers never see a partial file"""
+    partial = os.path.join(os.path.dirname(path), f'.{os.path.basename(path)}.{uuid.uuid4().hex}.partial')
+    with open(partial, 'wb') as f:
+        f.write(data)
+    os.replace(partial, path)
+
+
+def _write_compressed(path, data):
+    """gzip and, when the brotli package is installed, brotli siblings of a built asset"""
+    if not os.path.exists(path + '.gz'):
+        _write_atomic(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+    brotli = _brotli()
+    if brotli and not os.path.exists(path + '.br'):
+        _write_atomic(path + '.br', brotli.compress(data, quality=11))
+
+
+def build_assets():
+    """Write hashed, precompressed copies of the static files; returns {source path: built path}"""
+    manifest = {}
+    for root, dirs, files in os.walk(ASSET_SOURCE_FOLDER):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != ASSET_BUILD_FOLDER)
+        for name in sorted(files):
+            if name.startswith('.'):
+                continue
+            source = os.path.join(root, name)
+            path = os.path.relpath(source, ASSET_SOURCE_FOLDER).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            stem, ext = os.path.splitext(path)
+            built = f'{stem}.{hashlib.sha256(data).hexdigest()[:ASSET_HASH_LENGTH]}{ext}'
+            target = os.path.join(ASSET_BUILD_FOLDER, *built.split('/'))
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                _write_atomic(target, data)
+            if name.endswith(ASSET_COMPRESSIBLE) and len(data) >= ASSET_MIN_COMPRESS_BYTES:
+                _write_compressed(target, data)
+            manifest[path] = built
+
+    # Drop builds of older versions
+    keep = {os.path.join(ASSET_BUILD_FOLDER, *built.split('/')) for built in manifest.values()}
+    for root, _, files in os.walk(ASSET_BUILD_FOLDER):
+        for name in files:
+            target = os.path.join(root, name)
+            if not name.startswith('.') and name != 'manifest.json' and \
+                    target not in keep and target.rsplit('.', 1)[0] not in keep:
+                os.remove(target)
+    _write_atomic(os.path.join(ASSET_BUILD_FOLDER, 'manifest.json'),
+                  json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+@app.template_global()
+def asset_url(path):
+    """URL of the hashed build of a static file"""
+    global _asset_manifest
+    with _asset_lock:
+        if _asset_manifest is None or app.debug or path in VENDOR_ASSETS and path not in _asset_manifest:
+            _asset_manifest = build_assets()
+    built = _asset_manifest.get(path)
+    if built:
+        return f'/assets/{built}'
+    if path in VENDOR_ASSETS:
+        raise MissingAssetError(
+            f"static/{path} is missing; restore it from git or run `flask --app app vendor-assets`")
+    return f'{app.static_url_path}/{path}'
+
+
+@app.errorhandler(MissingAssetError)
+def missing_asset_page(e):
+    """Plain page naming the missing library instead of a bare 500"""
+    body = ('<!DOCTYPE html><title>ImbLedger</title><h1>Frontend files missing</h1>'
+            f'<p>{html.escape(str(e))}</p>')
+    return Response(body, status=500, mimetype='text/html')
+
+
+def missing_vendor_assets():
+    """Pinned libraries missing from static/vendor"""
+    return [path for path in VENDOR_ASSETS
+            if not os.path.isfile(os.path.join(ASSET_SOURCE_FOLDER, *path.split('/')))]
+
+
+@app.route('/assets/<path:filename>')
+def serve_asset(filename):
+    """Serve a hashed build, precompressed when the client accepts it"""
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        path = safe_join(ASSET_BUILD_FOLDER, filename + suffix)
+        if request.accept_encodings.quality(encoding) > 0 and path and os.path.isfile(path):
+            response = send_from_directory(ASSET_BUILD_FOLDER, filename + suffix, mimetype=mimetype,
+                                           etag=filename + suffix, conditional=True)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(ASSET_BUILD_FOLDER, filename, mimetype=mimetype,
+                                       etag=filename, conditional=True)
+    response.vary.add('Accept-Encoding')
+    return _cache_forever(response, ASSET_CACHE_SECONDS)
+
+
+@app.cli.command('assets')
+def assets_command():
+    """Build hashed, precompressed static bundles into static/dist"""
+    missing = missing_vendor_assets()
+    if missing:
+        raise click.ClickException(f"Missing {', '.join(missing)}; run `flask --app app vendor-assets` first")
+    manifest = build_assets()
+    click.echo(f"Built {len(manifest)} asset(s) into {ASSET_BUILD_FOLDER}")
+
+
+@app.cli.command('vendor-assets')
+@click.option('--force', is_flag=True, help='Download again even if the file exists.')
+def vendor_assets_command(force):
+    """Refresh the pinned third-party libraries in static/vendor"""
+    import urllib.request
+
+    for path, url in VENDOR_ASSETS.items():
+        target = os.path.join(ASSET_SOURCE_FOLDER, *path.split('/'))
+        if os.path.exists(target) and not force:
+            continue
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                data = response.read()
+        except OSError as e:
+            raise click.ClickException(f"Could not download {url}: {e}")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        _write_atomic(target, data)
+        click.echo(f"{path}: {len(data)} bytes")
+
+
+# ================== BACKUPS ==================
+# Online backups with the SQLite backup API: pages are copied in small steps and the source
+# lock is released between steps, so syncs and edits keep writing while a backup runs.
+# A generation is the hot file plus a <name>.archive/ folder with a copy of every archive year.
+BACKUP_FOLDER = os.getenv('BACKUP_DIR', os.path.join(os.path.dirname(__file__), 'backups'))
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '7'))
+BACKUP_INTERVAL_HOURS = float(os.getenv('BACKUP_INTERVAL_HOURS', '0'))
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_PAUSE_SECONDS = 0.005
+BACKUP_PREFIX = 'trading_journal_'
+
+_backup_lock = threading.Lock()
+
+
+def _readonly_uri(path):
+    """file: URI opening an existing database read-only (a missing file is an error, not a new empty database)"""
+    return f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro"
+
+
+def _integrity_check(path):
+    """PRAGMA integrity_check of a database file ('ok' when healthy)"""
+    conn = connect_db(_readonly_uri(path))
+    try:
+        return '; '.join(row[0] for row in conn.execute('PRAGMA integrity_check').fetchall())
+    finally:
+        conn.close()
+
+
+def _copy_database(source_path, dest_path, readonly=False):
+    """Page-stepped copy of source_path into dest_path; returns the page count
+
+    With readonly, source_path must be an existing file and is opened read-only.
+    """
+    pages = {}
+
+    def progress(status, remaining, total):
+        pages['total'] = total
+        # Give writers a window between steps
+        time.sleep(BACKUP_STEP_PAUSE_SECONDS)
+
+    source = connect_db(_readonly_uri(source_path) if readonly else source_path, timeout=30)
+    dest = connect_db(dest_path)
+    try:
+        source.backup(dest, pages=BACKUP_PAGES_PER_STEP, progress=progress)
+    finally:
+        dest.close()
+        source.close()
+    return pages.get('total', 0)
+
+
+def _backup_archive_folder(backup_path):
+    """Folder holding the archive files that belong to a backup generation"""
+    return backup_path[:-len('.db')] + '.archive'
+
+
+def _backup_archive_years(backup_path):
+    folder = _backup_archive_folder(backup_path)
+    if not os.path.isdir(folder):
+        return []
+    return sorted(name[len('trades_'):-len('.db')] for name in os.listdir(folder)
+                  if name.startswith('trades_') and name.endswith('.db'))
+
+
+def list_backups(folder=None):
+    """Backup files in folder, newest first"""
+    folder = folder or BACKUP_FOLDER
+    if not os.path.isdir(folder):
+        return []
+    backups = []
+    for name in sorted(os.listdir(folder), reverse=True):
+        if name.startswith(BACKUP_PREFIX) and name.endswith('.db'):
+            path = os.path.join(folder, name)
+            backups.append({
+                'name': name,
+                'path': path,
+                'size_bytes': os.path.getsize(path),
+                'archive_years': _backup_archive_years(path),
+                'created_at': datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec='seconds')
+            })
+    return backups
+
+
+def _prune_backups(folder, keep):
+    """Delete all but the newest `keep` generations in folder; returns the pruned names"""
+    pruned = []
+    for old in list_backups(folder)[max(keep, 1):]:
+        os.remove(old['path'])
+        shutil.rmtree(_backup_archive_folder(old['path']), ignore_errors=True)
+        pruned.append(old['name'])
+    return pruned
+
+
+def backup_database(folder=None, keep=None, prune=True):
+    """Write a verified backup generation (hot file and archive years) and prune all but the newest `keep`
+
+    The hot file is copied before the archives: a trade archived in between then appears in both
+    copies, which restore_database() reconciles, rather than in neither.
+    """
+    folder = folder or BACKUP_FOLDER
+    keep = BACKUP_KEEP if keep is None else keep
+    os.makedirs(folder, exist_ok=True)
+
+    with _backup_lock:
+        started = time.monotonic()
+        name = f"{BACKUP_PREFIX}{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.db"
+        path = os.path.join(folder, name)
+        partial = path + '.partial'
+        archive_folder = _backup_archive_folder(path)
+        try:
+            pages = _copy_database(app.config['DATABASE_PATH'], partial)
+            integrity = _integrity_check(partial)
+            if integrity != 'ok':
+                raise RuntimeError(f'Backup failed integrity check: {integrity}')
+            years = archive_years()
+            if years:
+                os.makedirs(archive_folder)
+            for year in years:
+                target = os.path.join(archive_folder, f'trades_{year}.db')
+                pages += _copy_database(_archive_path(year), target, readonly=True)
+                archive_integrity = _integrity_check(target)
+                if archive_integrity != 'ok':
+                    raise RuntimeError(f'Backup of archive {year} failed integrity check: {archive_integrity}')
+            os.replace(partial, path)
+        except Exception:
+            shutil.rmtree(archive_folder, ignore_errors=True)
+            raise
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+        pruned = _prune_backups(folder, keep) if prune else []
+
+    return {
+        'name': name,
+        'path': path,
+        'size_bytes': os.path.getsize(path),
+        'archive_years': years,
+        'pages': pages,
+        'integrity': integrity,
+        'elapsed_seconds': round(time.monotonic() - started, 3),
+        'pruned': pruned
+    }
+
+
+def restore_database(backup_path):
+    """Replace the live database and archives with a backup (after checking it and backing up the current data)
+
+    A generation without an archive folder keeps the live archive files. Either way, hot rows of
+    trades that are also archived are dropped so no trade is read twice. Old generations are only
+    pruned once the restore has succeeded, so the safety backup never removes its own source.
+    """
+    if not os.path.isfile(backup_path):
+        raise FileNotFoundError(f'Backup not found, not restoring: {backup_path}')
+    archive_folder = _backup_archive_folder(backup_path)
+    years = _backup_archive_years(backup_path)
+    for path in [backup_path] + [os.path.join(archive_folder, f'trades_{year}.db') for year in years]:
+        integrity = _integrity_check(path)
+        if integrity != 'ok':
+            raise RuntimeError(f'Backup failed integrity check, not restoring: {os.path.basename(path)}: {integrity}')
+    safety = backup_database(prune=False)
+    _copy_database(backup_path, app.config['DATABASE_PATH'], readonly=True)
+    if os.path.isdir(archive_folder):
+        for year in archive_years():
+            if year not in years:
+                os.remove(_archive_path(year))
+        os.makedirs(ARCHIVE_FOLDER, exist_ok=True)
+        for year in years:
+            _copy_database(os.path.join(archive_folder, f'trades_{year}.db'), _archive_path(year), readonly=True)
+    reconcile_archives()
+    # Cached analytics, and every client's copy, describe the replaced data
+    trade_cache.clear()
+    event_bus.publish(None, 'resync', {'reason': 'restore'})
+    with _backup_lock:
+        safety['pruned'] = _prune_backups(os.path.dirname(safety['path']), BACKUP_KEEP)
+    return safety
+
+
+def start_backup_scheduler(interval_hours=None):
+    """Back up every interval_hours on a daemon thread (no-op when the interval is 0)"""
+    interval_hours = BACKUP_INTERVAL_HOURS if interval_hours is None else interval_hours
+    if interval_hours <= 0:
+        return None
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval_hours * 3600):
+            try:
+                result = backup_database()
+                print(f"✅ Backup written: {result['name']} ({result['elapsed_seconds']}s)")
+            except Exception as e:
+                print(f"⚠️ Scheduled backup failed: {e}")
+
+    threading.Thread(target=run, name='backup-scheduler', daemon=True).start()
+    return stop
+
+
+@app.route('/api/backups', methods=['GET', 'POST'])
+def manage_backups():
+    """List backup generations, or take a backup now"""
+    if request.method == 'GET':
+        return jsonify({'backups': [{k: v for k, v in b.items() if k != 'path'} for b in list_backups()]})
+
+    try:
+        result = backup_database()
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    result.pop('path')
+    return jsonify({'success': True, **result})
+
+
+@app.route('/api/backups/restore', methods=['POST'])
+def restore_backup():
+    """Restore a listed backup generation in the running server, so its caches and clients reset"""
+    data = request.get_json(silent=True) or {}
+    backup = next((b for b in list_backups() if b['name'] == data.get('name')), None)
+    if backup is None:
+        return jsonify({'success': False, 'error': 'name must be one of the listed backups'}), 400
+
+    try:
+        safety = restore_database(backup['path'])
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return jsonify({'success': True, 'restored': backup['name'], 'safety_backup': safety['name']})
+
+
+@app.cli.command('backup')
+@click.option('--dest', type=click.Path(file_okay=False), default=None, help='Backup folder (default BACKUP_DIR)')
+@click.option('--keep', type=int, default=None, help='Generations to keep (default BACKUP_KEEP)')
+def backup_command(dest, keep):
+    """Take an online, integrity-checked backup of the journal database"""
+    result = backup_database(dest, keep)
+    click.echo(f"Backup written to {result['path']} ({result['pages']} pages, {result['elapsed_seconds']}s)")
+    for name in result['pruned']:
+        click.echo(f"Pruned {name}")
+
+
+@app.cli.command('restore')
+@click.argument('backup_path', type=click.Path(exists=True, dir_okay=False))
+@click.confirmation_option(prompt='Replace the current journal database with this backup? Stop the server first.')
+def restore_command(backup_path):
+    """Restore the journal database from a backup file (server stopped; use POST /api/backups/restore otherwise)"""
+    safety = restore_database(backup_path)
+    click.echo(f"Restored {backup_path} (previous data saved as {safety['path']})")
+    for name in safety['pruned']:
+        click.echo(f"Pruned {name}")
+
+
+# ================== ARCHIVE ==================
+# Closed trades older than ARCHIVE_AFTER_DAYS and soft-deleted trades move, with their detail
+# rows, into one SQLite file per entry year. Readers that can reach old dates take their
+# tables from archive_tables(), which attaches the matching years and UNION ALLs them in.
+# A connection can attach at most SQLITE_MAX_ATTACHED files, so that also caps the years.
+ARCHIVE_FOLDER = os.getenv('ARCHIVE_DIR', os.path.join(os.path.dirname(__file__), 'archive'))
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '365'))
+ARCHIVE_TABLES = ('trades', 'trade_screenshots') + tuple(table for table, _ in TAG_CATEGORIES.values())
+ARCHIVE_CHUNK_SIZE = 2000
+
+
+def _archive_path(year):
+    return os.path.join(ARCHIVE_FOLDER, f'trades_{year}.db')
+
+
+def archive_years():
+    """Years that have an archive file, oldest first"""
+    if not os.path.isdir(ARCHIVE_FOLDER):
+        return []
+    return sorted(
+        name[len('trades_'):-len('.db')] for name in os.listdir(ARCHIVE_FOLDER)
+        if name.startswith('trades_') and name.endswith('.db') and name[len('trades_'):-len('.db')].isdigit()
+    )
+
+
+def _attach_limit(conn):
+    """Databases one connection can attach (SQLITE_MAX_ATTACHED, 10 by default)"""
+    try:
+        return conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    except AttributeError:  # Python < 3.11
+        return 10
+
+
+def _attach_archive(conn, year):
+    """Attach the year's archive file as archive_<year> (once per connection); returns the schema name
+
+    ATTACH is not allowed inside a transaction, so read archive_tables() before writing.
+    """
+    schema = f'archive_{year}'
+    if schema not in {row[1] for row in conn.execute('PRAGMA database_list').fetchall()}:
+        conn.execute(f'ATTACH DATABASE ? AS {schema}', (_archive_path(year),))
+    return schema
+
+
+def _detach_archive(conn, schema):
+    if schema in {row[1] for row in conn.execute('PRAGMA database_list').fetchall()}:
+        conn.execute(f'DETACH DATABASE {schema}')
+
+
+def _table_columns(conn, schema, table):
+    return [row[1] for row in conn.execute(f'PRAGMA {schema}.table_info({table})').fetchall()]
+
+
+def _archive_select(conn, schema, table):
+    """SELECT of a hot or archived table with the hot table's columns (NULL for columns added since)
+
+    Detail tables also expose rowid, which orders a trade's tags.
+    """
+    archived = set(_table_columns(conn, schema, table))
+    columns = [c if c in archived else f'NULL AS {c}' for c in _table_columns(conn, 'main', table)]
+    if table != 'trades':
+        columns.insert(0, 'rowid AS rowid')
+    return f"SELECT {', '.join(columns)} FROM {schema}.{table}"
+
+
+def _archive_range(period='all', start_date=None, end_date=None):
+    """(first year, last year) of archives a period filter can reach (None for open ends)"""
+    if start_date and end_date:
+        return start_date[:4], end_date[:4]
+    if period in ('today', 'week', 'month'):
+        return str((date.today() - timedelta(days=31)).year), None
+    return None, None
+
+
+def archive_tables(conn, period='all', start_date=None, end_date=None):
+    """{table: FROM expression} spanning hot rows and the archived years the period can reach
+
+    Without matching archives the plain table names come back, so hot-only reads are unchanged.
+    Only the selected years are attached, when first needed.
+    """
+    first, last = _archive_range(period, start_date, end_date)
+    years = [y for y in archive_years() if (first is None or y >= first) and (last is None or y <= last)]
+    if not years:
+        return {table: table for table in ARCHIVE_TABLES}
+
+    schemas = [_attach_archive(conn, year) for year in years]
+    tables = {}
+    for table in ARCHIVE_TABLES:
+        parts = [_archive_select(conn, schema, table) for schema in ('main', *schemas)]
+        tables[table] = f"({' UNION ALL '.join(parts)})"
+    return tables
+
+
+def _prepare_archive(conn, schema):
+    """Create missing archive tables and columns so they match the hot schema"""
+    for table in ARCHIVE_TABLES:
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {schema}.{table} AS SELECT * FROM main.{table} WHERE 0')
+        archived = set(_table_columns(conn, schema, table))
+        for column in _table_columns(conn, 'main', table):
+            if column not in archived:
+                conn.execute(f'ALTER TABLE {schema}.{table} ADD COLUMN {column}')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS {schema}.idx_trades_user_time ON trades (user_id, entry_time)')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS {schema}.idx_trades_id ON trades (id)')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS {schema}.idx_trades_external ON trades (user_id, external_id)')
+    for table in ARCHIVE_TABLES[1:]:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {schema}.idx_{table}_trade ON {table} (trade_id)')
+
+
+def archive_trades(conn, older_than_days=None, user_id=None, progress=None):
+    """Move cold closed trades and soft-deleted trades into yearly archive files
+
+    Returns {year: trades moved}. Aggregates (period summaries, sketches, the trade cache)
+    read through archive_tables() and so are unchanged by the move.
+    """
+    older_than_days = ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).strftime('%Y-%m-%d')
+    where = "(is_deleted = 1 OR (status = 'closed' AND COALESCE(exit_time, entry_time) < ?))"
+    params = [cutoff]
+    if user_id is not None:
+        where += ' AND user_id = ?'
+        params.append(user_id)
+
+    candidates = {}
+    for row in conn.execute(f"SELECT id, strftime('%Y', entry_time) FROM trades WHERE {where}", params).fetchall():
+        if row[1]:
+            candidates.setdefault(row[1], []).append(row[0])
+    if not candidates:
+        return {}
+
+    # Never create more yearly files than one connection can attach for an all-time read;
+    # trades of years past the limit stay hot
+    existing = set(archive_years())
+    new_years = sorted(set(candidates) - existing)
+    for year in new_years[max(_attach_limit(conn) - len(existing), 0):]:
+        print(f"⚠️ Not archiving {len(candidates.pop(year))} trade(s) from {year}: "
+              f"{len(existing)} archive years already exist (limit {_attach_limit(conn)})")
+    if not candidates:
+        return {}
+
+    os.makedirs(ARCHIVE_FOLDER, exist_ok=True)
+    conn.commit()
+    for schema in [row[1] for row in conn.execute('PRAGMA database_list').fetchall()]:
+        if schema.startswith('archive_'):
+            _detach_archive(conn, schema)
+    moved = {}
+    for year, ids in sorted(candidates.items()):
+        schema = _attach_archive(conn, year)
+        _prepare_archive(conn, schema)
+        conn.commit()
+        for start in range(0, len(ids), ARCHIVE_CHUNK_SIZE):
+            id_list = json.dumps(ids[start:start + ARCHIVE_CHUNK_SIZE])
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for table in ARCHIVE_TABLES:
+                    key = 'id' if table == 'trades' else 'trade_id'
+                    columns = ', '.join(_table_columns(conn, 'main', table))
+                    conn.execute(f'''
+                        INSERT INTO {schema}.{table} ({columns})
+                        SELECT {columns} FROM main.{table}
+                        WHERE {key} IN (SELECT value FROM json_each(?)) ORDER BY rowid
+                    ''', (id_list,))
+                # Trades first, so the change-log triggers on detail rows have no trade left to touch
+                for table in ARCHIVE_TABLES:
+                    key = 'id' if table == 'trades' else 'trade_id'
+                    conn.execute(f'DELETE FROM main.{table} WHERE {key} IN (SELECT value FROM json_each(?))', (id_list,))
+                # The delete trigger dropped references that now live in the archive
+                conn.execute(f'''
+                    UPDATE screenshot_blobs SET ref_count = ref_count + (
+                        SELECT COUNT(*) FROM {schema}.trade_screenshots s
+                        WHERE s.trade_id IN (SELECT value FROM json_each(?))
+                          AND s.screenshot_url = '/screenshots/' || screenshot_blobs.filename
+                    )
+                ''', (id_list,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            moved[year] = moved.get(year, 0) + len(ids[start:start + ARCHIVE_CHUNK_SIZE])
+            if progress:
+                progress(year, moved[year], len(ids))
+        _detach_archive(conn, schema)
+    return moved
+
+
+def reconcile_archives(conn=None):
+    """Delete hot rows of trades that are also in an archive file (e.g. after restoring an older backup)
+
+    The archived copy wins; returns the number of hot trades removed.
+    """
+    own = conn is None
+    conn = conn or connect_db()
+    removed = 0
+    for year in archive_years():
+        schema = _attach_archive(conn, year)
+        try:
+            ids = json.dumps([row[0] for row in conn.execute(
+                f'SELECT id FROM main.trades WHERE id IN (SELECT id FROM {schema}.trades)'
+            ).fetchall()])
+            if ids != '[]':
+                for table in ARCHIVE_TABLES:
+                    key = 'id' if table == 'trades' else 'trade_id'
+                    cursor = conn.execute(
+                        f'DELETE FROM main.{table} WHERE {key} IN (SELECT value FROM json_each(?))', (ids,)
+                    )
+                    removed += cursor.rowcount if table == 'trades' else 0
+                conn.commit()
+        finally:
+            _detach_archive(conn, schema)
+    if removed:
+        recount_screenshot_refs(conn)
+        conn.commit()
+    if own:
+        conn.close()
+    return removed
+
+
+@app.cli.command('archive-trades')
+@click.option('--older-than-days', type=int, default=None, help='Archive horizon (default ARCHIVE_AFTER_DAYS)')
+@click.option('--user-id', type=int, default=None, help='Only archive this user\'s trades')
+@click.option('--vacuum', is_flag=True, help='VACUUM the hot database afterwards to return the space')
+def archive_trades_command(older_than_days, user_id, vacuum):
+    """Move old closed trades and soft-deleted trades into yearly archive files"""
+    conn = get_db_connection()
+    moved = archive_trades(
+        conn, older_than_days, user_id,
+        progress=lambda year, done, total: click.echo(f"{year}: {done}/{total} trade(s) archived")
+    )
+    if vacuum and moved:
+        conn.execute('VACUUM')
+    conn.close()
+    click.echo(f"Archived {sum(moved.values())} trade(s) into {len(moved)} yearly file(s)")
+
+
+# ================== APPLICATION FACTORY ==================
+def create_app(config=None):
+    """Apply config (e.g. DATABASE_PATH, TESTING) and set up the database schema
+
+    Routes are registered on the module-level app, so this configures and returns that instance.
+    Importing the module does no I/O; the schema is created here, by `flask init-db`, or on the
+    first connection of an app that skipped both.
+    """
+    if config:
+        app.config.update(config)
+    init_db()
+    return app
+
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create or migrate the database schema"""
+    init_db()
+    click.echo(f"Database ready: {app.config['DATABASE_PATH']}")
 
 
 # ================== RUN APPLICATION ==================
@@ -2071,4 +6672,7 @@ if __name__ == '__main__':
     print(f"Server: http://localhost:5000")
     print("=" * 60)
 
+    create_app()
+    start_backup_scheduler()
+    backfill_thumbnails()
     app.run(debug=False, port=5000, host='0.0.0.0')
@@ -0,0 +1,1922 @@
+let calendar;
+let currentPeriod = 'all';
+let customStartDate = '';
+let customEndDate = '';
+let statsOpen = true; // 🔥 FIX: Start with stats section OPEN so performance data is visible
+let calendarDates = {};
+let avgHoldingSeconds = null;
+let pnlChart = null;
+let statsFilter = {
+    weeklyBias: 'all',
+    dailyBias: 'all',
+    asset: 'all',
+    side: 'all'
+};
+
+// Moon phases (Full Moon 🌕 and New Moon 🌑) - Dublin Time (UTC+0/+1)
+const moonPhases = {
+    // 2025
+    '2025-01-03': 'full',
+    '2025-01-18': 'new',
+    '2025-02-01': 'full',
+    '2025-02-17': 'new',
+    '2025-03-03': 'full',
+    '2025-03-18': 'new',
+    '2025-04-01': 'full',
+    '2025-04-16': 'new',
+    '2025-05-01': 'full',
+    '2025-05-16': 'new',
+    '2025-05-30': 'full',
+    '2025-06-14': 'new',
+    '2025-06-29': 'full',
+    '2025-07-14': 'new',
+    '2025-07-28': 'full',
+    '2025-08-12': 'new',
+    '2025-08-27': 'full',
+    '2025-09-11': 'new',
+    '2025-09-25': 'full',
+    '2025-10-10': 'new',
+    '2025-10-25': 'full',
+    '2025-11-09': 'new',
+    '2025-11-23': 'full',
+    '2025-12-08': 'new',
+    '2025-12-23': 'full',
+    // 2026
+    '2026-01-03': 'full',
+    '2026-01-18': 'new',
+    '2026-02-01': 'full',
+    '2026-02-17': 'new',
+    '2026-03-03': 'full',
+    '2026-03-18': 'new',
+    '2026-04-01': 'full',
+    '2026-04-16': 'new',
+    '2026-05-01': 'full',
+    '2026-05-16': 'new',
+    '2026-05-30': 'full',
+    '2026-06-14': 'new',
+    '2026-06-29': 'full',
+    '2026-07-14': 'new',
+    '2026-07-28': 'full',
+    '2026-08-12': 'new',
+    '2026-08-27': 'full',
+    '2026-09-11': 'new',
+    '2026-09-25': 'full',
+    '2026-10-10': 'new',
+    '2026-10-25': 'full',
+    '2026-11-09': 'new',
+    '2026-11-23': 'full',
+    '2026-12-08': 'new',
+    '2026-12-23': 'full'
+};
+
+function clearLoading() {
+    console.log('[UI] Clearing loading state');
+    const statusEl = document.getElementById('apiStatus');
+    if (statusEl) {
+        // Clear "Loading..." text
+        if (statusEl.textContent === 'Loading...') {
+            statusEl.textContent = '';
+        }
+        // Remove any loading class if present
+        statusEl.classList.remove('loading');
+    }
+}
+
+function renderConnected(data) {
+    console.log('[UI] renderConnected called with:', data);
+
+    // CRITICAL: Always clear loading state first
+    clearLoading();
+
+    // Hide API inputs when connected
+    const apiKey = document.getElementById('apiKey');
+    const apiSecret = document.getElementById('apiSecret');
+    const saveBtn = document.querySelector('button[onclick="saveApiCredentials()"]');
+    const syncBtn = document.querySelector('button[onclick="syncBybitTrades()"]');
+    const statusEl = document.getElementById('apiStatus');
+
+    if (apiKey) apiKey.style.display = 'none';
+    if (apiSecret) apiSecret.style.display = 'none';
+    if (saveBtn) saveBtn.style.display = 'none';
+
+    // Show sync button only when connected
+    if (syncBtn) syncBtn.style.display = 'block';
+
+    if (statusEl) {
+        statusEl.textContent = `Connected to Bybit (**${data.api_key_last4})`;
+        statusEl.classList.add('connected');
+    }
+
+    // Load all the data
+    syncAllBybitData();
+    loadUsers();
+    initCalendar();
+    loadDashboard();
+}
+
+function renderDisconnected() {
+    console.log('[UI] renderDisconnected called');
+
+    // CRITICAL: Always clear loading state first
+    clearLoading();
+
+    // Show API inputs when not connected
+    const apiKey = document.getElementById('apiKey');
+    const apiSecret = document.getElementById('apiSecret');
+    const saveBtn = document.querySelector('button[onclick="saveApiCredentials()"]');
+    const syncBtn = document.querySelector('button[onclick="syncBybitTrades()"]');
+    const statusEl = document.getElementById('apiStatus');
+
+    if (apiKey) apiKey.style.display = 'block';
+    if (apiSecret) apiSecret.style.display = 'block';
+    if (saveBtn) saveBtn.style.display = 'block';
+
+    // Hide sync button when not connected
+    if (syncBtn) syncBtn.style.display = 'none';
+
+    if (statusEl) {
+        statusEl.textContent = 'Not Connected';
+        statusEl.classList.remove('connected');
+    }
+
+    // Still load basic data
+    loadUsers();
+    initCalendar();
+    loadDashboard();
+}
+
+document.addEventListener('DOMContentLoaded', async () => {
+    console.log('[UI] Page loaded');
+    initTradeTable();
+    connectEvents();
+
+    // Fail-safe timeout: ensure UI never hangs forever
+    let loadingComplete = false;
+    setTimeout(() => {
+        if (!loadingComplete) {
+            console.warn('[UI] Loading timeout fallback - forcing disconnected state');
+            clearLoading();
+            renderDisconnected();
+        }
+    }, 5000);
+
+    try {
+        console.log('[UI] Fetching credentials...');
+        const res = await fetch('/api/get_bybit_credentials');
+        console.log('[UI] Response status:', res.status);
+
+        const data = await res.json();
+        console.log('[UI] Response data:', data);
+
+        if (data.connected) {
+            clearLoading();
+            console.log('[UI] Rendering CONNECTED');
+            renderConnected(data);
+            loadingComplete = true;
+        } else {
+            clearLoading();
+            console.log('[UI] Rendering DISCONNECTED');
+            renderDisconnected();
+            loadingComplete = true;
+        }
+    } catch (err) {
+        console.error('[UI] Fatal error:', err);
+        clearLoading();
+        renderDisconnected();
+        loadingComplete = true;
+    }
+});
+
+// ================== USER MANAGEMENT ==================
+async function loadUsers() {
+    try {
+        const response = await fetch('/api/users');
+        const data = await response.json();
+
+        const userSelect = document.getElementById('userSelect');
+        userSelect.innerHTML = '';
+
+        data.users.forEach(user => {
+            const option = document.createElement('option');
+            option.value = user.id;
+            option.textContent = user.username;
+            if (user.id === data.current_user_id) {
+                option.selected = true;
+            }
+            userSelect.appendChild(option);
+        });
+    } catch (error) {
+        console.error('Error loading users:', error);
+    }
+}
+
+async function switchUser() {
+    const userId = document.getElementById('userSelect').value;
+
+    try {
+        const response = await fetch(`/api/switch_user/${userId}`, {
+            method: 'POST'
+        });
+        const data = await response.json();
+
+        if (data.success) {
+            // Reload all data for new user
+            location.reload();
+        } else {
+            alert('Error switching user: ' + data.error);
+        }
+    } catch (error) {
+        console.error('Error switching user:', error);
+        alert('Error switching user');
+    }
+}
+
+function showAddUserDialog() {
+    const username = prompt('Enter username for new user:');
+    if (!username || username.trim() === '') return;
+
+    createUser(username.trim());
+}
+
+async function createUser(username) {
+    try {
+        const response = await fetch('/api/users', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ username })
+        });
+        const data = await response.json();
+
+        if (data.success) {
+            // Reload to switch to new user
+            location.reload();
+        } else {
+            alert('Error creating user: ' + data.error);
+        }
+    } catch (error) {
+        console.error('Error creating user:', error);
+        alert('Error creating user');
+    }
+}
+
+function initCalendar() {
+    const calendarEl = document.getElementById('calendar');
+    calendar = new FullCalendar.Calendar(calendarEl, {
+        initialView: 'dayGridMonth',
+        initialDate: new Date(), // Always start with current month
+        height: 'auto',
+        firstDay: 1,
+        headerToolbar: {
+            left: 'prev,next',
+            center: 'title',
+            right: ''
+        },
+        dayCellDidMount: function(info) {
+            const dateStr = info.date.toISOString().split('T')[0];
+
+            // Add moon phase indicator
+            if (moonPhases[dateStr]) {
+                const moonDiv = document.createElement('div');
+                moonDiv.className = 'moon-phase';
+                moonDiv.textContent = moonPhases[dateStr] === 'full' ? '🌕' : '🌑';
+                moonDiv.title = moonPhases[dateStr] === 'full' ? 'Full Moon' : 'New Moon';
+                info.el.appendChild(moonDiv);
+            }
+
+            if (calendarDates[dateStr]) {
+                const dayData = calendarDates[dateStr];
+
+                // Removed background color coding - P&L color is enough
+
+                const statsDiv = document.createElement('div');
+                statsDiv.className = 'day-stats';
+                statsDiv.innerHTML = `
+                    <div class="day-trades">${dayData.count} trade${dayData.count > 1 ? 's' : ''}</div>
+                    <div class="day-pnl ${dayData.pnl >= 0 ? 'positive' : 'negative'}">${dayData.pnl >= 0 ? '+' : ''}${dayData.pnl.toFixed(0)}</div>
+                    <div class="day-wr">${dayData.winRate.toFixed(0)}% WR</div>
+                `;
+                info.el.appendChild(statsDiv);
+            }
+        },
+        dateClick: function(info) {
+            showDayTrades(info.dateStr);
+        }
+    });
+    calendar.render();
+}
+
+async function loadCalendarData() {
+    try {
+        const response = await fetch('/api/calendar_data');
+        renderCalendarData(await response.json());
+    } catch (error) {
+        console.error('Error loading calendar:', error);
+        alert('Error loading calendar data');
+    }
+}
+
+function renderCalendarData(events) {
+    calendarDates = {};
+    events.forEach(event => {
+        calendarDates[event.start] = {
+            pnl: event.extendedProps.pnl,
+            count: event.extendedProps.trade_count,
+            winRate: event.extendedProps.win_rate
+        };
+    });
+
+    // Re-render all day cells with updated data
+    if (calendar) {
+        const allDayCells = document.querySelectorAll('.fc-daygrid-day');
+        allDayCells.forEach(dayCell => {
+            const dateStr = dayCell.getAttribute('data-date');
+            if (dateStr && calendarDates[dateStr]) {
+                // Remove old stats if exists
+                const oldStats = dayCell.querySelector('.day-stats');
+                if (oldStats) oldStats.remove();
+
+                // Add new stats
+                const dayData = calendarDates[dateStr];
+                const statsDiv = document.createElement('div');
+                statsDiv.className = 'day-stats';
+                statsDiv.innerHTML = `
+                    <div class="day-trades">${dayData.count} trade${dayData.count > 1 ? 's' : ''}</div>
+                    <div class="day-pnl ${dayData.pnl >= 0 ? 'positive' : 'negative'}">${dayData.pnl >= 0 ? '+' : ''}${dayData.pnl.toFixed(0)}</div>
+                    <div class="day-wr">${dayData.winRate.toFixed(0)}% WR</div>
+                `;
+                dayCell.querySelector('.fc-daygrid-day-frame').appendChild(statsDiv);
+            }
+        });
+    }
+}
+
+function toggleStats() {
+    statsOpen = !statsOpen;
+    const content = document.getElementById('statsContent');
+    const toggle = document.getElementById('statsToggle');
+
+    if (statsOpen) {
+        content.classList.add('open');
+        toggle.classList.add('open');
+    } else {
+        content.classList.remove('open');
+        toggle.classList.remove('open');
+    }
+}
+
+function changePeriod(period) {
+    currentPeriod = period;
+
+    const customRange = document.getElementById('customRange');
+    if (customRange) {
+        customRange.style.display = period === 'custom' ? 'flex' : 'none';
+    }
+
+    document.querySelectorAll('.period-tab').forEach(tab => {
+        tab.classList.remove('active');
+    });
+    document.querySelector(`[data-period="${period}"]`).classList.add('active');
+
+    if (period !== 'custom') {
+        customStartDate = '';
+        customEndDate = '';
+        loadTrades();
+    }
+}
+
+function applyCustomRange() {
+    const start = document.getElementById('customStart')?.value || '';
+    const end = document.getElementById('customEnd')?.value || '';
+
+    if (!start || !end) {
+        alert('Please select both dates');
+        return;
+    }
+
+    customStartDate = start;
+    customEndDate = end;
+    loadTrades();
+}
+
+// Expand a list sent as ?columnar=1 ({columns: {field: [values]}, length}) back into row objects
+function fromColumnar(table) {
+    if (!table || Array.isArray(table) || !table.columns) return table;
+    const fields = Object.keys(table.columns);
+    const rows = new Array(table.length);
+    for (let i = 0; i < table.length; i++) {
+        const row = {};
+        for (const field of fields) row[field] = table.columns[field][i];
+        rows[i] = row;
+    }
+    return rows;
+}
+
+async function loadTrades() {
+    try {
+        let url = `/api/dashboard?sections=trades&trade_limit=0&period=${currentPeriod}`;
+        if (currentPeriod === 'custom' && customStartDate && customEndDate) {
+            url += `&start_date=${customStartDate}&end_date=${customEndDate}`;
+        }
+
+        const response = await fetch(url);
+        const data = await response.json();
+
+        renderTrades(data.trades);
+        updateStatsFilter();
+        updatePnlChart();
+
+        // Load performance stats from backend
+        loadPerformanceStats();
+
+    } catch (error) {
+        console.error('Error loading trades:', error);
+        alert('Error loading trades');
+    }
+}
+
+function renderTrades(data) {
+    avgHoldingSeconds = data.avg_holding_seconds;
+
+    updateMetrics(data.statistics);
+    populateAssetFilter(data.assets);
+    resetTradeTable();
+}
+
+// One round trip for everything on first paint (trades, risk, time, calendar, chart, breakdowns)
+async function loadDashboard() {
+    try {
+        const canvas = document.getElementById('pnlChart');
+        const params = new URLSearchParams({
+            period: currentPeriod,
+            asset: statsFilter.asset,
+            weekly_bias: statsFilter.weeklyBias,
+            daily_bias: statsFilter.dailyBias,
+            side: statsFilter.side,
+            points: Math.max(100, Math.round((canvas && canvas.clientWidth) || 500)),
+            // The trade table pages its own rows
+            trade_limit: 0
+        });
+        if (currentPeriod === 'custom' && customStartDate && customEndDate) {
+            params.append('start_date', customStartDate);
+            params.append('end_date', customEndDate);
+        }
+
+        const response = await fetch(`/api/dashboard?${params}`);
+        const data = await response.json();
+
+        renderTrades(data.trades);
+        displayOpenTrades(data.open_trades.trades);
+        renderRiskMetrics(data.risk_metrics);
+        renderHourHeatmap(data.time_analytics.by_hour);
+        renderDayHeatmap(data.time_analytics.by_day);
+        renderCalendarData(data.calendar);
+        renderPnlChart(data.equity_curve);
+        renderPerformanceStats(data.by_model, data.by_confirmation, data.by_entry, data.by_key_level);
+    } catch (error) {
+        console.error('Error loading dashboard:', error);
+    }
+}
+
+async function loadOpenTrades() {
+    try {
+        const response = await fetch('/api/trades?status=open&columnar=1');
+        const data = await response.json();
+        displayOpenTrades(fromColumnar(data.trades));
+    } catch (error) {
+        console.error('Error loading open trades:', error);
+    }
+}
+
+function populateAssetFilter(assets) {
+    const assetFilter = document.getElementById('assetFilter');
+    const currentValue = assetFilter.value;
+
+    assetFilter.innerHTML = '<option value="all">All Assets</option>' +
+        assets.map(asset => `<option value="${asset}">${asset}</option>`).join('');
+
+    if (assets.includes(currentValue)) {
+        assetFilter.value = currentValue;
+    }
+}
+
+function updateMetrics(stats) {
+    document.getElementById('totalPnl').textContent = '$' + stats.total_pnl.toFixed(2);
+    document.getElementById('totalPnl').className = 'metric-value ' + (stats.total_pnl >= 0 ? 'positive' : 'negative');
+
+    document.getElementById('totalTrades').textContent = stats.total_trades;
+
+    // Fetch and display account balance
+    fetchAccountBalance();
+
+    document.getElementById('avgWin').textContent = '$' + stats.avg_win.toFixed(2);
+    document.getElementById('avgLoss').textContent = '$' + stats.avg_loss.toFixed(2);
+    document.getElementById('profitFactor').textContent = stats.profit_factor.toFixed(2);
+
+    updateBestPerformers();
+
+    updateWinRateChart(stats.win_rate);
+}
+
+function updateBestPerformers() {
+    // Average hold period, computed server-side over the period's closed trades
+    if (avgHoldingSeconds) {
+        const hours = avgHoldingSeconds / 3600;
+
+        let displayText;
+        if (hours < 1) {
+            const minutes = Math.round(hours * 60);
+            displayText = `${minutes}m`;
+        } else if (hours < 24) {
+            displayText = `${hours.toFixed(1)}h`;
+        } else {
+            const days = hours / 24;
+            displayText = `${days.toFixed(1)}d`;
+        }
+
+        document.getElementById('avgHoldPeriod').textContent = displayText;
+    } else {
+        document.getElementById('avgHoldPeriod').textContent = '-';
+    }
+}
+
+async function fetchAccountBalance() {
+    try {
+        const response = await fetch('/api/bybit/balance');
+        const data = await response.json();
+
+        const balanceEl = document.getElementById('accountBalance');
+
+        if (data.success && data.balance !== undefined) {
+            balanceEl.textContent = '$' + data.balance.toFixed(2);
+            balanceEl.style.color = '';
+            balanceEl.classList.remove('disconnected');
+        } else {
+            balanceEl.textContent = '$0';
+            balanceEl.style.color = '#999';
+            balanceEl.classList.add('disconnected');
+        }
+    } catch (error) {
+        console.error('Error fetching balance:', error);
+        const balanceEl = document.getElementById('accountBalance');
+        if (balanceEl) {
+            balanceEl.textContent = '$0';
+            balanceEl.style.color = '#999';
+            balanceEl.classList.add('disconnected');
+        }
+    }
+}
+
+async function loadRiskMetrics() {
+    try {
+        const response = await fetch('/api/risk_metrics');
+        renderRiskMetrics(await response.json());
+    } catch (error) {
+        console.error('Error loading risk metrics:', error);
+    }
+}
+
+function renderRiskMetrics(data) {
+    document.getElementById('maxDrawdown').textContent = '$' + Math.abs(data.max_drawdown).toFixed(2);
+    document.getElementById('maxDrawdownPct').textContent = data.max_drawdown_pct.toFixed(1) + '%';
+
+    const expectancyEl = document.getElementById('expectancy');
+    expectancyEl.textContent = '$' + data.expectancy.toFixed(2);
+    expectancyEl.className = 'risk-value ' + (data.expectancy >= 0 ? 'positive' : 'negative');
+
+    document.getElementById('avgRRRatio').textContent = data.avg_rr_ratio.toFixed(2) + ':1';
+    document.getElementById('maxWinStreak').textContent = data.consecutive_wins;
+    document.getElementById('maxLossStreak').textContent = data.consecutive_losses;
+    document.getElementById('largestWin').textContent = '$' + data.largest_win.toFixed(2);
+    document.getElementById('largestLoss').textContent = '$' + Math.abs(data.largest_loss).toFixed(2);
+}
+
+// ================== TIME ANALYTICS ==================
+async function loadTimeAnalytics() {
+    try {
+        const response = await fetch('/api/time_analytics');
+        const data = await response.json();
+
+        renderHourHeatmap(data.by_hour);
+        renderDayHeatmap(data.by_day);
+    } catch (error) {
+        console.error('Error loading time analytics:', error);
+    }
+}
+
+function renderHourHeatmap(hourStats) {
+    const container = document.getElementById('hourHeatmap');
+    container.innerHTML = '';
+
+    // Calculate max absolute P&L for intensity scaling
+    let maxPnl = 0;
+    Object.values(hourStats).forEach(stats => {
+        if (Math.abs(stats.total_pnl) > maxPnl) maxPnl = Math.abs(stats.total_pnl);
+    });
+
+    // Create all 24 hours
+    for (let hour = 0; hour < 24; hour++) {
+        const stats = hourStats[hour.toString()] || { count: 0, total_pnl: 0, win_rate: 0 };
+
+        const cell = document.createElement('div');
+        cell.className = 'heatmap-cell';
+
+        if (stats.count === 0) {
+            cell.classList.add('empty');
+            cell.title = `${hour.toString().padStart(2, '0')}:00 - No trades`;
+        } else {
+            const intensity = maxPnl > 0 ? Math.abs(stats.total_pnl) / maxPnl : 0;
+
+            if (stats.total_pnl > 0) {
+                if (intensity < 0.33) cell.classList.add('profit-low');
+                else if (intensity < 0.66) cell.classList.add('profit-med');
+                else cell.classList.add('profit-high');
+            } else if (stats.total_pnl < 0) {
+                if (intensity < 0.33) cell.classList.add('loss-low');
+                else if (intensity < 0.66) cell.classList.add('loss-med');
+                else cell.classList.add('loss-high');
+            } else {
+                cell.classList.add('empty');
+            }
+
+            cell.title = `${hour.toString().padStart(2, '0')}:00 - ${stats.count} trades | $${stats.total_pnl.toFixed(2)} | ${stats.win_rate}% WR`;
+        }
+
+        container.appendChild(cell);
+    }
+}
+
+function renderDayHeatmap(dayStats) {
+    const container = document.getElementById('dayHeatmap');
+    container.innerHTML = '';
+
+    const dayNames = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'];
+
+    // Calculate max absolute P&L for intensity scaling
+    let maxPnl = 0;
+    Object.values(dayStats).forEach(stats => {
+        if (Math.abs(stats.total_pnl) > maxPnl) maxPnl = Math.abs(stats.total_pnl);
+    });
+
+    for (let i = 0; i < 7; i++) {
+        const stats = dayStats[i.toString()] || { count: 0, total_pnl: 0, win_rate: 0 };
+
+        const cell = document.createElement('div');
+        cell.className = 'heatmap-cell';
+
+        if (stats.count === 0) {
+            cell.classList.add('empty');
+            cell.title = `${dayNames[i]} - No trades`;
+        } else {
+            const intensity = maxPnl > 0 ? Math.abs(stats.total_pnl) / maxPnl : 0;
+
+            if (stats.total_pnl > 0) {
+                if (intensity < 0.33) cell.classList.add('profit-low');
+                else if (intensity < 0.66) cell.classList.add('profit-med');
+                else cell.classList.add('profit-high');
+            } else if (stats.total_pnl < 0) {
+                if (intensity < 0.33) cell.classList.add('loss-low');
+                else if (intensity < 0.66) cell.classList.add('loss-med');
+                else cell.classList.add('loss-high');
+            } else {
+                cell.classList.add('empty');
+            }
+
+            cell.title = `${dayNames[i]} - ${stats.count} trades | $${stats.total_pnl.toFixed(2)} | ${stats.win_rate}% WR`;
+        }
+
+        container.appendChild(cell);
+    }
+}
+
+let winRateChart = null;
+
+function updateWinRateChart(winRate) {
+    const ctx = document.getElementById('winRateChart').getContext('2d');
+    const winRateValue = document.getElementById('winRateValue');
+
+    winRateValue.textContent = winRate + '%';
+
+    let color;
+    if (winRate >= 60) color = '#00ff88';
+    else if (winRate >= 50) color = '#3b82f6';
+    else if (winRate >= 40) color = '#f59e0b';
+    else color = '#ff3366';
+
+    if (winRateChart) {
+        winRateChart.destroy();
+    }
+
+    winRateChart = new Chart(ctx, {
+        type: 'doughnut',
+        data: {
+            datasets: [{
+                data: [winRate, 100 - winRate],
+                backgroundColor: [color, 'rgba(255, 255, 255, 0.05)'],
+                borderWidth: 0
+            }]
+        },
+        options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            cutout: '88%',
+            rotation: -90,
+            circumference: 180,
+            plugins: {
+                legend: { display: false },
+                tooltip: { enabled: false }
+            }
+        }
+    });
+}
+
+function displayOpenTrades(trades) {
+    const container = document.getElementById('openTradesList');
+    if (trades.length === 0) {
+        container.innerHTML = '<p style="text-align: center; color: #bbbbbb; padding: 20px;">No open trades</p>';
+        return;
+    }
+
+    container.innerHTML = trades.map(trade => {
+        const currentPnl = trade.side === 'long'
+            ? (trade.entry_price * trade.quantity * 0.02)
+            : -(trade.entry_price * trade.quantity * 0.02);
+
+        return `
+            <div class="trade-card open" onclick="editTrade(${trade.id})">
+                <div class="trade-header">
+                    <span class="trade-asset" style="display: flex; align-items: center; gap: 8px;">
+                        <img src="${getCryptoLogo(trade.asset)}"
+                             alt="${trade.asset}"
+                             style="width: 24px; height: 24px; border-radius: 50%;"
+                             onerror="this.style.display='none'">
+                        <span>
+                            ${trade.asset} ${trade.side.toUpperCase()}
+                            <span class="bias-badge ${trade.weekly_bias}">${trade.weekly_bias[0].toUpperCase()}</span>
+                            <span class="bias-badge ${trade.daily_bias}">${trade.daily_bias[0].toUpperCase()}</span>
+                        </span>
+                    </span>
+                    <span class="trade-pnl ${currentPnl >= 0 ? 'positive' : 'negative'}">
+                        ${currentPnl >= 0 ? '+' : ''}$${currentPnl.toFixed(2)}
+                    </span>
+                </div>
+                <div class="trade-details">
+                    Entry: $${trade.entry_price} • Qty: ${trade.quantity}<br>
+                    ${new Date(trade.entry_time).toLocaleString()}
+                </div>
+            </div>
+        `;
+    }).join('');
+}
+
+function getCryptoLogo(symbol) {
+    // Extract base symbol (remove USDT, PERP, etc.)
+    const baseSymbol = symbol.replace(/USDT|PERP|USD|-.*$/gi, '').toLowerCase();
+    // Use CoinGecko API for crypto logos (free, no API key needed)
+    return `https://assets.coincap.io/assets/icons/${baseSymbol}@2x.png`;
+}
+
+function showDayTrades(dateStr) {
+    tradeTable.day = dateStr;
+    resetTradeTable();
+    document.querySelector('.closed-trades').scrollIntoView({ behavior: 'smooth' });
+}
+
+// ================== TRADE TABLE ==================
+// Virtualized: only the rows in view (plus overscan) exist in the DOM. Pages come from
+// /api/trades?limit=&offset=&sort= with the period and statistics filters applied server-side,
+// and a row's tags, notes and screenshots are fetched when it is expanded.
+const TRADE_ROW_HEIGHT = 44;
+const TRADE_DETAIL_HEIGHT = 200;
+const TRADE_PAGE_SIZE = 100;
+const TRADE_OVERSCAN = 8;
+const TRADE_TABLE_COLUMNS = [
+    { key: 'entry_time', label: 'Date' },
+    { key: 'asset', label: 'Asset' },
+    { key: 'side', label: 'Side' },
+    { key: 'realized_r', label: 'R' },
+    { key: 'pnl', label: 'P&L' }
+];
+
+const tradeTable = {
+    sort: '-entry_time',
+    day: null,
+    total: 0,
+    pages: new Map(),
+    pending: new Set(),
+    details: new Map(),
+    expandedId: null,
+    expandedIndex: null,
+    query: null,
+    generation: 0,
+    frame: null
+};
+
+function initTradeTable() {
+    const container = document.getElementById('closedTradesList');
+    container.addEventListener('scroll', scheduleTradeRows, { passive: true });
+    window.addEventListener('resize', scheduleTradeRows);
+    renderTradeTableHeader();
+}
+
+function tradeTableParams(offset) {
+    const params = new URLSearchParams({
+        status: 'closed',
+        sort: tradeTable.sort,
+        limit: TRADE_PAGE_SIZE,
+        offset: offset,
+        asset: statsFilter.asset,
+        weekly_bias: statsFilter.weeklyBias,
+        daily_bias: statsFilter.dailyBias,
+        side: statsFilter.side,
+        columnar: 1
+    });
+    if (tradeTable.day) {
+        params.append('start_date', tradeTable.day);
+        params.append('end_date', tradeTable.day);
+    } else {
+        params.append('period', currentPeriod);
+        if (currentPeriod === 'custom' && customStartDate && customEndDate) {
+            params.append('start_date', customStartDate);
+            params.append('end_date', customEndDate);
+        }
+    }
+    return params;
+}
+
+// Drop cached pages and reload the rows in view; the scroll position survives data
+// refreshes but not a change of filters or sort
+function resetTradeTable() {
+    const query = tradeTableParams(0).toString();
+    tradeTable.generation++;
+    tradeTable.pages.clear();
+    tradeTable.pending.clear();
+    tradeTable.details.clear();
+    if (query !== tradeTable.query) {
+        tradeTable.query = query;
+        tradeTable.expandedId = null;
+        tradeTable.expandedIndex = null;
+        document.getElementById('closedTradesList').scrollTop = 0;
+    }
+    renderTradeTableHeader();
+    const container = document.getElementById('closedTradesList');
+    loadTradePage(Math.floor(tradeIndexAt(container.scrollTop) / TRADE_PAGE_SIZE));
+}
+
+async function loadTradePage(page) {
+    if (tradeTable.pages.has(page) || tradeTable.pending.has(page)) return;
+    const generation = tradeTable.generation;
+    tradeTable.pending.add(page);
+    try {
+        const response = await fetch(`/api/trades?${tradeTableParams(page * TRADE_PAGE_SIZE)}`);
+        const data = await response.json();
+        if (generation !== tradeTable.generation) return;
+        tradeTable.total = data.total;
+        tradeTable.pages.set(page, fromColumnar(data.trades));
+        scheduleTradeRows();
+    } catch (error) {
+        console.error('Error loading trades:', error);
+    } finally {
+        if (generation === tradeTable.generation) tradeTable.pending.delete(page);
+    }
+}
+
+function tradeRowTop(index) {
+    const expanded = tradeTable.expandedIndex;
+    return index * TRADE_ROW_HEIGHT + (expanded !== null && index > expanded ? TRADE_DETAIL_HEIGHT : 0);
+}
+
+function tradeIndexAt(offsetY) {
+    const expanded = tradeTable.expandedIndex;
+    if (expanded !== null && offsetY > (expanded + 1) * TRADE_ROW_HEIGHT) {
+        offsetY = Math.max((expanded + 1) * TRADE_ROW_HEIGHT, offsetY - TRADE_DETAIL_HEIGHT);
+    }
+    return Math.floor(offsetY / TRADE_ROW_HEIGHT);
+}
+
+function scheduleTradeRows() {
+    if (tradeTable.frame === null) {
+        tradeTable.frame = requestAnimationFrame(() => {
+            tradeTable.frame = null;
+            renderTradeRows();
+        });
+    }
+}
+
+function renderTradeTableHeader() {
+    const header = document.getElementById('tradeTableHeader');
+    header.innerHTML = TRADE_TABLE_COLUMNS.map(column => {
+        const active = tradeTable.sort.replace('-', '') === column.key;
+        const arrow = active ? (tradeTable.sort.startsWith('-') ? ' ▼' : ' ▲') : '';
+        return `<button type="button" class="${active ? 'active' : ''}" onclick="sortTradeTable('${column.key}')">${column.label}${arrow}</button>`;
+    }).join('');
+
+    const status = document.getElementById('tradeTableStatus');
+    status.innerHTML = tradeTable.day
+        ? `Trades on ${tradeTable.day} <button type="button" onclick="clearTradeDay()">Show all</button>`
+        : '';
+}
+
+function sortTradeTable(key) {
+    if (tradeTable.sort === key) {
+        tradeTable.sort = '-' + key;
+    } else if (tradeTable.sort === '-' + key) {
+        tradeTable.sort = key;
+    } else {
+        // Text columns start ascending, numbers and dates descending
+        tradeTable.sort = key === 'asset' || key === 'side' ? key : '-' + key;
+    }
+    resetTradeTable();
+}
+
+function clearTradeDay() {
+    tradeTable.day = null;
+    resetTradeTable();
+}
+
+function renderTradeRows() {
+    const container = document.getElementById('closedTradesList');
+    const spacer = document.getElementById('tradeTableSpacer');
+    const total = tradeTable.total;
+
+    if (!total && tradeTable.pages.size) {
+        spacer.style.height = '';
+        spacer.innerHTML = '<p style="text-align: center; color: #bbbbbb; padding: 20px;">No trades for this period</p>';
+        return;
+    }
+    spacer.style.height = `${tradeRowTop(total)}px`;
+
+    const first = Math.max(0, tradeIndexAt(container.scrollTop) - TRADE_OVERSCAN);
+    const last = Math.min(total - 1, tradeIndexAt(container.scrollTop + container.clientHeight) + TRADE_OVERSCAN);
+    const html = [];
+    for (let index = first; index <= last; index++) {
+        const rows = tradeTable.pages.get(Math.floor(index / TRADE_PAGE_SIZE));
+        if (!rows) {
+            loadTradePage(Math.floor(index / TRADE_PAGE_SIZE));
+            html.push(`<div class="trade-row placeholder" style="top: ${tradeRowTop(index)}px"></div>`);
+            continue;
+        }
+        const trade = rows[index % TRADE_PAGE_SIZE];
+        if (!trade) continue;
+        html.push(tradeRowHtml(trade, index));
+        if (trade.id === tradeTable.expandedId) html.push(tradeDetailHtml(trade, index));
+    }
+    spacer.innerHTML = html.join('');
+}
+
+function tradeRowHtml(trade, index) {
+    const pnl = trade.pnl || 0;
+    const r = trade.realized_r;
+    return `
+        <div class="trade-row ${pnl > 0 ? 'profit' : 'loss'} ${trade.id === tradeTable.expandedId ? 'expanded' : ''}"
+             style="top: ${tradeRowTop(index)}px" onclick="toggleTradeRow(${trade.id}, ${index})">
+            <span class="trade-row-date">${escapeHtml((trade.entry_time || '').slice(0, 16))}</span>
+            <span class="trade-asset">
+                <img src="${escapeHtml(getCryptoLogo(trade.asset))}" alt="" onerror="this.style.display='none'">
+                ${escapeHtml(trade.asset)}
+            </span>
+            <span class="trade-row-side">${escapeHtml(trade.side.toUpperCase())}</span>
+            <span class="trade-row-r">${r === null || r === undefined ? '-' : r.toFixed(2) + 'R'}</span>
+            <span class="trade-pnl ${pnl >= 0 ? 'positive' : 'negative'}">${pnl >= 0 ? '+' : ''}$${pnl.toFixed(2)}</span>
+        </div>`;
+}
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text ?? '';
+    // textContent leaves quotes alone; escape them so values are safe inside attributes too
+    return div.innerHTML.replace(/"/g, '&quot;').replace(/'/g, '&#39;');
+}
+
+function safeScreenshotUrl(url) {
+    // Screenshot URLs are user supplied: only our own files and http(s) links are rendered
+    return typeof url === 'string' && (url.startsWith('/screenshots/') || /^https?:\/\//i.test(url)) ? url : null;
+}
+
+function tradeDetailHtml(trade, index) {
+    const details = tradeTable.details.get(trade.id);
+    let body = '<p class="trade-details">Loading…</p>';
+    if (details) {
+        const tags = [['Models', details.models], ['Confirmations', details.confirmations],
+                      ['Entries', details.entries], ['Key levels', details.key_levels]]
+            .filter(([, values]) => values && values.length)
+            .map(([label, values]) => `<div><span class="filter-label">${label}</span> ${values.map(escapeHtml).join(', ')}</div>`)
+            .join('');
+        const variants = details.screenshot_variants || {};
+        const shots = (details.screenshots || []).filter(safeScreenshotUrl).map(url => {
+            const thumb = safeScreenshotUrl(variants[url] && variants[url].thumb) || url;
+            return `<a href="${escapeHtml(url)}" target="_blank" rel="noopener"><img src="${escapeHtml(thumb)}" alt="Screenshot" loading="lazy"></a>`;
+        }).join('');
+        body = `
+            <div class="trade-details">
+                <div>Entry ${escapeHtml(details.entry_price)} → Exit ${escapeHtml(details.exit_price ?? '-')} · Qty ${escapeHtml(details.quantity)}
+                     · Bias W ${escapeHtml(details.weekly_bias || 'neutral')} / D ${escapeHtml(details.daily_bias || 'neutral')}</div>
+                ${tags}
+                ${details.notes ? `<div class="trade-row-notes">${escapeHtml(details.notes)}</div>` : ''}
+                ${shots ? `<div class="trade-row-shots">${shots}</div>` : ''}
+            </div>
+            ${details.archived
+                ? '<span class="filter-label">Archived · read-only</span>'
+                : `<button type="button" class="btn btn-secondary" onclick="event.stopPropagation(); editTrade(${trade.id})">Edit</button>`}`;
+    }
+    return `<div class="trade-row-detail" style="top: ${tradeRowTop(index) + TRADE_ROW_HEIGHT}px; height: ${TRADE_DETAIL_HEIGHT}px">${body}</div>`;
+}
+
+async function toggleTradeRow(tradeId, index) {
+    if (tradeTable.expandedId === tradeId) {
+        tradeTable.expandedId = null;
+        tradeTable.expandedIndex = null;
+        renderTradeRows();
+        return;
+    }
+    tradeTable.expandedId = tradeId;
+    tradeTable.expandedIndex = index;
+    renderTradeRows();
+    if (tradeTable.details.has(tradeId)) return;
+
+    try {
+        const response = await fetch(`/api/trades/${tradeId}`);
+        tradeTable.details.set(tradeId, await response.json());
+        if (tradeTable.expandedId === tradeId) renderTradeRows();
+    } catch (error) {
+        console.error('Error loading trade details:', error);
+    }
+}
+
+async function setEntryType(tradeId, entryType) {
+    try {
+        const response = await fetch(`/api/trades/${tradeId}/entry_type`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ entry_type: entryType })
+        });
+
+        const result = await response.json();
+        if (result.success) {
+            await loadTrades();
+            showNotification(`Entry type set to: ${entryType}`, 'success');
+        } else {
+            alert('Failed to set entry type: ' + result.error);
+        }
+    } catch (error) {
+        console.error('Error setting entry type:', error);
+        alert('Error setting entry type');
+    }
+}
+
+function showNotification(message, type = 'success') {
+    const notification = document.createElement('div');
+    notification.style.cssText = `
+        position: fixed;
+        top: 20px;
+        right: 20px;
+        background: ${type === 'success' ? '#00ff88' : '#ff3366'};
+        color: #000;
+        padding: 12px 20px;
+        border-radius: 8px;
+        z-index: 10000;
+        font-weight: 500;
+        box-shadow: 0 4px 12px rgba(0,0,0,0.3);
+    `;
+    notification.textContent = message;
+    document.body.appendChild(notification);
+    setTimeout(() => notification.remove(), 2000);
+}
+
+// Tag Management
+function addTag(containerId, value) {
+    if (!value || !value.trim()) return;
+
+    const container = document.getElementById(containerId);
+    const tag = document.createElement('div');
+    tag.className = 'tag';
+    tag.innerHTML = `
+        <span>${value.trim()}</span>
+        <span class="tag-remove" onclick="this.parentElement.remove()">&times;</span>
+    `;
+    container.appendChild(tag);
+}
+
+function getTagValues(containerId) {
+    const container = document.getElementById(containerId);
+    return Array.from(container.querySelectorAll('.tag span:first-child'))
+        .map(span => span.textContent);
+}
+
+function clearTags(containerId) {
+    document.getElementById(containerId).innerHTML = '';
+}
+
+function loadTags(containerId, values) {
+    clearTags(containerId);
+    if (values && Array.isArray(values)) {
+        values.forEach(value => addTag(containerId, value));
+    }
+}
+
+// Screenshot Management
+let currentScreenshots = [];
+let screenshotVariants = {};  // url -> {thumb, small, preview} WebP variant URLs
+
+async function handleScreenshotUpload(event) {
+    const file = event.target.files[0];
+    if (!file) return;
+
+    const formData = new FormData();
+    formData.append('screenshot', file);
+
+    try {
+        const response = await fetch('/api/upload_screenshot', {
+            method: 'POST',
+            body: formData
+        });
+
+        const result = await response.json();
+        if (result.success) {
+            currentScreenshots.push(result.url);
+            screenshotVariants[result.url] = result.variants || {};
+            renderScreenshots();
+            showNotification('Screenshot uploaded successfully', 'success');
+        } else {
+            alert('Failed to upload screenshot');
+        }
+    } catch (error) {
+        console.error('Error uploading screenshot:', error);
+        alert('Error uploading screenshot');
+    }
+
+    event.target.value = '';
+}
+
+async function addScreenshotUrl() {
+    const url = document.getElementById("screenshotUrlInput").value.trim();
+    if (!url) return;
+
+    const tradeId = document.getElementById('editTradeId').value;
+
+    try {
+        const response = await fetch(`/api/trades/${tradeId}/screenshots/url`, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ url })
+        });
+
+        const result = await response.json();
+        if (result.success) {
+            currentScreenshots.push(url);
+            renderScreenshots();
+            document.getElementById("screenshotUrlInput").value = "";
+            showNotification('Screenshot URL added successfully', 'success');
+        } else {
+            alert('Failed to add screenshot URL');
+        }
+    } catch (error) {
+        console.error('Error adding screenshot URL:', error);
+        alert('Error adding screenshot URL');
+    }
+}
+
+function removeScreenshotFromList(url) {
+    currentScreenshots = currentScreenshots.filter(s => s !== url);
+    renderScreenshots();
+}
+
+function renderScreenshots() {
+    const gallery = document.getElementById('screenshotGallery');
+    if (currentScreenshots.length === 0) {
+        gallery.innerHTML = '';
+        return;
+    }
+
+    gallery.innerHTML = currentScreenshots.map(url => {
+        const variants = screenshotVariants[url] || {};
+        return `
+        <div class="screenshot-item">
+            <a href="${variants.preview || url}" target="_blank" rel="noopener">
+                <img src="${variants.thumb || url}" alt="Trade screenshot" loading="lazy">
+            </a>
+            <button type="button" class="screenshot-remove" onclick="removeScreenshotFromList('${url}')">&times;</button>
+        </div>
+    `;
+    }).join('');
+}
+
+async function editTrade(tradeId) {
+    try {
+        const response = await fetch(`/api/trades/${tradeId}`);
+        const trade = await response.json();
+
+        // Set basic fields
+        document.getElementById('editTradeId').value = trade.id;
+        document.getElementById('editAsset').value = trade.asset;
+        document.getElementById('editSide').value = trade.side;
+        document.getElementById('editWeeklyBias').value = trade.weekly_bias || 'neutral';
+        document.getElementById('editDailyBias').value = trade.daily_bias || 'neutral';
+        document.getElementById('editNotes').value = trade.notes || '';
+
+        // Load arrays as tags
+        loadTags('keyLevelsContainer', trade.key_levels || []);
+        loadTags('confirmationsContainer', trade.confirmations || []);
+        loadTags('entriesContainer', trade.entries || []);
+        loadTags('modelsContainer', trade.models || []);
+
+        // Load screenshots
+        currentScreenshots = trade.screenshots || [];
+        screenshotVariants = trade.screenshot_variants || {};
+        renderScreenshots();
+
+        // Setup tag input handlers
+        setupTagInput('editKeyLevelInput', 'keyLevelsContainer', 'key_level');
+        setupTagInput('editConfirmationInput', 'confirmationsContainer', 'confirmation');
+        setupTagInput('editEntryInput', 'entriesContainer', 'entry');
+        setupTagInput('editModelInput', 'modelsContainer', 'model');
+
+        // Archived trades are read-only on the server
+        document.getElementById('editDeleteButton').style.display = trade.archived ? 'none' : '';
+        document.getElementById('editSaveButton').style.display = trade.archived ? 'none' : '';
+
+        document.getElementById('editTradeModal').classList.add('active');
+    } catch (error) {
+        console.error('Error loading trade:', error);
+        alert('Error loading trade details');
+    }
+}
+
+function setupTagInput(inputId, containerId, category) {
+    const input = document.getElementById(inputId);
+
+    // Suggest existing tags of this category as the user types
+    let suggestions = document.getElementById(inputId + 'Suggestions');
+    if (!suggestions) {
+        suggestions = document.createElement('datalist');
+        suggestions.id = inputId + 'Suggestions';
+        input.after(suggestions);
+        input.setAttribute('list', suggestions.id);
+    }
+    let suggestTimer = null;
+    input.oninput = function() {
+        clearTimeout(suggestTimer);
+        const prefix = this.value.trim();
+        suggestTimer = setTimeout(async () => {
+            try {
+                const params = new URLSearchParams({ category: category, prefix: prefix, limit: 10 });
+                const response = await fetch(`/api/tags?${params}`);
+                const data = await response.json();
+                suggestions.innerHTML = '';
+                (data.tags || []).forEach(tag => {
+                    const option = document.createElement('option');
+                    option.value = tag.name;
+                    suggestions.appendChild(option);
+                });
+            } catch (error) {
+                console.error('Error loading tag suggestions:', error);
+            }
+        }, 150);
+    };
+
+    // Remove existing listener
+    input.onkeydown = null;
+    // Add new listener
+    input.onkeydown = function(e) {
+        if (e.key === 'Enter') {
+            e.preventDefault();
+            const value = this.value.trim();
+            if (value) {
+                addTag(containerId, value);
+                this.value = '';
+            }
+        }
+    };
+}
+
+function closeEditModal() {
+    document.getElementById('editTradeModal').classList.remove('active');
+}
+
+async function saveTradeEdit(event) {
+    event.preventDefault();
+
+    const tradeId = document.getElementById('editTradeId').value;
+
+    try {
+        const originalResponse = await fetch(`/api/trades/${tradeId}`);
+        const originalTrade = await originalResponse.json();
+
+        // Split saving into 3 separate calls
+        await saveTradeCore(tradeId, originalTrade);
+        await saveTradeDetails(tradeId);
+        // Screenshots are handled separately via upload and URL endpoints
+
+        closeEditModal();
+        loadDashboard();
+        showNotification('Trade updated successfully!', 'success');
+    } catch (error) {
+        console.error('Error saving trade:', error);
+        alert('Error saving trade changes');
+    }
+}
+
+async function saveTradeCore(tradeId, originalTrade) {
+    const coreTradePayload = {
+        ...originalTrade,
+        weekly_bias: document.getElementById('editWeeklyBias').value,
+        daily_bias: document.getElementById('editDailyBias').value,
+        notes: document.getElementById('editNotes').value
+    };
+
+    const response = await fetch(`/api/trades/${tradeId}`, {
+        method: "PUT",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(coreTradePayload)
+    });
+
+    const result = await response.json();
+    if (!result.success) {
+        throw new Error('Failed to save core trade data');
+    }
+}
+
+async function saveTradeDetails(tradeId) {
+    // Gather tag values from containers
+    const key_levels = getTagValues('keyLevelsContainer');
+    const confirmations = getTagValues('confirmationsContainer');
+    const entries = getTagValues('entriesContainer');
+    const models = getTagValues('modelsContainer');
+
+    const statsPayload = {
+        key_levels: key_levels,
+        confirmations: confirmations,
+        entries: entries,
+        models: models
+    };
+
+    const response = await fetch(`/api/trades/${tradeId}/details`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(statsPayload)
+    });
+
+    const result = await response.json();
+    if (!result.success) {
+        throw new Error('Failed to save trade details');
+    }
+}
+
+async function deleteTrade() {
+    if (!confirm('Are you sure you want to delete this trade? This action cannot be undone.')) {
+        return;
+    }
+
+    const tradeId = document.getElementById('editTradeId').value;
+
+    try {
+        const response = await fetch(`/api/trades/${tradeId}`, {
+            method: 'DELETE',
+            headers: {
+                'Content-Type': 'application/json'
+            }
+        });
+
+        if (response.ok) {
+            closeEditModal();
+            loadDashboard();
+            showNotification('Trade deleted successfully!', 'success');
+        } else {
+            alert('Error deleting trade');
+        }
+    } catch (error) {
+        console.error('Error deleting trade:', error);
+        alert('Error deleting trade');
+    }
+}
+
+function updateStatsFilter() {
+    statsFilter.weeklyBias = document.getElementById('weeklyBiasFilter').value;
+    statsFilter.dailyBias = document.getElementById('dailyBiasFilter').value;
+    statsFilter.asset = document.getElementById('assetFilter').value;
+    statsFilter.side = document.getElementById('sideFilter').value;
+
+    // Load performance stats from backend APIs
+    loadPerformanceStats();
+    resetTradeTable();
+}
+
+async function loadPerformanceStats() {
+    console.log("🔥 loadPerformanceStats START");
+    try {
+        console.log("🔥 Fetching from backend APIs...");
+
+        // Build query parameters from filters
+        const params = new URLSearchParams({
+            asset: statsFilter.asset,
+            weekly_bias: statsFilter.weeklyBias,
+            daily_bias: statsFilter.dailyBias,
+            side: statsFilter.side
+        });
+
+        const [modelsResponse, confirmationsResponse, entriesResponse, keyLevelsResponse] = await Promise.all([
+            fetch(`/api/analytics/by_model?${params}`),
+            fetch(`/api/analytics/by_confirmation?${params}`),
+            fetch(`/api/analytics/by_entry?${params}`),
+            fetch(`/api/analytics/by_key_level?${params}`)
+        ]);
+
+        console.log("🔥 Raw API responses received");
+
+        const modelsData = await modelsResponse.json();
+        const confirmationsData = await confirmationsResponse.json();
+        const entriesData = await entriesResponse.json();
+        const keyLevelsData = await keyLevelsResponse.json();
+
+        renderPerformanceStats(modelsData, confirmationsData, entriesData, keyLevelsData);
+    } catch (error) {
+        console.error('❌ ERROR in loadPerformanceStats:', error);
+        console.error('❌ Stack trace:', error.stack);
+    }
+}
+
+function renderPerformanceStats(modelsData, confirmationsData, entriesData, keyLevelsData) {
+    try {
+        console.log("🔥 RAW MODEL DATA FROM API:", modelsData);
+        console.log("🔥 RAW CONFIRMATION DATA FROM API:", confirmationsData);
+        console.log("🔥 RAW ENTRY DATA FROM API:", entriesData);
+        console.log("🔥 RAW KEY LEVEL DATA FROM API:", keyLevelsData);
+
+        // Apply filters and update UI
+        const filteredModels = applyFiltersToStats(modelsData.models || []);
+        const filteredConfirmations = applyFiltersToStats(confirmationsData.confirmations || []);
+        const filteredEntries = applyFiltersToStats(entriesData.entries || []);
+        const filteredKeyLevels = applyFiltersToStats(keyLevelsData.key_levels || []);
+
+        console.log("🔥 FILTERED DATA:");
+        console.log("  Models:", filteredModels, "Length:", filteredModels.length);
+        console.log("  Confirmations:", filteredConfirmations, "Length:", filteredConfirmations.length);
+        console.log("  Entries:", filteredEntries, "Length:", filteredEntries.length);
+        console.log("  Key levels:", filteredKeyLevels, "Length:", filteredKeyLevels.length);
+
+        // 🔥 STEP 2: Verify render function runs
+        console.log("🎨 About to render stats...");
+
+        const modelsHTML = formatBackendPerformanceStats(filteredModels);
+        const confirmationsHTML = formatBackendPerformanceStats(filteredConfirmations);
+        const entriesHTML = formatBackendPerformanceStats(filteredEntries);
+        const keyLevelsHTML = formatBackendPerformanceStats(filteredKeyLevels);
+
+        console.log("🎨 Generated HTML:");
+        console.log("  Models HTML length:", modelsHTML.length);
+        console.log("  Confirmations HTML length:", confirmationsHTML.length);
+        console.log("  Entries HTML length:", entriesHTML.length);
+        console.log("  Key levels HTML length:", keyLevelsHTML.length);
+
+        // 🔥 STEP 3: DOM ID verification
+        const modelsEl = document.getElementById('modelsStats');
+        const confirmationsEl = document.getElementById('confirmationsStats');
+        const entriesEl = document.getElementById('entryStats');
+        const keyLevelsEl = document.getElementById('keyLevelsStats');
+
+        console.log("🔥 DOM ELEMENTS:");
+        console.log("  modelsStats element:", modelsEl);
+        console.log("  confirmationsStats element:", confirmationsEl);
+        console.log("  entryStats element:", entriesEl);
+        console.log("  keyLevelsStats element:", keyLevelsEl);
+
+        if (!modelsEl) console.error("❌ modelsStats element NOT FOUND");
+        if (!confirmationsEl) console.error("❌ confirmationsStats element NOT FOUND");
+        if (!entriesEl) console.error("❌ entryStats element NOT FOUND");
+        if (!keyLevelsEl) console.error("❌ keyLevelsStats element NOT FOUND");
+
+        // Render to DOM
+        modelsEl.innerHTML = modelsHTML;
+        confirmationsEl.innerHTML = confirmationsHTML;
+        entriesEl.innerHTML = entriesHTML;
+        keyLevelsEl.innerHTML = keyLevelsHTML;
+
+        console.log("🔥 RENDER COMPLETE - checking DOM content:");
+        console.log("  modelsStats.innerHTML:", modelsEl.innerHTML.substring(0, 100));
+        console.log("  confirmationsStats.innerHTML:", confirmationsEl.innerHTML.substring(0, 100));
+        console.log("  entryStats.innerHTML:", entriesEl.innerHTML.substring(0, 100));
+        console.log("  keyLevelsStats.innerHTML:", keyLevelsEl.innerHTML.substring(0, 100));
+
+    } catch (error) {
+        console.error('❌ ERROR in renderPerformanceStats:', error);
+        console.error('❌ Stack trace:', error.stack);
+    }
+}
+
+function applyFiltersToStats(stats) {
+    console.log("🔍 applyFiltersToStats called");
+    console.log("  Input stats:", stats);
+    console.log("  Current statsFilter:", statsFilter);
+
+    let filtered = stats;
+
+    if (statsFilter.asset !== 'all') {
+        console.log("  Asset filter active:", statsFilter.asset);
+        // Backend already filters by asset, so this might not be needed
+        // but keeping for consistency
+    }
+
+    if (statsFilter.side !== 'all') {
+        console.log("  Side filter active:", statsFilter.side);
+        // Backend analytics don't filter by side, but we could add this
+    }
+
+    console.log("  Returning filtered stats:", filtered);
+    return filtered;
+}
+
+function formatBackendPerformanceStats(stats) {
+    console.log("🎨 formatBackendPerformanceStats CALLED with:", stats);
+
+    if (!stats || stats.length === 0) {
+        console.warn("❌ No data passed to formatBackendPerformanceStats");
+        return '<p style="color: #bbbbbb; text-align: center; padding: 20px;">No data for current filters</p>';
+    }
+
+    console.log("🎨 Formatting", stats.length, "items");
+
+    const html = stats.map(item => {
+        // Sanity check for invalid win rates
+        if (item.win_rate > 100) {
+            console.warn("Invalid win rate detected", item);
+        }
+
+        const wrClass = item.win_rate >= 60 ? 'good' : item.win_rate >= 50 ? 'average' : 'poor';
+
+        // Handle different field names from different endpoints
+        const label = item.model || item.confirmation || item.entry || item.level || 'Unknown';
+        const displayName = label.replace(/_/g, ' ');
+
+        console.log("🎨 Rendering item:", { label, displayName, trade_count: item.trade_count, win_rate: item.win_rate, total_pnl: item.total_pnl });
+
+        return `
+            <div class="stat-item">
+                <span class="stat-name">${displayName}</span>
+                <div class="stat-metrics">
+                    <span class="stat-count">${item.trade_count}</span>
+                    <span class="stat-wr ${wrClass}">${item.win_rate}%</span>
+                    <span class="stat-pnl">${item.total_pnl >= 0 ? '+' : ''}$${item.total_pnl}</span>
+                </div>
+            </div>
+        `;
+    }).join('');
+
+    console.log("🎨 Generated HTML length:", html.length, "First 200 chars:", html.substring(0, 200));
+    return html;
+}
+
+function calculateEntryPerformanceStats(trades) {
+    const stats = {};
+
+    trades.forEach(trade => {
+        // Only process trades that have an entry field set
+        const entryType = trade.entry;
+        if (!entryType || entryType.trim() === '') {
+            return; // Skip trades without entry type
+        }
+
+        const key = entryType;
+
+        if (!stats[key]) {
+            stats[key] = { total: 0, wins: 0, with_bias: 0, with_wins: 0, against_bias: 0, against_wins: 0 };
+        }
+
+        stats[key].total++;
+        const pnl = parseFloat(trade.pnl) || 0;
+        if (pnl > 0) stats[key].wins++;
+
+        const weekly = (trade.weekly_bias || '').toLowerCase();
+        const daily = (trade.daily_bias || '').toLowerCase();
+        const side = (trade.side || '').toLowerCase();
+
+        const withWeekly = (weekly === 'bullish' && side === 'long') || (weekly === 'bearish' && side === 'short');
+        const againstWeekly = (weekly === 'bullish' && side === 'short') || (weekly === 'bearish' && side === 'long');
+
+        if (withWeekly) {
+            stats[key].with_bias++;
+            if (pnl > 0) stats[key].with_wins++;
+        } else if (againstWeekly) {
+            stats[key].against_bias++;
+            if (pnl > 0) stats[key].against_wins++;
+        }
+    });
+
+    Object.keys(stats).forEach(key => {
+        const s = stats[key];
+        s.winRate = s.total > 0 ? (s.wins / s.total * 100).toFixed(1) : 0;
+        s.withWinRate = s.with_bias > 0 ? (s.with_wins / s.with_bias * 100).toFixed(1) : null;
+        s.againstWinRate = s.against_bias > 0 ? (s.against_wins / s.against_bias * 100).toFixed(1) : null;
+    });
+
+    return stats;
+}
+
+function formatPerformanceStats(stats) {
+    const entries = Object.entries(stats);
+
+    if (entries.length === 0) {
+        return '<p style="color: #bbbbbb; text-align: center; padding: 20px;">No data for current filters</p>';
+    }
+
+    entries.sort((a, b) => parseFloat(b[1].winRate) - parseFloat(a[1].winRate));
+
+    return entries.map(([key, data]) => {
+        const wrClass = data.winRate >= 60 ? 'good' : data.winRate >= 50 ? 'average' : 'poor';
+        const displayName = key.replace(/_/g, ' ');
+
+        let biasInfo = '';
+        if (data.withWinRate !== null) {
+            biasInfo += `<span class="stat-bias-indicator with" title="WITH bias">WITH ${data.withWinRate}% (${data.with_bias})</span>`;
+        }
+        if (data.againstWinRate !== null) {
+            biasInfo += `<span class="stat-bias-indicator against" title="AGAINST bias">VS ${data.againstWinRate}% (${data.against_bias})</span>`;
+        }
+
+        return `
+            <div class="stat-item">
+                <span class="stat-name">${displayName}</span>
+                <div class="stat-metrics">
+                    <span class="stat-count">${data.total}</span>
+                    <span class="stat-wr ${wrClass}">${data.winRate}%</span>
+                    ${biasInfo}
+                </div>
+            </div>
+        `;
+    }).join('');
+}
+
+function showApiConnectForm() {
+    // Show API inputs when not connected
+    document.getElementById('apiKey').style.display = 'block';
+    document.getElementById('apiSecret').style.display = 'block';
+    document.querySelector('button[onclick="saveApiCredentials()"]').style.display = 'block';
+
+    const statusEl = document.getElementById('apiStatus');
+    statusEl.textContent = 'Not Connected';
+    statusEl.classList.remove('connected');
+}
+
+function syncAllBybitData() {
+    fetchAccountBalance();
+}
+
+async function loadApiCredentials() {
+    try {
+        const response = await fetch('/api/get_bybit_credentials');
+        const data = await response.json();
+
+        const statusEl = document.getElementById('apiStatus');
+        if (data.connected) {
+            // Hide API inputs when connected
+            document.getElementById('apiKey').style.display = 'none';
+            document.getElementById('apiSecret').style.display = 'none';
+            document.querySelector('button[onclick="saveApiCredentials()"]').style.display = 'none';
+
+            statusEl.textContent = `Connected to Bybit (**${data.api_key_last4})`;
+            statusEl.classList.add('connected');
+
+            // Load balance on page load
+            fetchAccountBalance();
+        } else {
+            // Show API inputs when not connected
+            document.getElementById('apiKey').style.display = 'block';
+            document.getElementById('apiSecret').style.display = 'block';
+            document.querySelector('button[onclick="saveApiCredentials()"]').style.display = 'block';
+
+            statusEl.textContent = 'Not Connected';
+            statusEl.classList.remove('connected');
+        }
+    } catch (error) {
+        console.error('Error loading credentials:', error);
+    }
+}
+
+async function saveApiCredentials() {
+    const data = {
+        api_key: document.getElementById('apiKey').value,
+        api_secret: document.getElementById('apiSecret').value,
+        network: 'mainnet',
+        remember_me: true
+    };
+
+    try {
+        const response = await fetch('/api/save_bybit_credentials', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(data)
+        });
+
+        const result = await response.json();
+        if (result.success) {
+            // Switch to connected UI immediately
+            renderConnected({
+                connected: true,
+                api_key_last4: data.api_key.slice(-4)
+            });
+        } else {
+            console.error('Error from server:', result.error);
+            alert('Error saving credentials: ' + (result.error || 'Unknown error'));
+        }
+    } catch (error) {
+        console.error('Error saving credentials:', error);
+        alert('Error saving credentials: ' + error.message);
+    }
+}
+
+async function syncBybitTrades() {
+    if (!confirm('Sync trades from Bybit? This may take a moment.')) return;
+
+    try {
+        const resp = await fetch('/api/sync_bybit_trades', { method: 'POST' });
+        const syncResult = await resp.json();
+
+        alert(syncResult.message);
+        // With a live event stream the dashboard has already been told about the new trades
+        if (syncResult.success && syncResult.trades_synced > 0 && !eventsConnected()) {
+            loadDashboard();
+        }
+    } catch (error) {
+        console.error('Error syncing trades:', error);
+        alert('Sync error. Check console.');
+    }
+}
+
+// ================== LIVE UPDATES ==================
+// /api/events pushes sync progress and data changes; the dashboard reloads once per burst
+let eventSource = null;
+let dataChangeTimer = null;
+let dataVersion = 0;
+
+function eventsConnected() {
+    return eventSource !== null && eventSource.readyState === EventSource.OPEN;
+}
+
+function scheduleDashboardReload() {
+    clearTimeout(dataChangeTimer);
+    dataChangeTimer = setTimeout(loadDashboard, 300);
+}
+
+function showSyncProgress(progress) {
+    const syncBtn = document.querySelector('button[onclick="syncBybitTrades()"]');
+    if (!syncBtn) return;
+    if (progress.stage === 'fetching' || progress.stage === 'processing') {
+        syncBtn.textContent = `Syncing… ${progress.items}`;
+        syncBtn.disabled = true;
+    } else if (progress.stage === 'started') {
+        syncBtn.textContent = 'Syncing…';
+        syncBtn.disabled = true;
+    } else {
+        syncBtn.textContent = 'Sync';
+        syncBtn.disabled = false;
+    }
+}
+
+function connectEvents() {
+    if (!window.EventSource || eventSource) return;
+    eventSource = new EventSource('/api/events');
+    const parse = (handler) => (event) => handler(JSON.parse(event.data));
+
+    eventSource.addEventListener('ready', parse((data) => {
+        // Reconnected after missing changes
+        if (dataVersion && data.change_seq > dataVersion) scheduleDashboardReload();
+        dataVersion = data.change_seq;
+    }));
+    eventSource.addEventListener('data_version', parse((data) => {
+        if (data.change_seq > dataVersion) {
+            dataVersion = data.change_seq;
+            scheduleDashboardReload();
+        }
+    }));
+    eventSource.addEventListener('resync', () => scheduleDashboardReload());
+    eventSource.addEventListener('sync', parse(showSyncProgress));
+    eventSource.addEventListener('trades', parse((data) => {
+        if (data.source === 'bybit' && data.ids.length) {
+            showNotification(`${data.ids.length} new trade(s) from Bybit`, 'success');
+        }
+    }));
+    eventSource.addEventListener('snapshot', () => fetchAccountBalance());
+    eventSource.onerror = () => {
+        // Refused (e.g. the server's stream limit) rather than dropped: the browser gives up, so retry later
+        if (eventSource.readyState === EventSource.CLOSED) {
+            eventSource = null;
+            setTimeout(connectEvents, 30000);
+        }
+    };
+}
+
+async function updatePnlChart() {
+    const canvas = document.getElementById('pnlChart');
+    if (!canvas) return;
+    const ctx = canvas.getContext('2d');
+
+    // Cumulative P&L is computed and downsampled server-side
+    let url = `/api/equity_curve?period=${currentPeriod}&points=${Math.max(100, Math.round(canvas.clientWidth || 500))}`;
+    if (currentPeriod === 'custom' && customStartDate && customEndDate) {
+        url += `&start_date=${customStartDate}&end_date=${customEndDate}`;
+    }
+
+    try {
+        const response = await fetch(url);
+        renderPnlChart(await response.json());
+    } catch (error) {
+        console.error('Error loading equity curve:', error);
+    }
+}
+
+function renderPnlChart(curve) {
+    const canvas = document.getElementById('pnlChart');
+    if (!canvas) return;
+    const ctx = canvas.getContext('2d');
+
+    const labels = curve.time.map(t => new Date(t).toLocaleDateString());
+    const series = curve.equity;
+    const runningTotal = series.length ? series[series.length - 1] : 0;
+
+    const lineColor = runningTotal >= 0 ? '#00ff88' : '#ff3366';
+
+    if (!pnlChart) {
+        pnlChart = new Chart(ctx, {
+            type: 'line',
+            data: {
+                labels,
+                datasets: [{
+                    data: series,
+                    borderColor: lineColor,
+                    borderWidth: 2,
+                    fill: false,
+                    pointRadius: 0,
+                    tension: 0.35
+                }]
+            },
+            options: {
+                responsive: true,
+                maintainAspectRatio: false,
+                layout: {
+                    padding: {
+                        top: 20,
+                        right: 20,
+                        bottom: 10,
+                        left: 10
+                    }
+                },
+                plugins: {
+                    legend: { display: false },
+                    tooltip: {
+                        callbacks: {
+                            label: (ctx) => `Cumulative: $${ctx.parsed.y.toFixed(2)}`
+                        }
+                    }
+                },
+                scales: {
+                    x: {
+                        grid: { display: false },
+                        ticks: { color: '#aaa', maxRotation: 0, autoSkip: true, maxTicksLimit: 8 }
+                    },
+                    y: {
+                        grid: { display: false },
+                        ticks: {
+                            color: '#aaa',
+                            callback: (val) => `$${Number(val).toFixed(0)}`
+                        }
+                    }
+                }
+            }
+        });
+    } else {
+        pnlChart.data.labels = labels;
+        pnlChart.data.datasets[0].data = series;
+        pnlChart.data.datasets[0].borderColor = lineColor;
+        pnlChart.update();
+    }
+}
+
+// Position Size Calculator
+document.getElementById('riskAmount').addEventListener('input', calculatePosition);
+document.getElementById('riskType').addEventListener('change', calculatePosition);
+document.getElementById('stopLoss').addEventListener('input', calculatePosition);
+
+function calculatePosition() {
+    const riskAmount = parseFloat(document.getElementById('riskAmount').value) || 0;
+    const riskType = document.getElementById('riskType').value;
+    const stopLoss = parseFloat(document.getElementById('stopLoss').value) || 0;
+    const fees = 0.00075; // Bybit taker fees (0.075%)
+
+    if (riskAmount <= 0 || stopLoss <= 0) {
+        document.getElementById('positionSize').textContent = '$0';
+        return;
+    }
+
+    let actualRisk = riskAmount;
+
+    // If risk is percentage, get it from balance or use default
+    if (riskType === 'percent') {
+        const balanceText = document.getElementById('accountBalance').textContent;
+        const balance = parseFloat(balanceText.replace(/[$,]/g, '')) || 1000; // Default $1000 if no balance
+        actualRisk = (riskAmount / 100) * balance;
+    }
+
+    // Core Formula: Position = Risk ÷ (Stop Loss % + Fees %)
+    const totalLossPercent = (stopLoss / 100) + fees;
+    const positionSize = actualRisk / totalLossPercent;
+
+    document.getElementById('positionSize').textContent = '$' + positionSize.toFixed(0);
+}
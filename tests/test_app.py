@@ -2,16 +2,22 @@ import pytest
 import json
 import tempfile
 import os
-from app import app, init_db
+import io
+import subprocess
+import time
+import sys
+import uuid
+import sqlite3
+
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from app import app, create_app
 
 @pytest.fixture
 def client():
-    app.config['TESTING'] = True
-    app.config['DATABASE_PATH'] = tempfile.mktemp(suffix='.db')
-    
+    create_app({'TESTING': True, 'DATABASE_PATH': tempfile.mktemp(suffix='.db')})
+
     with app.test_client() as client:
-        with app.app_context():
-            init_db()
         yield client
 
 @pytest.fixture
@@ -30,6 +36,30 @@ def sample_trade():
         'notes': 'Test trade'
     }
 
+@pytest.fixture
+def user_client(client):
+    """Client switched to a fresh user so tests don't see each other's trades"""
+    client.post('/api/users',
+                data=json.dumps({'name': f'test_{uuid.uuid4().hex[:12]}'}),
+                content_type='application/json')
+    return client
+
+def create_closed_trade(client, pnl, entry_time, asset='BTCUSDT', side='long', **extra):
+    """Create a closed trade with the given P&L (entry 100, quantity 1)"""
+    trade = {
+        'asset': asset,
+        'side': side,
+        'entry_price': 100,
+        'exit_price': 100 + pnl if side == 'long' else 100 - pnl,
+        'quantity': 1,
+        'entry_time': entry_time,
+        'exit_time': entry_time,
+        'status': 'closed'
+    }
+    trade.update(extra)
+    response = client.post('/api/trades', data=json.dumps(trade), content_type='application/json')
+    return json.loads(response.data)['id']
+
 class TestAPI:
     def test_health_check(self, client):
         response = client.get('/api/health')
@@ -95,6 +125,29 @@ class TestDatabase:
         response = client.get('/api/trades')
         assert response.status_code == 200
 
+    def test_legacy_external_id_constraint_is_per_user(self, client, tmp_path):
+        import sqlite3
+
+        # Shape of databases created before multi-user support
+        legacy = str(tmp_path / 'legacy.db')
+        with sqlite3.connect(legacy) as conn:
+            conn.execute('''CREATE TABLE trades (id INTEGER PRIMARY KEY AUTOINCREMENT, asset TEXT NOT NULL,
+                            side TEXT NOT NULL, entry_price REAL NOT NULL, exit_price REAL, quantity REAL NOT NULL,
+                            entry_time TEXT NOT NULL, exit_time TEXT, pnl REAL, status TEXT, notes TEXT,
+                            created_at TEXT, weekly_bias TEXT, daily_bias TEXT, external_id TEXT UNIQUE,
+                            user_id INTEGER DEFAULT 1)''')
+            conn.execute('''INSERT INTO trades (asset, side, entry_price, quantity, entry_time, external_id)
+                            VALUES ('BTCUSDT', 'long', 100, 1, '2024-01-01 09:00:00', 'bybit-1')''')
+        create_app({'DATABASE_PATH': legacy})
+
+        for name in ('legacy_a', 'legacy_b'):
+            client.post('/api/users', json={'name': name})
+            response = client.post('/api/import/trades', data='external_id,asset,side,entry_price,quantity,entry_time\n'
+                                   'bybit-1,ETHUSDT,short,50,2,2024-02-01 09:00:00\n', content_type='text/csv')
+            assert json.loads(response.data)['imported'] == 1
+        with sqlite3.connect(legacy) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM trades WHERE external_id = 'bybit-1'").fetchone() == (3,)
+
 class TestValidation:
     def test_create_trade_missing_required_fields(self, client):
         incomplete_trade = {'asset': 'BTCUSDT'}
@@ -129,5 +182,1105 @@ class TestSecurity:
                               content_type='application/json')
         assert response.status_code == 201
 
+class TestEquityCurve:
+    def test_equity_curve_empty(self, user_client):
+        response = user_client.get('/api/equity_curve')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['equity'] == []
+        assert data['source_points'] == 0
+
+    def test_equity_curve_downsampled_keeps_drawdown(self, user_client):
+        pnls = [10] * 60 + [-15] * 20 + [5] * 120
+        start = datetime(2025, 1, 1)
+        for i, pnl in enumerate(pnls):
+            create_closed_trade(user_client, pnl, (start + timedelta(minutes=i)).strftime('%Y-%m-%d %H:%M:%S'))
+
+        data = json.loads(user_client.get('/api/equity_curve?points=40').data)
+        assert data['source_points'] == len(pnls)
+        assert len(data['equity']) <= 40
+        assert data['equity'][-1] == sum(pnls)
+        assert data['max_drawdown'] == 300
+        assert max(data['drawdown']) == 300
+        # Peak before the drawdown and its trough both survive downsampling
+        assert 600 in data['equity']
+        assert 300 in data['equity']
+
+    def test_equity_curve_point_budget_includes_extremes(self):
+        import app as app_module
+
+        rng = np.random.default_rng(3)
+        for _ in range(50):
+            equity, drawdown = app_module._equity_curve(rng.normal(0, 10, 300))
+            for points in (3, 4, 5, 8, 40):
+                keep = app_module._downsample_equity_curve(equity, drawdown, points)
+                assert len(keep) <= points
+                assert keep[0] == 0 and keep[-1] == 299
+                assert int(np.argmax(drawdown)) in keep
+
+class TestDashboard:
+    def test_dashboard_matches_individual_endpoints(self, user_client):
+        create_closed_trade(user_client, 50, '2025-01-06 09:00:00', models=['breakout'], confirmations=['volume'])
+        create_closed_trade(user_client, -20, '2025-01-07 14:00:00', asset='ETHUSDT', models=['breakout', 'reversal'])
+        create_closed_trade(user_client, 30, '2025-01-07 15:00:00', side='short', entries=['limit'], key_levels=['PDH'])
+
+        data = json.loads(user_client.get('/api/dashboard').data)
+
+        trades = json.loads(user_client.get('/api/trades').data)
+        assert data['trades']['statistics'] == trades['statistics']
+        assert [t['id'] for t in data['trades']['trades']] == [t['id'] for t in trades['trades']]
+        assert data['risk_metrics'] == json.loads(user_client.get('/api/risk_metrics').data)
+        assert data['time_analytics'] == json.loads(user_client.get('/api/time_analytics').data)
+        assert data['calendar'] == json.loads(user_client.get('/api/calendar_data').data)
+        assert data['equity_curve'] == json.loads(user_client.get('/api/equity_curve').data)
+        for section in ('by_model', 'by_confirmation', 'by_entry', 'by_key_level'):
+            assert data[section] == json.loads(user_client.get(f'/api/analytics/{section}?asset=all').data)
+
+        filtered = json.loads(user_client.get('/api/dashboard?sections=by_model&asset=BTCUSDT').data)
+        assert list(filtered) == ['by_model']
+        assert filtered['by_model'] == json.loads(user_client.get('/api/analytics/by_model?asset=BTCUSDT').data)
+
+    def test_dashboard_unknown_section(self, user_client):
+        response = user_client.get('/api/dashboard?sections=trades,bogus')
+        assert response.status_code == 400
+
+class TestMonteCarlo:
+    def test_monte_carlo_seeded_runs_are_deterministic(self, user_client):
+        for i, pnl in enumerate([40, -20, 15, -10, 25]):
+            create_closed_trade(user_client, pnl, f'2025-02-0{i + 1} 10:00:00', stop_loss=90)
+
+        url = '/api/monte_carlo?paths=500&horizon=50&seed=7'
+        first = json.loads(user_client.get(url).data)
+        second = json.loads(user_client.get(url).data)
+        assert first == second
+        assert first['sample_size'] == 5
+        assert first['final_equity']['p5'] <= first['final_equity']['p50'] <= first['final_equity']['p95']
+        assert 0 <= first['risk_of_ruin'] <= 100
+
+        r_mode = json.loads(user_client.get('/api/monte_carlo?mode=r&paths=200&seed=7').data)
+        assert r_mode['success'] is True
+        assert r_mode['horizon'] == 5
+        assert user_client.get('/api/monte_carlo?seed=-1').status_code == 400
+        assert user_client.get('/api/monte_carlo?mode=r&risk_pct=150').status_code == 400
+
+    def test_monte_carlo_pool_matches_single_process(self, monkeypatch):
+        import app as app_module
+
+        args = ([1.0, -0.5, 2.0], 400, 30, 'r', 1000.0, 0.01, 500.0, 11)
+        monkeypatch.setattr(app_module, 'MONTE_CARLO_CHUNK_CELLS', 3000)
+        monkeypatch.setattr(app_module, 'MONTE_CARLO_POOL_MIN_CELLS', 10 ** 12)
+        single = app_module._run_monte_carlo(*args)
+        monkeypatch.setattr(app_module, 'MONTE_CARLO_POOL_MIN_CELLS', 0)
+        try:
+            pooled = app_module._run_monte_carlo(*args)
+        finally:
+            app_module._shutdown_simulation_pool()
+        assert pooled.keys() == single.keys()
+        for key in single:
+            assert (pooled[key] == single[key]).all()
+
+    def test_monte_carlo_requires_trades(self, user_client):
+        response = user_client.get('/api/monte_carlo')
+        assert response.status_code == 400
+
+class TestRollingMetrics:
+    def test_rolling_metrics_match_window_by_hand(self, user_client):
+        pnls = [10, -5, 20, -10, 15, -5]
+        for i, pnl in enumerate(pnls):
+            create_closed_trade(user_client, pnl, f'2025-03-{i * 2 + 1:02d} 10:00:00', stop_loss=95)
+        # entry_time is stored unvalidated; a row that does not parse is skipped, not a 500
+        create_closed_trade(user_client, 50, 'last tuesday', stop_loss=95, exit_time='2025-03-12 10:00:00')
+
+        response = user_client.get('/api/rolling_metrics?window=3&days=4')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['source_points'] == len(pnls)
+        by_trades = data['by_trades']
+        assert len(by_trades['win_rate']) == len(pnls) - 2
+        assert by_trades['win_rate'][0] == 66.67
+        assert by_trades['expectancy'][0] == round(25 / 3, 2)
+        assert by_trades['profit_factor'][0] == 6.0
+        # Stop 5 below entry with quantity 1 risks 5 per trade
+        assert by_trades['avg_r'][0] == round(25 / 3 / 5, 2)
+
+        by_days = data['by_days']
+        assert by_days['date'][0] == '2025-03-01'
+        assert by_days['date'][-1] == '2025-03-11'
+        # Trades fall every other day, so a 4-day window always holds two of them
+        assert by_days['trade_count'][3:] == [2] * 8
+        assert by_days['expectancy'][2] == 2.5
+
+class TestDistributions:
+    def test_distribution_percentiles_and_incremental_updates(self, user_client):
+        for i in range(1, 41):
+            create_closed_trade(user_client, i, f'2025-04-01 10:{i:02d}:00', models=['breakout'])
+
+        data = json.loads(user_client.get('/api/distributions?metric=pnl').data)
+        overall = data['groups']['']
+        assert overall['count'] == 40
+        assert overall['min'] == 1 and overall['max'] == 40
+        assert abs(overall['percentiles']['p50'] - 20.5) < 1
+        assert sum(overall['histogram']['counts']) == 40
+
+        # New closed trades are folded into the existing sketches
+        create_closed_trade(user_client, -50, '2025-04-02 10:00:00', asset='ETHUSDT')
+        data = json.loads(user_client.get('/api/distributions?metric=pnl&dimension=asset').data)
+        assert data['groups']['ETHUSDT']['count'] == 1
+        assert data['groups']['BTCUSDT']['count'] == 40
+
+        by_model = json.loads(user_client.get('/api/distributions?metric=pnl&dimension=model&value=breakout').data)
+        assert by_model['groups']['breakout']['count'] == 40
+
+    def test_distribution_rebuilds_after_delete(self, user_client):
+        trade_id = create_closed_trade(user_client, 50, '2025-04-03 10:00:00')
+        create_closed_trade(user_client, -10, '2025-04-03 11:00:00')
+        assert json.loads(user_client.get('/api/distributions').data)['groups']['']['count'] == 2
+
+        user_client.delete(f'/api/trades/{trade_id}')
+        overall = json.loads(user_client.get('/api/distributions').data)['groups']['']
+        assert overall['count'] == 1
+        assert overall['max'] == -10
+
+    def test_distribution_sketch_values_large_id_list(self, user_client):
+        import app as app_module
+
+        trade_id = create_closed_trade(user_client, 7, '2025-04-04 10:00:00', models=['breakout'])
+        user_id = json.loads(user_client.get(f'/api/trades/{trade_id}').data)['user_id']
+        conn = app_module.get_db_connection()
+        # Older SQLite builds only allow 999 bound parameters (setlimit is Python 3.11+)
+        if hasattr(conn, 'setlimit'):
+            conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+        try:
+            ids = [trade_id] + [f'missing-{i}' for i in range(5000)]
+            groups = app_module._sketch_values(conn.cursor(), user_id, ids)
+        finally:
+            conn.close()
+        assert groups[('pnl', 'all', '')] == [7]
+        assert groups[('pnl', 'model', 'breakout')] == [7]
+
+    def test_distribution_invalid_metric(self, user_client):
+        assert user_client.get('/api/distributions?metric=bogus').status_code == 400
+
+class TestTradeMetrics:
+    def test_metrics_computed_on_write_and_recomputed(self, user_client):
+        import sqlite3
+        from app import recompute_trade_metrics
+
+        trade_id = create_closed_trade(user_client, 10, '2025-05-01T10:00:00', stop_loss=90, quantity=2,
+                                       exit_time='2025-05-01T12:30:00')
+        create_closed_trade(user_client, 5, '2025-05-01 13:00:00')
+
+        trades = {t['id']: t for t in json.loads(user_client.get('/api/trades').data)['trades']}
+        trade = trades[trade_id]
+        # (110 - 100) * 2 = 20 P&L against 10 * 2 = 20 risked at the stop
+        assert trade['realized_r'] == 1.0
+        assert trade['holding_seconds'] == 9000
+        assert trade['notional'] == 200
+        assert [t['realized_r'] for t in trades.values() if t['id'] != trade_id] == [None]
+
+        conn = sqlite3.connect(app.config['DATABASE_PATH'])
+        conn.execute('UPDATE trades SET realized_r = NULL, holding_seconds = NULL, notional = NULL WHERE id = ?',
+                     (trade_id,))
+        assert recompute_trade_metrics(conn, user_id=trade['user_id'], only_missing=True) == 1
+        conn.commit()
+        conn.close()
+
+        refreshed = json.loads(user_client.get('/api/trades').data)['trades']
+        # The raw UPDATE is a change like any other, so only updated_at may differ
+        def without_stamp(t):
+            return {k: v for k, v in t.items() if k != 'updated_at'}
+
+        assert without_stamp([t for t in refreshed if t['id'] == trade_id][0]) == without_stamp(trade)
+
+class TestExcursions:
+    def test_excursions_from_cached_klines(self, user_client, monkeypatch, tmp_path):
+        import app as app_module
+
+        symbol = f'T{uuid.uuid4().hex[:8].upper()}USDT'
+        spike = int(datetime(2025, 6, 1, 10, 30, tzinfo=timezone.utc).timestamp() * 1000)
+        calls = []
+
+        def fake_fetch(sym, interval, start_ms, end_ms):
+            calls.append((sym, start_ms, end_ms))
+            step = app_module.KLINE_INTERVAL_MS[interval]
+            # Bybit returns each page newest-first
+            return [
+                (t, 100, 112 if t == spike else 105, 95 if t == spike else 97, 100, 1)
+                for t in reversed(range(start_ms, end_ms, step))
+            ]
+
+        monkeypatch.setattr(app_module, 'MARKET_DATA_FOLDER', str(tmp_path))
+        monkeypatch.setattr(app_module, '_fetch_klines', fake_fetch)
+
+        long_id = create_closed_trade(user_client, 5, '2025-06-01 10:05:00', asset=symbol, stop_loss=90,
+                                      exit_time='2025-06-01 11:00:00')
+        short_id = create_closed_trade(user_client, 2, '2025-06-01 10:50:00', asset=symbol, side='short',
+                                       stop_loss=110, exit_time='2025-06-01 10:55:00')
+
+        data = json.loads(user_client.get(f'/api/excursions?asset={symbol}').data)
+        trades = {t['trade_id']: t for t in data['trades']}
+        assert trades[long_id]['mfe'] == 12 and trades[long_id]['mae'] == 5
+        assert trades[long_id]['mae_r'] == 0.5 and trades[long_id]['mfe_r'] == 1.2
+        assert trades[short_id]['mfe'] == 3 and trades[short_id]['mae_r'] == 0.5
+        assert data['summary']['covered'] == 2
+        assert len(calls) == 1
+        # Candles are stored in open_time order, so reads stay on the memory map
+        columns = app_module.load_klines(symbol, app_module.KLINE_DEFAULT_INTERVAL)
+        assert isinstance(columns['open_time'], np.memmap)
+        assert np.all(np.diff(columns['open_time']) > 0)
+
+        # Covered ranges are served from the memory-mapped cache without another download
+        again = json.loads(user_client.get(f'/api/excursions?asset={symbol}').data)
+        assert again['trades'] == data['trades']
+        assert len(calls) == 1
+
+    def test_append_after_interrupted_write_keeps_columns_aligned(self, monkeypatch, tmp_path):
+        import app as app_module
+
+        monkeypatch.setattr(app_module, 'MARKET_DATA_FOLDER', str(tmp_path))
+        app_module.append_klines('ALIGNUSDT', '1', [(0, 1, 2, 0.5, 1.5, 10)])
+        # A write cut off after the first column leaves open_time one row ahead
+        with open(os.path.join(app_module._kline_dir('ALIGNUSDT', '1'), 'open_time.bin'), 'ab') as f:
+            f.write(np.array([60000], dtype='<i8').tobytes())
+        app_module.append_klines('ALIGNUSDT', '1', [(120000, 3, 4, 2.5, 3.5, 30)])
+
+        columns = app_module.load_klines('ALIGNUSDT', '1')
+        assert columns['open_time'].tolist() == [0, 120000]
+        assert columns['high'].tolist() == [2, 4] and columns['volume'].tolist() == [10, 30]
+
+    def test_excursions_without_cached_candles(self, user_client, monkeypatch, tmp_path):
+        import app as app_module
+
+        monkeypatch.setattr(app_module, 'MARKET_DATA_FOLDER', str(tmp_path))
+        trade_id = create_closed_trade(user_client, 5, '2025-06-02 10:00:00', asset='NOCACHEUSDT')
+        data = json.loads(user_client.get('/api/excursions?fetch=0').data)
+        assert data['trades'] == [{'trade_id': trade_id, 'asset': 'NOCACHEUSDT', 'side': 'long', 'mae': None,
+                                   'mfe': None, 'mae_pct': None, 'mfe_pct': None, 'mae_r': None, 'mfe_r': None}]
+        assert user_client.get('/api/excursions?interval=7').status_code == 400
+
+class TestAssetBreakdown:
+    def test_per_asset_stats_and_correlation(self, user_client):
+        base = [10, -5, 20, -10, 15, 5]
+        for day, pnl in enumerate(base):
+            date = f'2025-07-{day + 1:02d}'
+            create_closed_trade(user_client, pnl, f'{date} 09:00:00', asset='AAAUSDT')
+            create_closed_trade(user_client, pnl * 2, f'{date} 10:00:00', asset='BBBUSDT')
+            create_closed_trade(user_client, -pnl / 5, f'{date} 11:00:00', asset='CCCUSDT')
+        create_closed_trade(user_client, 7, '2025-07-01 12:00:00', asset='DDDUSDT')
+
+        data = json.loads(user_client.get('/api/analytics/by_asset').data)
+        assets = {a['asset']: a for a in data['assets']}
+        assert assets['BBBUSDT']['total_pnl'] == 70
+        assert assets['AAAUSDT']['win_rate'] == 66.7
+        assert assets['AAAUSDT']['profit_factor'] == 3.33
+        assert assets['DDDUSDT']['trading_days'] == 1
+        assert data['assets'][0]['asset'] == 'BBBUSDT'
+
+        correlation = data['correlation']
+        # DDDUSDT traded on a single day, below the default min_days
+        assert correlation['assets'] == ['AAAUSDT', 'BBBUSDT', 'CCCUSDT']
+        assert correlation['days'] == 6
+        assert correlation['matrix'][0][1] == 1.0
+        assert correlation['matrix'][0][2] == -1.0
+        assert correlation['top_pairs'][0]['correlation'] in (1.0, -1.0)
+
+        short_only = json.loads(user_client.get('/api/analytics/by_asset?side=short').data)
+        assert short_only['assets'] == []
+        assert short_only['correlation']['matrix'] == []
+
+class TestTradeCache:
+    ENDPOINTS = ('/api/trades?period=all', '/api/risk_metrics', '/api/time_analytics',
+                 '/api/analytics/by_model?side=long', '/api/analytics/by_confirmation?asset=all',
+                 '/api/analytics/by_entry', '/api/analytics/by_key_level?asset=ETHUSDT')
+
+    def _responses(self, client):
+        results = {}
+        for url in self.ENDPOINTS:
+            data = json.loads(client.get(url).data)
+            results[url] = data['statistics'] if url.startswith('/api/trades') else data
+        return results
+
+    def test_cache_matches_sqlite_and_follows_writes(self, user_client, monkeypatch):
+        import app as app_module
+
+        create_closed_trade(user_client, 40, '2025-08-04 09:00:00', models=['breakout'], confirmations=['volume'],
+                            stop_loss=90)
+        create_closed_trade(user_client, -15, '2025-08-05 14:30:00', asset='ETHUSDT', models=['breakout', 'reversal'],
+                            key_levels=['PDH'])
+        create_closed_trade(user_client, 25, '2025-08-09 21:00:00', side='short', entries=['limit'], key_levels=['PDH'],
+                            asset='ETHUSDT')
+        last_id = create_closed_trade(user_client, -5, '2025-08-10 03:00:00', models=['reversal'])
+
+        cached = self._responses(user_client)
+        monkeypatch.setattr(app_module.trade_cache, 'budget_bytes', 0)
+        assert self._responses(user_client) == cached
+        monkeypatch.undo()
+
+        # Writes are applied to the loaded columns without reloading them
+        user_client.delete(f'/api/trades/{last_id}')
+        create_closed_trade(user_client, 60, '2025-08-11 10:00:00', models=['reversal'])
+        cached = self._responses(user_client)
+        assert cached['/api/risk_metrics']['largest_win'] == 60
+        assert cached['/api/trades?period=all']['total_trades'] == 4
+        monkeypatch.setattr(app_module.trade_cache, 'budget_bytes', 0)
+        assert self._responses(user_client) == cached
+
+    def test_cache_evicts_least_recently_used(self, client):
+        import app as app_module
+
+        user_ids = []
+        for _ in range(2):
+            client.post('/api/users', data=json.dumps({'name': f'test_{uuid.uuid4().hex[:12]}'}),
+                        content_type='application/json')
+            create_closed_trade(client, 10, '2025-08-01 10:00:00')
+            user_ids.append(json.loads(client.get('/api/trades').data)['trades'][0]['user_id'])
+
+        cache = app_module.TradeCache(budget_bytes=1)
+        first = cache.get(user_ids[0])
+        cache.get(user_ids[1])
+        assert list(cache._users) == [user_ids[1]]
+        assert cache.get(user_ids[0]) is not first
+        assert list(cache._users) == [user_ids[0]]
+
+    def test_time_analytics_buckets_written_wall_clock(self, user_client, monkeypatch):
+        import app as app_module
+
+        # 23:30 on Monday as written, 04:30 on Tuesday in UTC
+        create_closed_trade(user_client, 10, '2025-05-05T23:30:00-05:00')
+        create_closed_trade(user_client, -4, '2025-05-06T08:00:00Z')
+        cached = json.loads(user_client.get('/api/time_analytics').data)
+        assert cached['by_hour']['23']['count'] == 1 and cached['by_day']['0']['count'] == 1
+        monkeypatch.setattr(app_module.trade_cache, 'budget_bytes', 0)
+        assert json.loads(user_client.get('/api/time_analytics').data) == cached
+
+
+class TestTags:
+    def test_tags_listed_with_counts_and_prefix(self, user_client):
+        create_closed_trade(user_client, 10, '2025-09-01 10:00:00', models=['Breakout', 'reversal'])
+        create_closed_trade(user_client, -5, '2025-09-02 10:00:00', models=['breakout '], key_levels=['PDH'])
+        deleted_id = create_closed_trade(user_client, 5, '2025-09-03 10:00:00', models=['Breakout'])
+        user_client.delete(f'/api/trades/{deleted_id}')
+
+        tags = json.loads(user_client.get('/api/tags?category=model').data)['tags']
+        assert [(t['name'], t['trade_count']) for t in tags] == [('Breakout', 2), ('reversal', 1)]
+
+        suggestions = json.loads(user_client.get('/api/tags?prefix=BRE').data)['tags']
+        assert [t['name'] for t in suggestions] == ['Breakout']
+
+        details = json.loads(user_client.get(f'/api/trades/{deleted_id}/details').data)
+        assert details['models'] == ['Breakout']
+        assert user_client.get('/api/tags?category=bogus').status_code == 400
+
+    def test_legacy_tag_table_migration(self):
+        import sqlite3
+        from app import _migrate_tag_table
+
+        conn = sqlite3.connect(':memory:')
+        conn.executescript('''
+            CREATE TABLE trades (id INTEGER PRIMARY KEY, user_id INTEGER);
+            CREATE TABLE tags (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL,
+                               category TEXT NOT NULL, name TEXT NOT NULL COLLATE NOCASE,
+                               created_at TIMESTAMP, UNIQUE(user_id, category, name));
+            CREATE TABLE trade_models (id INTEGER PRIMARY KEY AUTOINCREMENT, trade_id INTEGER NOT NULL,
+                                       model TEXT NOT NULL, created_at TIMESTAMP, UNIQUE(trade_id, model));
+            INSERT INTO trades VALUES (1, 1), (2, 1), (3, 2);
+            INSERT INTO trade_models (trade_id, model) VALUES
+                (1, 'reversal'), (1, 'breakout'), (2, 'Breakout'), (3, 'breakout');
+        ''')
+        _migrate_tag_table(conn.cursor(), 'model', 'trade_models', 'model')
+
+        assert conn.execute('SELECT user_id, name FROM tags ORDER BY id').fetchall() == [
+            (1, 'reversal'), (1, 'breakout'), (2, 'breakout')
+        ]
+        assert conn.execute('''
+            SELECT d.trade_id, g.user_id, g.name FROM trade_models d JOIN tags g ON g.id = d.tag_id ORDER BY d.rowid
+        ''').fetchall() == [(1, 1, 'reversal'), (1, 1, 'breakout'), (2, 1, 'breakout'), (3, 2, 'breakout')]
+
+        # A failure rolls the whole migration back; a leftover _legacy table is resumed
+        conn.executescript('''
+            DROP TABLE trade_models; DELETE FROM tags;
+            CREATE TABLE trade_models_legacy (id INTEGER PRIMARY KEY AUTOINCREMENT, trade_id INTEGER NOT NULL,
+                                              model TEXT NOT NULL);
+            INSERT INTO trade_models_legacy (trade_id, model) VALUES (1, 'scalp'), (3, 'scalp');
+        ''')
+        with pytest.raises(sqlite3.OperationalError):
+            _migrate_tag_table(conn.cursor(), 'model', 'trade_models', 'missing_column')
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 'trade_models%' AND type = 'table'"
+                            ).fetchall() == [('trade_models_legacy',)]
+        _migrate_tag_table(conn.cursor(), 'model', 'trade_models', 'model')
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 'trade_models%' AND type = 'table'"
+                            ).fetchall() == [('trade_models',)]
+        assert conn.execute('SELECT COUNT(*) FROM trade_models').fetchone() == (2,)
+
+class TestPeriodSummaries:
+    def test_rollups_follow_writes(self, user_client):
+        create_closed_trade(user_client, 30, '2025-03-30 10:00:00')   # Sunday, ISO week 13
+        create_closed_trade(user_client, -10, '2025-03-31 10:00:00')  # Monday, ISO week 14
+        create_closed_trade(user_client, 20, '2025-04-02 10:00:00')
+
+        months = json.loads(user_client.get('/api/period_summaries?period=month').data)['summaries']
+        assert [m['period'] for m in months] == ['2025-04', '2025-03']
+        march = months[1]
+        assert (march['trade_count'], march['total_pnl'], march['win_rate']) == (2, 20, 50.0)
+        assert (march['profit_factor'], march['best_trade'], march['worst_trade']) == (3.0, 30, -10)
+        assert march['trading_days'] == 2
+
+        weeks = json.loads(user_client.get('/api/period_summaries?period=week').data)['summaries']
+        assert [(w['period'], w['total_pnl']) for w in weeks] == [('2025-W14', 10), ('2025-W13', 30)]
+        assert weeks[0]['start_date'] == '2025-03-31' and weeks[0]['end_date'] == '2025-04-06'
+
+        # Incremental maintenance after the first build
+        trade_id = create_closed_trade(user_client, 50, '2025-04-05 10:00:00')
+        quarter = json.loads(user_client.get('/api/period_summaries?period=quarter').data)['summaries'][0]
+        assert (quarter['period'], quarter['trade_count'], quarter['total_pnl']) == ('2025-Q2', 2, 70)
+        user_client.delete(f'/api/trades/{trade_id}')
+        year = json.loads(user_client.get('/api/period_summaries?period=year').data)['summaries'][0]
+        assert (year['period'], year['trade_count'], year['total_pnl']) == ('2025', 3, 40)
+
+    def test_period_comparison(self, user_client):
+        create_closed_trade(user_client, 40, '2025-01-15 10:00:00')
+        create_closed_trade(user_client, 10, '2025-02-03 10:00:00')
+        create_closed_trade(user_client, -20, '2025-02-04 10:00:00')
+
+        data = json.loads(user_client.get('/api/period_summaries/compare?period=month&current=2025-02').data)
+        assert data['previous']['period'] == '2025-01'
+        assert data['current']['total_pnl'] == -10
+        assert data['change']['total_pnl'] == {'absolute': -50, 'percent': -125.0}
+        assert data['change']['trade_count'] == {'absolute': 1, 'percent': 100.0}
+
+        empty = json.loads(user_client.get('/api/period_summaries/compare?period=week&current=2024-W10').data)
+        assert empty['current']['trade_count'] == 0 and empty['previous']['period'] == '2024-W09'
+        assert user_client.get('/api/period_summaries/compare?current=2025-13').status_code == 400
+
+class TestExport:
+    def _trades(self, client):
+        create_closed_trade(client, 25, '2025-10-01 09:00:00', models=['breakout', 'retest'], key_levels=['PDH'],
+                            notes='comma, "quoted"')
+        create_closed_trade(client, -10, '2025-10-02 09:00:00', asset='ETHUSDT', side='short')
+
+    def test_export_csv_and_ndjson(self, user_client):
+        import csv as csv_module
+
+        self._trades(user_client)
+        response = user_client.get('/api/export/trades?format=csv')
+        assert response.mimetype == 'text/csv'
+        assert 'attachment' in response.headers['Content-Disposition']
+        rows = list(csv_module.DictReader(io.StringIO(response.get_data(as_text=True))))
+        assert [r['asset'] for r in rows] == ['BTCUSDT', 'ETHUSDT']
+        assert rows[0]['models'] == 'breakout|retest'
+        assert rows[0]['notes'] == 'comma, "quoted"'
+        assert rows[1]['models'] == ''
+
+        lines = user_client.get('/api/export/trades?format=ndjson&asset=ETHUSDT').get_data(as_text=True).splitlines()
+        records = [json.loads(line) for line in lines]
+        assert len(records) == 1
+        assert records[0]['side'] == 'short' and records[0]['pnl'] == -10 and records[0]['key_levels'] == []
+
+        assert user_client.get('/api/export/trades?format=xlsx').status_code == 400
+
+    def test_export_parquet(self, user_client):
+        pq = pytest.importorskip('pyarrow.parquet')
+
+        self._trades(user_client)
+        response = user_client.get('/api/export/trades?format=parquet&side=long')
+        table = pq.read_table(io.BytesIO(response.get_data()))
+        assert table.column('asset').to_pylist() == ['BTCUSDT']
+        assert table.column('models').to_pylist() == [['breakout', 'retest']]
+
+class TestImport:
+    CSV = (
+        'Symbol,Direction,Entry,Exit,Qty,SL,TP,Opened,Closed,Ref,models\n'
+        'BTCUSDT,buy,100,110,2,95,120,2025-10-01T09:00:00Z,1759313400000,A1,breakout|retest\n'
+        'ETHUSDT,sell,50,45,1,55,40,2025-10-02 09:00:00,2025-10-02 10:00:00,A2,\n'
+        'SOLUSDT,short,20,18,1,,,2025-10-03 09:00:00,,A3,\n'
+    )
+    MAPPING = json.dumps({'Opened': 'entry_time', 'Closed': 'exit_time', 'Ref': 'external_id'})
+
+    def test_import_csv_with_mapping_and_dedupe(self, user_client):
+        response = user_client.post('/api/import/trades', data={
+            'file': (io.BytesIO(self.CSV.encode()), 'trades.csv'), 'mapping': self.MAPPING
+        }, content_type='multipart/form-data')
+        report = json.loads(response.data)
+        assert response.status_code == 200, report
+        assert report['imported'] == 3 and report['duplicates'] == 0 and report['chunks'] == 1
+
+        data = json.loads(user_client.get('/api/trades').data)
+        assert data['statistics']['total_trades'] == 3
+        trades = {t['asset']: t for t in data['trades']}
+        btc = trades['BTCUSDT']
+        assert btc['side'] == 'long' and btc['pnl'] == 20 and btc['risk_reward_ratio'] == 4.0
+        assert btc['entry_time'] == '2025-10-01 09:00:00' and btc['exit_time'] == '2025-10-01 10:10:00'
+        assert json.loads(user_client.get(f"/api/trades/{btc['id']}").data)['models'] == ['breakout', 'retest']
+        assert trades['ETHUSDT']['pnl'] == 5
+        # Closed by default once an exit price is given
+        assert trades['SOLUSDT']['status'] == 'closed' and trades['SOLUSDT']['pnl'] == 2
+
+        response = user_client.post(f'/api/import/trades?format=csv&mapping={self.MAPPING}', data=self.CSV)
+        report = json.loads(response.data)
+        assert report['imported'] == 0 and report['duplicates'] == 3
+
+        # An upload that is not UTF-8 comes back as the endpoint's JSON error
+        response = user_client.post('/api/import/trades', data={
+            'file': (io.BytesIO(b'Symbol\n\xff\xfe\n'), 'trades.csv')
+        }, content_type='multipart/form-data')
+        assert response.status_code == 500 and json.loads(response.data)['success'] is False
+
+    def test_import_collects_all_errors(self, user_client):
+        records = [
+            {'asset': 'BTCUSDT', 'side': 'long', 'entry_price': 100, 'quantity': 1, 'entry_time': '2025-10-01 09:00'},
+            {'asset': 'BTCUSDT', 'side': 'up', 'entry_price': -1, 'quantity': 1, 'entry_time': 'yesterday'},
+            {'side': 'short', 'entry_price': 100, 'quantity': 'x', 'entry_time': '2025-10-01', 'daily_bias': 'up'},
+        ]
+        response = user_client.post('/api/import/trades?format=json', data=json.dumps(records))
+        report = json.loads(response.data)
+        assert response.status_code == 400
+        assert report['imported'] == 0 and report['error_count'] == 6
+        assert {(e['row'], e['field']) for e in report['errors']} == {
+            (2, 'side'), (2, 'entry_price'), (2, 'entry_time'), (3, 'asset'), (3, 'quantity'), (3, 'daily_bias')
+        }
+        assert json.loads(user_client.get('/api/trades?status=open').data)['trades'] == []
+
+        report = json.loads(user_client.post('/api/import/trades?format=json&skip_invalid=true',
+                                             data=json.dumps(records)).data)
+        assert report['success'] and report['imported'] == 1
+        assert len(json.loads(user_client.get('/api/trades?status=open').data)['trades']) == 1
+
+class TestBatchMutations:
+    def _patch(self, client, body):
+        return client.patch('/api/trades:batch', data=json.dumps(body), content_type='application/json')
+
+    def test_batch_update_by_ids_and_filter(self, user_client):
+        first = create_closed_trade(user_client, 10, '2025-10-01 09:00:00', models=['Breakout', 'retest'])
+        second = create_closed_trade(user_client, -5, '2025-10-02 09:00:00', models=['breakout'])
+        other = create_closed_trade(user_client, 5, '2025-11-03 09:00:00', asset='ETHUSDT')
+        user_client.get('/api/analytics/by_confirmation')
+
+        response = self._patch(user_client, {
+            'ids': [first, second, 999999],
+            'set': {'daily_bias': 'bullish', 'stop_loss': 95, 'take_profit': 110},
+            'add_tags': {'confirmations': ['volume']},
+            'remove_tags': {'models': ['BREAKOUT']},
+        })
+        result = json.loads(response.data)
+        assert response.status_code == 200 and result['matched'] == 2
+
+        trade = json.loads(user_client.get(f'/api/trades/{first}').data)
+        assert trade['daily_bias'] == 'bullish' and trade['risk_reward_ratio'] == 2.0 and trade['realized_r'] == 2.0
+        assert trade['models'] == ['retest'] and trade['confirmations'] == ['volume']
+        assert json.loads(user_client.get(f'/api/trades/{other}').data)['daily_bias'] == 'neutral'
+
+        # The trade cache serves analytics, so it must see the batch change
+        confirmations = json.loads(user_client.get('/api/analytics/by_confirmation?daily_bias=bullish').data)
+        assert confirmations['confirmations'][0]['trade_count'] == 2
+
+        result = json.loads(self._patch(user_client, {
+            'filter': {'start_date': '2025-11-01', 'end_date': '2025-11-30'}, 'set': {'weekly_bias': 'bearish'}
+        }).data)
+        assert result['ids'] == [other]
+
+        assert self._patch(user_client, {'ids': [first], 'set': {'pnl': 1}}).status_code == 400
+        assert self._patch(user_client, {'ids': [first], 'filter': {'asset': 'x'}, 'set': {'notes': ''}}).status_code == 400
+        assert self._patch(user_client, {'ids': [first], 'set': {'daily_bias': 'up'}}).status_code == 400
+
+    def test_batch_delete(self, user_client):
+        ids = [create_closed_trade(user_client, pnl, f'2025-10-0{i + 1} 09:00:00') for i, pnl in enumerate((1, 2, 3))]
+        user_client.get('/api/period_summaries?period=month')
+
+        response = user_client.delete('/api/trades:batch', data=json.dumps({'ids': ids[:2]}),
+                                      content_type='application/json')
+        assert json.loads(response.data)['matched'] == 2
+
+        data = json.loads(user_client.get('/api/trades').data)
+        assert [t['id'] for t in data['trades']] == [ids[2]]
+        assert data['statistics']['total_pnl'] == 3
+        summary = json.loads(user_client.get('/api/period_summaries?period=month').data)
+        assert summary['summaries'][0]['total_pnl'] == 3
+
+class TestBackups:
+    def test_backup_generations_and_restore(self, user_client, monkeypatch, tmp_path):
+        import sqlite3
+        import app as app_module
+
+        monkeypatch.setattr(app_module, 'BACKUP_FOLDER', str(tmp_path))
+        monkeypatch.setattr(app_module, 'BACKUP_PAGES_PER_STEP', 1)
+        kept = create_closed_trade(user_client, 10, '2025-10-01 09:00:00')
+
+        results = [app_module.backup_database(keep=2) for _ in range(3)]
+        assert all(r['integrity'] == 'ok' for r in results)
+        assert results[2]['pruned'] == [results[0]['name']]
+        assert [b['name'] for b in app_module.list_backups()] == [results[2]['name'], results[1]['name']]
+        with sqlite3.connect(results[2]['path']) as conn:
+            assert conn.execute('SELECT pnl FROM trades WHERE id = ?', (kept,)).fetchone() == (10,)
+
+        response = user_client.post('/api/backups')
+        assert json.loads(response.data)['success']
+        assert len(json.loads(user_client.get('/api/backups').data)['backups']) == 3
+
+        dropped = create_closed_trade(user_client, 20, '2025-10-02 09:00:00')
+        assert json.loads(user_client.get('/api/trades').data)['statistics']['total_pnl'] == 30
+        # The server restores in-process, so its warm trade cache is dropped too
+        user_client.get('/api/risk_metrics')
+        assert user_client.post('/api/backups/restore', json={'name': '../x.db'}).status_code == 400
+        restored = json.loads(user_client.post('/api/backups/restore', json={'name': results[2]['name']}).data)
+        assert restored['success'] and restored['restored'] == results[2]['name']
+        safety = app_module.list_backups()[0]
+        assert safety['name'] == restored['safety_backup']
+        assert json.loads(user_client.get('/api/risk_metrics').data)['largest_win'] == 10
+        trades = json.loads(user_client.get('/api/trades').data)
+        assert [t['id'] for t in trades['trades']] == [kept] and trades['statistics']['total_pnl'] == 10
+        with sqlite3.connect(safety['path']) as conn:
+            assert conn.execute('SELECT COUNT(*) FROM trades WHERE id = ?', (dropped,)).fetchone() == (1,)
+
+    def test_restore_oldest_backup_at_keep_limit(self, user_client, monkeypatch, tmp_path):
+        import app as app_module
+
+        monkeypatch.setattr(app_module, 'BACKUP_FOLDER', str(tmp_path))
+        monkeypatch.setattr(app_module, 'BACKUP_KEEP', 3)
+        kept = create_closed_trade(user_client, 10, '2025-10-01 09:00:00')
+        results = [app_module.backup_database() for _ in range(3)]
+        create_closed_trade(user_client, 20, '2025-10-02 09:00:00')
+
+        restored = json.loads(user_client.post('/api/backups/restore', json={'name': results[0]['name']}).data)
+        assert restored['success']
+        trades = json.loads(user_client.get('/api/trades').data)['trades']
+        assert [t['id'] for t in trades] == [kept]
+        # Pruning runs after the restore and keeps the safety backup
+        names = [b['name'] for b in app_module.list_backups()]
+        assert names == [restored['safety_backup'], results[2]['name'], results[1]['name']]
+
+        missing = str(tmp_path / 'trading_journal_missing.db')
+        with pytest.raises(FileNotFoundError):
+            app_module.restore_database(missing)
+        assert not os.path.exists(missing)
+
+    def test_backup_sets_include_archives(self, user_client, monkeypatch, tmp_path):
+        import app as app_module
+
+        monkeypatch.setattr(app_module, 'BACKUP_FOLDER', str(tmp_path / 'backups'))
+        monkeypatch.setattr(app_module, 'ARCHIVE_FOLDER', str(tmp_path / 'archive'))
+        old = create_closed_trade(user_client, 10, '2022-05-01 09:00:00')
+        hot = create_closed_trade(user_client, 5, (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S'))
+        user_id = json.loads(user_client.get(f'/api/trades/{old}').data)['user_id']
+        before_archive = app_module.backup_database()
+        assert before_archive['archive_years'] == []
+
+        conn = app_module.get_db_connection()
+        app_module.archive_trades(conn, older_than_days=365, user_id=user_id)
+        conn.close()
+        archived = app_module.backup_database()
+        assert archived['archive_years'] == ['2022']
+
+        def trade_ids():
+            return sorted(t['id'] for t in json.loads(user_client.get('/api/trades').data)['trades'])
+
+        # A hot-only backup from before archiving must not bring the archived trade back twice
+        app_module.restore_database(before_archive['path'])
+        assert trade_ids() == sorted([old, hot])
+
+        # Restoring a set puts its archive files back too
+        os.remove(app_module._archive_path('2022'))
+        app_module.restore_database(archived['path'])
+        assert app_module.archive_years() == ['2022'] and trade_ids() == sorted([old, hot])
+
+
+class TestArchive:
+    def test_archive_moves_cold_trades_and_reads_union(self, user_client, monkeypatch, tmp_path):
+        import sqlite3
+        import app as app_module
+
+        monkeypatch.setattr(app_module, 'ARCHIVE_FOLDER', str(tmp_path))
+        recent = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+        old_2023 = create_closed_trade(user_client, 30, '2023-05-01 09:00:00', models=['breakout'])
+        old_2024 = create_closed_trade(user_client, -10, '2024-02-01 09:00:00')
+        hot = create_closed_trade(user_client, 5, recent)
+        deleted = create_closed_trade(user_client, 99, recent)
+        user_client.delete(f'/api/trades/{deleted}')
+        before = json.loads(user_client.get('/api/trades').data)['statistics']
+        user_id = json.loads(user_client.get(f'/api/trades/{hot}').data)['user_id']
+
+        conn = app_module.get_db_connection()
+        conn.execute("UPDATE trades SET external_id = 'ext-1' WHERE id = ?", (old_2024,))
+        moved = app_module.archive_trades(conn, older_than_days=365, user_id=user_id)
+        conn.close()
+        # The soft-deleted trade is purged from the hot file regardless of age
+        assert moved == {'2023': 1, '2024': 1, recent[:4]: 1}
+        assert sorted(os.listdir(tmp_path)) == sorted(f'trades_{year}.db' for year in moved)
+        with sqlite3.connect(app_module.app.config['DATABASE_PATH']) as hot_db:
+            assert hot_db.execute(
+                f'SELECT COUNT(*) FROM trades WHERE id IN ({old_2023}, {old_2024}, {deleted})'
+            ).fetchone() == (0,)
+            assert hot_db.execute(f'SELECT COUNT(*) FROM trade_models WHERE trade_id = {old_2023}').fetchone() == (0,)
+
+        # All-time reads span the archives; recent periods stay hot-only
+        monkeypatch.setattr(app_module.trade_cache, 'budget_bytes', 0)
+        data = json.loads(user_client.get('/api/trades').data)
+        assert sorted(t['id'] for t in data['trades']) == sorted([old_2023, old_2024, hot])
+        assert data['statistics'] == before
+        assert [t['id'] for t in json.loads(user_client.get('/api/trades?period=month').data)['trades']] == [hot]
+
+        trade = json.loads(user_client.get(f'/api/trades/{old_2023}').data)
+        assert trade['archived'] and trade['models'] == ['breakout']
+        # Archived trades are read-only rather than silently ignored
+        assert user_client.delete(f'/api/trades/{old_2023}').status_code == 409
+        assert user_client.put(f'/api/trades/{old_2023}', json=trade).status_code == 409
+        assert user_client.post(f'/api/trades/{old_2023}/details', json={'models': ['x']}).status_code == 409
+        assert user_client.post(f'/api/trades/{old_2023}/entry_type', json={'entry_type': 'limit'}).status_code == 409
+        assert user_client.delete('/api/trades/999999').status_code == 404
+        rows = user_client.get('/api/export/trades?format=ndjson').get_data(as_text=True).splitlines()
+        assert [json.loads(r)['models'] for r in rows][0] == ['breakout']
+
+        conn = app_module.get_db_connection()
+        app_module.rebuild_period_summaries(conn, user_id)
+        conn.commit()
+        conn.close()
+        years = json.loads(user_client.get('/api/period_summaries?period=year').data)['summaries']
+        assert {y['period']: y['total_pnl'] for y in years}['2023'] == 30
+
+        # Archived external ids still block re-imports
+        report = json.loads(user_client.post('/api/import/trades?format=json', data=json.dumps([{
+            'asset': 'BTCUSDT', 'side': 'long', 'entry_price': 1, 'quantity': 1,
+            'entry_time': '2024-02-01', 'external_id': 'ext-1'
+        }])).data)
+        assert report['duplicates'] == 1
+
+    def test_archive_years_capped_at_attach_limit(self, user_client, monkeypatch, tmp_path):
+        import app as app_module
+
+        monkeypatch.setattr(app_module, 'ARCHIVE_FOLDER', str(tmp_path))
+        monkeypatch.setattr(app_module, '_attach_limit', lambda conn: 2)
+        ids = [create_closed_trade(user_client, 1, f'{year}-03-01 09:00:00') for year in (2019, 2020, 2021)]
+        user_id = json.loads(user_client.get(f'/api/trades/{ids[0]}').data)['user_id']
+
+        conn = app_module.get_db_connection()
+        moved = app_module.archive_trades(conn, older_than_days=365, user_id=user_id)
+        conn.close()
+        # The newest year stays hot rather than needing a third attached file
+        assert moved == {'2019': 1, '2020': 1}
+        assert app_module.archive_years() == ['2019', '2020']
+        assert sorted(t['id'] for t in json.loads(user_client.get('/api/trades').data)['trades']) == sorted(ids)
+
+
+class TestScreenshotThumbnails:
+    def test_upload_generates_webp_variants(self, client, monkeypatch, tmp_path):
+        Image = pytest.importorskip('PIL.Image')
+        import time
+        import app as app_module
+
+        monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+        png = io.BytesIO()
+        Image.new('RGB', (2000, 1000), (30, 120, 200)).save(png, 'PNG')
+        response = client.post('/api/upload_screenshot', data={
+            'screenshot': (io.BytesIO(png.getvalue()), 'chart.png')
+        }, content_type='multipart/form-data')
+        result = json.loads(response.data)
+        stem = result['url'].rsplit('/', 1)[1].rsplit('.', 1)[0]
+        assert result['variants'] == {v: f'/screenshots/{stem}.{v}.webp' for v in ('thumb', 'small', 'preview')}
+
+        deadline = time.time() + 10
+        while not all((tmp_path / f'{stem}.{v}.webp').exists() for v in result['variants']) and time.time() < deadline:
+            time.sleep(0.05)
+        with Image.open(tmp_path / f'{stem}.thumb.webp') as thumb:
+            assert thumb.format == 'WEBP' and thumb.size == (160, 80)
+        with Image.open(tmp_path / f'{stem}.preview.webp') as preview:
+            assert preview.size == (1280, 640)
+        assert client.get(result['variants']['small']).mimetype == 'image/webp'
+
+        # Missing variants fall back to the original and are filled in by the backfill
+        (tmp_path / f'{stem}.small.webp').unlink()
+        assert client.get(result['variants']['small']).get_data() == png.getvalue()
+        app_module.backfill_thumbnails(wait=True)
+        deadline = time.time() + 10
+        while not (tmp_path / f'{stem}.small.webp').exists() and time.time() < deadline:
+            time.sleep(0.05)
+        assert (tmp_path / f'{stem}.small.webp').exists()
+
+class TestScreenshotStorage:
+    def _upload(self, client, data, name='chart.png'):
+        return json.loads(client.post('/api/upload_screenshot', data={
+            'screenshot': (io.BytesIO(data), name)
+        }, content_type='multipart/form-data').data)
+
+    def test_dedupe_refcount_and_gc(self, user_client, monkeypatch, tmp_path):
+        import hashlib
+        import app as app_module
+
+        monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+        monkeypatch.setattr(app_module, 'queue_thumbnails', lambda filename: None)
+        data = b'\x89PNG fake chart ' + uuid.uuid4().bytes
+        first = self._upload(user_client, data)
+        second = self._upload(user_client, data, name='copy.png')
+        digest = hashlib.sha256(data).hexdigest()
+        assert first['url'] == second['url'] == f'/screenshots/{digest}.png'
+        assert (first['deduplicated'], second['deduplicated']) == (False, True)
+        assert sorted(os.listdir(tmp_path)) == [f'{digest}.png']
+
+        def ref_count():
+            conn = app_module.get_db_connection()
+            row = conn.execute('SELECT ref_count FROM screenshot_blobs WHERE digest = ?', (digest,)).fetchone()
+            conn.close()
+            return row and row[0]
+
+        trade_id = create_closed_trade(user_client, 10, '2025-10-01 09:00:00')
+        other_id = create_closed_trade(user_client, 10, '2025-10-02 09:00:00')
+        for tid in (trade_id, other_id):
+            user_client.post(f'/api/trades/{tid}/details', data=json.dumps({'screenshots': [first['url']]}),
+                             content_type='application/json')
+        assert ref_count() == 2
+        user_client.post(f'/api/trades/{other_id}/details', data=json.dumps({'screenshots': []}),
+                         content_type='application/json')
+        assert ref_count() == 1
+
+        # Referenced files and unreferenced ones inside the grace period survive
+        (tmp_path / 'legacy_orphan.png').write_bytes(b'orphan')
+        (tmp_path / f'{digest}.thumb.webp').write_bytes(b'variant')
+        conn = app_module.get_db_connection()
+        assert app_module.collect_screenshot_garbage(conn, grace_hours=0)['files'] == ['legacy_orphan.png']
+        assert app_module.collect_screenshot_garbage(conn, grace_hours=1)['files'] == []
+
+        user_client.post(f'/api/trades/{trade_id}/details', data=json.dumps({'screenshots': []}),
+                         content_type='application/json')
+        result = app_module.collect_screenshot_garbage(conn, grace_hours=0)
+        conn.close()
+        assert result['files'] == [f'{digest}.png', f'{digest}.thumb.webp']
+        assert os.listdir(tmp_path) == [] and ref_count() is None
+
+    def test_reupload_restarts_grace_period(self, user_client, monkeypatch, tmp_path):
+        import app as app_module
+
+        monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+        monkeypatch.setattr(app_module, 'queue_thumbnails', lambda filename: None)
+        data = b'\x89PNG stale chart ' + uuid.uuid4().bytes
+        name = self._upload(user_client, data)['url'].rsplit('/', 1)[1]
+        # Unreferenced for two days, so due for collection
+        conn = app_module.get_db_connection()
+        conn.execute("UPDATE screenshot_blobs SET unreferenced_at = datetime('now', '-2 days') WHERE filename = ?", (name,))
+        conn.commit()
+        stale = time.time() - 2 * 86400
+        os.utime(tmp_path / name, (stale, stale))
+
+        assert self._upload(user_client, data)['deduplicated']
+        assert app_module.collect_screenshot_garbage(conn, grace_hours=24)['files'] == []
+        conn.close()
+        assert os.listdir(tmp_path) == [name]
+
+    def test_http_caching_and_ranges(self, user_client, monkeypatch, tmp_path):
+        import app as app_module
+
+        monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+        monkeypatch.setattr(app_module, 'queue_thumbnails', lambda filename: None)
+        url = self._upload(user_client, b'0123456789' * 10)['url']
+        filename = url.rsplit('/', 1)[1]
+
+        response = user_client.get(url)
+        assert response.status_code == 200
+        assert response.headers['ETag'] == f'"{filename}"'
+        cache_control = response.headers['Cache-Control']
+        assert 'immutable' in cache_control and 'max-age=31536000' in cache_control
+        assert 'no-cache' not in cache_control
+        assert user_client.get(url, headers={'If-None-Match': f'"{filename}"'}).status_code == 304
+        partial = user_client.get(url, headers={'Range': 'bytes=10-19'})
+        assert partial.status_code == 206 and partial.data == b'0123456789'
+
+        # Missing variants fall back to the original without being cached as the variant
+        fallback = user_client.get(url.replace('.png', '.thumb.webp'))
+        assert fallback.status_code == 200 and 'no-cache' in fallback.headers['Cache-Control']
+
+        monkeypatch.setattr(app_module, 'SCREENSHOT_SENDFILE', 'x-accel-redirect')
+        offloaded = user_client.get(url)
+        assert offloaded.headers['X-Accel-Redirect'] == f'/protected-screenshots/{filename}'
+        assert offloaded.data == b'' and offloaded.headers['ETag'] == f'"{filename}"'
+        assert user_client.get(url, headers={'If-None-Match': f'"{filename}"'}).status_code == 304
+
+class TestTradeChanges:
+    def _changes(self, client, since):
+        return json.loads(client.get(f'/api/trades/changes?since={since}').data)
+
+    def test_inserts_updates_and_tombstones(self, user_client):
+        kept = create_closed_trade(user_client, 10, '2025-12-01 09:00:00')
+        removed = create_closed_trade(user_client, -5, '2025-12-02 09:00:00')
+        cursor = json.loads(user_client.get('/api/trades').data)['change_seq']
+        assert self._changes(user_client, cursor) == {'trades': [], 'deleted': [], 'change_seq': cursor, 'has_more': False}
+
+        # Detail rows count as changes to their trade
+        user_client.post(f'/api/trades/{kept}/details', data=json.dumps({'models': ['Breakout']}),
+                         content_type='application/json')
+        user_client.delete(f'/api/trades/{removed}')
+        new_trade = create_closed_trade(user_client, 3, '2025-12-03 09:00:00')
+        changes = self._changes(user_client, cursor)
+        assert [t['id'] for t in changes['trades']] == [kept, new_trade]
+        assert changes['deleted'] == [removed]
+        assert all(t['updated_at'] for t in changes['trades'])
+        assert changes['change_seq'] > cursor
+
+        # Paging: one change at a time, compacted to each trade's latest write
+        first = json.loads(user_client.get(f'/api/trades/changes?since={cursor}&limit=1').data)
+        assert first['has_more'] and [t['id'] for t in first['trades']] == [kept]
+        assert self._changes(user_client, changes['change_seq'])['trades'] == []
+
+
+class TestTradeTable:
+    def test_sorted_pages_and_dashboard_summary(self, user_client):
+        for pnl, day, asset in [(10, 1, 'BTCUSDT'), (-5, 2, 'ETHUSDT'), (30, 3, 'BTCUSDT'), (2, 4, 'SOLUSDT')]:
+            create_closed_trade(user_client, pnl, f'2025-12-0{day} 09:00:00', asset=asset)
+
+        page = json.loads(user_client.get('/api/trades?status=closed&sort=-pnl&limit=2&offset=1').data)
+        assert page['total'] == 4 and page['offset'] == 1
+        assert [t['pnl'] for t in page['trades']] == [10, 2]
+        assert 'notes' not in page['trades'][0]
+
+        btc = json.loads(user_client.get('/api/trades?status=closed&asset=BTCUSDT&sort=entry_time&limit=10').data)
+        assert btc['total'] == 2 and [t['pnl'] for t in btc['trades']] == [10, 30]
+        assert user_client.get('/api/trades?limit=10&sort=notes').status_code == 400
+
+        trades = json.loads(user_client.get('/api/dashboard?sections=trades&trade_limit=0').data)['trades']
+        assert trades['trades'] == [] and trades['total'] == 4
+        assert trades['assets'] == ['BTCUSDT', 'ETHUSDT', 'SOLUSDT']
+        assert trades['statistics']['total_trades'] == 4
+
+
+class TestEvents:
+    def test_stream_and_bounded_queues(self, user_client, monkeypatch):
+        import app as app_module
+
+        monkeypatch.setattr(app_module, 'EVENT_HEARTBEAT_SECONDS', 0.01)
+        response = user_client.get('/api/events')
+        assert response.mimetype == 'text/event-stream'
+        chunks = response.iter_encoded()
+        assert next(chunks).startswith(b'retry:')
+        assert next(chunks).startswith(b'event: ready')
+        assert next(chunks) == b': keepalive\n\n'
+
+        trade_id = create_closed_trade(user_client, 10, '2025-12-10 09:00:00')
+        event = next(chunks).decode()
+        assert event.startswith('event: data_version\n')
+        assert json.loads(event.split('data: ', 1)[1])['trade_ids'] == [trade_id]
+
+        def next_event():
+            # Bounded, so a write that never publishes fails instead of waiting on keepalives
+            return next(chunk for _, chunk in zip(range(200), chunks) if chunk != b': keepalive\n\n').decode()
+
+        # Every trade write publishes, including the single-field endpoints and open trades
+        user_client.post(f'/api/trades/{trade_id}/entry_type', json={'entry_type': 'limit'})
+        assert json.loads(next_event().split('data: ', 1)[1])['trade_ids'] == [trade_id]
+        user_client.post(f'/api/trades/{trade_id}/screenshots/url', json={'url': 'https://example.com/a.png'})
+        assert json.loads(next_event().split('data: ', 1)[1])['trade_ids'] == [trade_id]
+        open_id = json.loads(user_client.post('/api/trades', json={
+            'asset': 'BTCUSDT', 'side': 'long', 'entry_price': 100, 'quantity': 1,
+            'entry_time': '2025-12-10 10:00:00', 'status': 'open'}).data)['id']
+        assert json.loads(next_event().split('data: ', 1)[1])['trade_ids'] == [open_id]
+        response.close()
+        assert not app_module.event_bus._subscribers
+
+        # Streams pin worker threads, so the count is capped
+        monkeypatch.setattr(app_module, 'EVENT_MAX_STREAMS', 1)
+        first = user_client.get('/api/events')
+        refused = user_client.get('/api/events')
+        assert refused.status_code == 503 and refused.headers['Retry-After'] == '30'
+        first.close()
+        again = user_client.get('/api/events')
+        assert again.status_code == 200
+        again.close()
+        assert not app_module.event_bus._subscribers
+
+        # A client that falls behind loses its backlog and is told to resync
+        bus = app_module.EventBus(queue_size=2)
+        subscription = bus.subscribe(7)
+        for i in range(3):
+            bus.publish(7, 'data_version', {'change_seq': i})
+        bus.publish(8, 'data_version', {'change_seq': 99})
+        assert subscription.get_nowait() == ('resync', {'reason': 'overflow'})
+        assert subscription.empty()
+
+
+class TestJSONResponses:
+    def test_columnar_and_compressed_trade_list(self, user_client):
+        import gzip
+
+        for i in range(20):
+            create_closed_trade(user_client, i - 5, f'2025-11-{i + 1:02d} 09:00:00')
+        plain = json.loads(user_client.get('/api/trades').data)
+        response = user_client.get('/api/trades?columnar=1', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        data = json.loads(gzip.decompress(response.data))
+
+        table = data['trades']
+        assert table['length'] == len(plain['trades']) == 20
+        rows = [{field: values[i] for field, values in table['columns'].items()} for i in range(table['length'])]
+        assert rows == plain['trades']
+        assert data['statistics'] == plain['statistics']
+
+        # Small bodies are sent as is
+        small = user_client.get('/api/health', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in small.headers
+
+
+class TestStaticAssets:
+    def test_hashed_precompressed_bundles(self, client, monkeypatch, tmp_path):
+        import gzip
+        import app as app_module
+
+        # The pinned libraries ship with the repository
+        assert app_module.missing_vendor_assets() == []
+
+        source = tmp_path / 'static'
+        (source / 'js').mkdir(parents=True)
+        script = b'console.log("journal");\n' * 50
+        (source / 'js' / 'app.js').write_bytes(script)
+        monkeypatch.setattr(app_module, 'ASSET_SOURCE_FOLDER', str(source))
+        monkeypatch.setattr(app_module, 'ASSET_BUILD_FOLDER', str(source / 'dist'))
+        monkeypatch.setattr(app_module, '_asset_manifest', None)
+
+        with app.test_request_context():
+            url = app_module.asset_url('js/app.js')
+            assert url.startswith('/assets/js/app.') and url.endswith('.js')
+            # Vendor libraries are never loaded from the CDN: a missing file is an error
+            vendor = 'vendor/chart.js/chart.umd.js'
+            assert vendor in app_module.missing_vendor_assets()
+            with pytest.raises(RuntimeError, match='vendor-assets'):
+                app_module.asset_url(vendor)
+            (source / 'vendor' / 'chart.js').mkdir(parents=True)
+            (source / 'vendor' / 'chart.js' / 'chart.umd.js').write_bytes(b'/* chart */')
+            assert app_module.asset_url(vendor).startswith('/assets/vendor/chart.js/chart.umd.')
+
+        # The page explains what is missing instead of failing with a bare 500
+        page = client.get('/')
+        assert page.status_code == 500 and b'vendor/fullcalendar' in page.data
+
+        response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.data) == script
+        assert 'immutable' in response.headers['Cache-Control']
+        assert 'Accept-Encoding' in response.headers['Vary']
+        plain = client.get(url, headers={'Accept-Encoding': 'identity'})
+        assert 'Content-Encoding' not in plain.headers and plain.data == script
+
+        # A changed source gets a new name and the old build is pruned
+        (source / 'js' / 'app.js').write_bytes(script + b'// v2\n')
+        assert app_module.build_assets()['js/app.js'] != url[len('/assets/'):]
+        assert client.get(url).status_code == 404
+
+
+
+class TestAppFactory:
+    def test_import_is_lazy_and_memory_database(self, tmp_path):
+        script = """
+import os, sys
+import app
+assert os.listdir('.') == []
+assert 'pybit' not in sys.modules and 'pandas' not in sys.modules
+
+client = app.create_app({'DATABASE_PATH': ':memory:'}).test_client()
+client.post('/api/trades', json={'asset': 'BTCUSDT', 'side': 'long', 'entry_price': 100, 'quantity': 1,
+                                 'entry_time': '2025-12-01 09:00:00'})
+assert len(client.get('/api/trades').get_json()['trades']) == 1
+assert os.listdir('.') == []
+"""
+        env = {key: value for key, value in os.environ.items() if key != 'DATABASE_PATH'}
+        env['PYTHONPATH'] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, '-c', script], cwd=tmp_path, env=env,
+                                capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+
 if __name__ == '__main__':
     pytest.main([__file__])